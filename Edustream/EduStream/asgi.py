@@ -0,0 +1,12 @@
+# EduStream/asgi.py
+"""
+ASGI entry point, e.g. `uvicorn EduStream.asgi:application`. The PayPal checkout and login
+views are async, so a process waiting on PayPal keeps serving other requests; the remaining
+sync views run in Django's thread pool. The server's event loops live as long as the worker,
+so PayPal calls use httpx connection pools here (PAYPAL_ASYNC_HTTP; needs `pip install httpx`).
+"""
+import os
+from django.core.asgi import get_asgi_application
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'EduStream.settings')
+os.environ.setdefault('EDUSTREAM_PAYPAL_ASYNC_HTTP', 'httpx')
+application = get_asgi_application()
@@ -17,11 +17,14 @@ INSTALLED_APPS = [
     'student',
 ]
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
+    'core.db_router.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.profiling.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -42,12 +45,53 @@ TEMPLATES = [
     },
 ]
 WSGI_APPLICATION = 'EduStream.wsgi.application'
+ASGI_APPLICATION = 'EduStream.asgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    # Stand-in read replica for trying core.db_router locally: copy db.sqlite3 here (or run
+    # `migrate --database replica`) and add 'replica' to DATABASE_REPLICAS.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+    },
+}
+# SQLite tuned for concurrent traffic. WAL lets reads run alongside the single writer, IMMEDIATE
+# takes the write lock when a transaction starts (no failing read-to-write lock upgrades), the
+# timeout makes writers queue instead of raising "database is locked", and persistent
+# connections run these pragmas once. EDUSTREAM_SQLITE_PROFILE=development uses Django's defaults.
+SQLITE_PROFILE = os.environ.get('EDUSTREAM_SQLITE_PROFILE', 'production')
+SQLITE_PRODUCTION_OPTIONS = {
+    'init_command': (
+        'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA mmap_size=268435456; '
+        'PRAGMA cache_size=-64000; PRAGMA temp_store=MEMORY'
+    ),
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': 20,  # busy timeout, seconds
 }
+if SQLITE_PROFILE == 'production':
+    for database in DATABASES.values():
+        database.update(OPTIONS=SQLITE_PRODUCTION_OPTIONS, CONN_MAX_AGE=600, CONN_HEALTH_CHECKS=True)
+# Queue this process' hot SQLite writers (Enrollment creation, OTP updates) on a lock; see core/db_writes.py
+SQLITE_SERIALIZE_WRITES = True
+# Course/enrollment caches, OTP delivery status and OTP rate limits must agree across worker
+# processes, so production sets EDUSTREAM_REDIS_URL (needs the `redis` package); `check --deploy`
+# reports core.E001 otherwise. Without it the cache is LocMemCache, which is per process and
+# only suitable for a single development server.
+if os.environ.get('EDUSTREAM_REDIS_URL'):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': os.environ['EDUSTREAM_REDIS_URL'],
+    }}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+# Aliases that serve reads of REPLICA_ROUTED_MODELS; empty sends everything to 'default'
+DATABASE_REPLICAS = []
+REPLICA_ROUTED_MODELS = ('core.course', 'core.coursecontent', 'core.category', 'core.enrollment')
+# Seconds a browser's reads stay on the primary after it writes one of those models
+REPLICA_PIN_SECONDS = 10
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -75,9 +119,39 @@ STATICFILES_DIRS = [
 # Media files (user uploads)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Course file downloads: block size for streamed responses, and optional hand-off to the
+# front-end server ('nginx' -> X-Accel-Redirect to PROTECTED_MEDIA_INTERNAL_URL, 'apache' -> X-Sendfile)
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+PROTECTED_MEDIA_SERVER = None
+PROTECTED_MEDIA_INTERNAL_URL = '/protected-media/'
+# Resumable course file uploads (teacher/uploads.py); partial files live in CHUNKED_UPLOAD_TEMP_DIR
+CHUNKED_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+CHUNKED_UPLOAD_MAX_SIZE = 2 * 1024 * 1024 * 1024
+CHUNKED_UPLOAD_TEMP_DIR = MEDIA_ROOT / 'chunked_uploads'
+CHUNKED_UPLOAD_EXPIRY_HOURS = 24
 # PayPal API Credentials 
 PAYPAL_CLIENT_ID = 'AbFe40b8zCcB6alET5Zfj5vTg-5RQLTaAZYPFOLI-2u837_nXZemOKoWoQ_DuCwHH4JA6JR9-8JEqPCh'
 PAYPAL_SECRET = 'EGbiuZvR2LkOcQw3gQp_wav1nkABCD2jUAeJZnu8ETAUvDsUFFSPYXAnGQZr40XQd8oktObLpTufWuJk'
+# Point at `python manage.py paypal_stub` (e.g. 'http://127.0.0.1:8765') to run checkouts offline
+PAYPAL_API_BASE = 'https://api-m.sandbox.paypal.com'
+PAYPAL_TIMEOUT = (3.05, 10)  # (connect, read) seconds
+PAYPAL_POOL_SIZE = 10
+PAYPAL_BREAKER_FAILURE_THRESHOLD = 5
+PAYPAL_BREAKER_RESET_SECONDS = 30
+# How the async views reach PayPal: 'httpx' (one pool per event loop; EduStream/asgi.py selects
+# it) or 'sync' (the pooled requests session in a worker thread, for WSGI, where each async view
+# runs on a new event loop)
+PAYPAL_ASYNC_HTTP = os.environ.get('EDUSTREAM_PAYPAL_ASYNC_HTTP', 'sync')
+# Connections per event loop that the httpx transport keeps open to PayPal
+PAYPAL_ASYNC_POOL_SIZE = 100
+# PayPal webhook queue (python manage.py process_paypal_webhooks). PAYPAL_WEBHOOK_ID is the id of
+# the webhook in the PayPal developer dashboard, used to verify each event's signature.
+PAYPAL_WEBHOOK_ID = ''
+PAYPAL_WEBHOOK_VERIFY = True
+PAYPAL_WEBHOOK_BATCH_SIZE = 200
+PAYPAL_WEBHOOK_MAX_ATTEMPTS = 5
+PAYPAL_WEBHOOK_BACKOFF_SECONDS = 30
+PAYPAL_WEBHOOK_LEASE_SECONDS = 300
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'core.User'
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -88,3 +162,56 @@ EMAIL_HOST_USER = 'your_email@example.com'
 EMAIL_HOST_PASSWORD = 'your_email_app_password' 
 DEFAULT_FROM_EMAIL = 'your_email@example.com' 
 EMAIL_TIMEOUT = 5
+# Login OTP storage: 'core.otp_store.CacheOTPStore' or 'core.otp_store.DatabaseOTPStore'.
+# Both keep their attempt and issue counters in the shared cache (see CACHES).
+OTP_STORE = 'core.otp_store.CacheOTPStore'
+OTP_TTL_SECONDS = 300
+OTP_MAX_ATTEMPTS = 5
+OTP_ISSUE_RATE_LIMIT = (5, 900)  # OTPs per user per window (seconds)
+# Login OTP emails are sent by a background thread pool; when OTP_EMAIL_QUEUE_SIZE emails are
+# waiting, further ones are dropped and the user is asked to log in again. False sends inline (tests).
+OTP_EMAIL_ASYNC = True
+OTP_EMAIL_WORKERS = 4
+OTP_EMAIL_QUEUE_SIZE = 50
+
+# Keyset pagination page sizes
+CATALOG_PAGE_SIZE = 24
+TEACHER_DASHBOARD_PAGE_SIZE = 20
+ROSTER_PAGE_SIZE = 50
+# Rows fetched per database round trip when streaming roster exports
+ROSTER_EXPORT_CHUNK_SIZE = 2000
+# Seconds cached course objects, content lists and template fragments live (entries are versioned,
+# so this only bounds memory)
+COURSE_CACHE_TIMEOUT = 3600
+# Seconds a student's enrolled-course ID set stays cached (invalidated on Enrollment changes)
+ENROLLMENT_CACHE_TIMEOUT = 3600
+# Email outbox worker (python manage.py send_outbox)
+EMAIL_OUTBOX_BATCH_SIZE = 100
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_BACKOFF_SECONDS = 30
+EMAIL_OUTBOX_LEASE_SECONDS = 300
+# Runtime metrics (core.metrics) served in Prometheus text format at /metrics
+METRICS_ENABLED = True
+# Scrapers authenticate with "Authorization: Bearer <token>"; empty leaves /metrics to staff only
+METRICS_TOKEN = os.environ.get('EDUSTREAM_METRICS_TOKEN', '')
+# Fraction of INFO-level event logs (core.metrics.log_event) that are emitted
+LOG_SAMPLE_RATE = 0.1
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'event': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'event'},
+    },
+    'loggers': {
+        'edustream': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+# Staff-only request profiler (core.profiling): add ?_profile=1 or send X-Profile: 1
+PROFILER_DIR = BASE_DIR / 'profiles'
+PROFILER_TOP_FUNCTIONS = 40
+# Daily analytics rollups (python manage.py refresh_analytics): enrollments younger than this
+# are left for the next pass so late-committing transactions are not skipped
+ANALYTICS_ROLLUP_LAG_SECONDS = 60
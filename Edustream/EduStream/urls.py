@@ -4,13 +4,17 @@ from django.urls import path, include
 from django.views.generic import TemplateView
 from django.conf import settings
 from django.conf.urls.static import static
+from core.views import metrics_view, profile_download
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', TemplateView.as_view(template_name='home.html'), name='home'),
     path('accounts/', include('core.urls')),
     path('teacher/', include('teacher.urls')),
     path('student/', include('student.urls')), 
+    path('metrics', metrics_view, name='metrics'),
+    path('profiles/<str:name>', profile_download, name='profile_download'),
 ]
+# Course files under MEDIA_ROOT are deliberately not served here: they go through the
+# enrollment-checked student.views.download_content_file view.
 if settings.DEBUG:
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
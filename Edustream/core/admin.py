@@ -1,7 +1,10 @@
 # core/admin.py
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Category, Course, CourseContent, Enrollment
+from .models import (
+    User, Category, Course, CourseContent, Enrollment, OutboundEmail, ChunkedUpload, CourseDailyStats, TeacherDailyStats,
+    AnalyticsWatermark, PayPalWebhookEvent,
+)
 class CustomUserAdmin(UserAdmin):
     fieldsets = UserAdmin.fieldsets + (
         (None, {'fields': ('user_type', 'email_otp', 'otp_created_at',)}),
@@ -10,6 +13,34 @@ class CustomUserAdmin(UserAdmin):
     list_filter = ('user_type', 'is_staff', 'is_superuser')
 admin.site.register(User, CustomUserAdmin)
 admin.site.register(Category)
-admin.site.register(Course)
+class CourseAdmin(admin.ModelAdmin):
+    list_display = ('title', 'teacher', 'price', 'enrollment_count', 'completed_count', 'gross_revenue')
+    readonly_fields = ('enrollment_count', 'completed_count', 'gross_revenue')
+admin.site.register(Course, CourseAdmin)
 admin.site.register(CourseContent)
-admin.site.register(Enrollment)
\ No newline at end of file
+admin.site.register(Enrollment)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('to_email', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to_email', 'subject')
+admin.site.register(OutboundEmail, OutboundEmailAdmin)
+class ChunkedUploadAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'teacher', 'offset', 'total_size', 'status', 'updated_at')
+    list_filter = ('status',)
+admin.site.register(ChunkedUpload, ChunkedUploadAdmin)
+class CourseDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ('date', 'course', 'teacher', 'enrollments', 'revenue')
+    list_select_related = ('course', 'teacher')
+    date_hierarchy = 'date'
+admin.site.register(CourseDailyStats, CourseDailyStatsAdmin)
+class TeacherDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ('date', 'teacher', 'enrollments', 'revenue')
+    list_select_related = ('teacher',)
+    date_hierarchy = 'date'
+admin.site.register(TeacherDailyStats, TeacherDailyStatsAdmin)
+admin.site.register(AnalyticsWatermark)
+class PayPalWebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'event_type', 'status', 'attempts', 'received_at', 'processed_at')
+    list_filter = ('status', 'event_type')
+    search_fields = ('event_id',)
+admin.site.register(PayPalWebhookEvent, PayPalWebhookEventAdmin)
@@ -0,0 +1,89 @@
+# core/analytics.py
+"""
+Daily enrollment/revenue rollups per course and per teacher. refresh() folds enrollments
+newer than the AnalyticsWatermark into CourseDailyStats and TeacherDailyStats, one id range
+per transaction, so each run only touches new rows. Enrollments younger than
+ANALYTICS_ROLLUP_LAG_SECONDS are left for the next run so that a transaction committing an
+older id late is not skipped. Rollups count enrollment events; deleted enrollments are only
+removed from them by rebuild().
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import AnalyticsWatermark, CourseDailyStats, Enrollment, TeacherDailyStats
+WATERMARK = 'daily_rollups'
+def _merge(model, key_fields, totals, extra=None):
+    """Adds {key: [enrollments, revenue]} onto existing rollup rows and creates the missing ones."""
+    first, second = key_fields
+    existing = model.objects.filter(
+        **{f'{first}__in': {key[0] for key in totals}, f'{second}__in': {key[1] for key in totals}}
+    )
+    updated = []
+    for row in existing:
+        key = (getattr(row, first), getattr(row, second))
+        if key in totals:
+            enrollments, revenue = totals.pop(key)
+            row.enrollments += enrollments
+            row.revenue += revenue
+            updated.append(row)
+    model.objects.bulk_update(updated, ['enrollments', 'revenue'])
+    model.objects.bulk_create([
+        model(**{first: key[0], second: key[1]}, **(extra(key) if extra else {}), enrollments=enrollments, revenue=revenue)
+        for key, (enrollments, revenue) in totals.items()
+    ])
+def _fold(after_id, upto_id):
+    groups = (
+        Enrollment.objects.filter(id__gt=after_id, id__lte=upto_id)
+        .annotate(day=TruncDate('enrollment_date'))
+        .values('course_id', 'course__teacher_id', 'day')
+        .annotate(enrollments=Count('id'), revenue=Sum('amount_paid'))
+        .order_by()
+    )
+    per_course = defaultdict(lambda: [0, Decimal('0')])
+    per_teacher = defaultdict(lambda: [0, Decimal('0')])
+    course_teacher = {}
+    for group in groups:
+        revenue = group['revenue'] or Decimal('0')
+        for totals, key in (
+            (per_course, (group['course_id'], group['day'])),
+            (per_teacher, (group['course__teacher_id'], group['day'])),
+        ):
+            totals[key][0] += group['enrollments']
+            totals[key][1] += revenue
+        course_teacher[group['course_id']] = group['course__teacher_id']
+    _merge(CourseDailyStats, ('course_id', 'date'), per_course, lambda key: {'teacher_id': course_teacher[key[0]]})
+    _merge(TeacherDailyStats, ('teacher_id', 'date'), per_teacher)
+def refresh(batch_size=10000):
+    """Processes new enrollments in id batches and returns how many were folded in."""
+    lag = datetime.timedelta(seconds=getattr(settings, 'ANALYTICS_ROLLUP_LAG_SECONDS', 60))
+    processed = 0
+    while True:
+        with transaction.atomic():
+            watermark, _ = AnalyticsWatermark.objects.select_for_update().get_or_create(name=WATERMARK)
+            after_id = watermark.last_enrollment_id
+            pending = Enrollment.objects.filter(id__gt=after_id)
+            # Stop short of the first enrollment still inside the lag window.
+            too_recent = pending.filter(enrollment_date__gte=timezone.now() - lag).aggregate(first=Min('id'))['first']
+            if too_recent is not None:
+                pending = pending.filter(id__lt=too_recent)
+            ids = list(pending.order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return processed
+            _fold(after_id, ids[-1])
+            watermark.last_enrollment_id = ids[-1]
+            watermark.save(update_fields=['last_enrollment_id', 'updated_at'])
+        processed += len(ids)
+def rebuild(batch_size=10000):
+    """Discards every rollup and recomputes them from the full Enrollment table."""
+    with transaction.atomic():
+        CourseDailyStats.objects.all().delete()
+        TeacherDailyStats.objects.all().delete()
+        AnalyticsWatermark.objects.update_or_create(name=WATERMARK, defaults={'last_enrollment_id': 0})
+    return refresh(batch_size)
+def last_refreshed():
+    return AnalyticsWatermark.objects.filter(name=WATERMARK).values_list('updated_at', flat=True).first()
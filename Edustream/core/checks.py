@@ -0,0 +1,21 @@
+# core/checks.py
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+# Caches whose entries are not shared by every worker process, or not incremented atomically.
+UNSHARED_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.db.DatabaseCache',
+    'django.core.cache.backends.filebased.FileBasedCache',
+)
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """`check --deploy`: OTPs, their limits and cache invalidation need one cache for all workers."""
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in UNSHARED_CACHE_BACKENDS:
+        return []
+    return [Error(
+        f"The default cache ({backend}) is not a shared cache with atomic counters.",
+        hint="Set EDUSTREAM_REDIS_URL so every worker process uses the same Redis cache.",
+        id='core.E001',
+    )]
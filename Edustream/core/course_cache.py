@@ -0,0 +1,85 @@
+# core/course_cache.py
+"""
+Versioned caching for course pages. Every course has a version token in the cache that the
+signal handlers in core/signals.py replace whenever the course, its contents, its category or
+its teacher's username change. Cached objects and template fragments ({% cache %} blocks
+varying on `course.cache_version`) are keyed by that token, so they never need to be deleted:
+a new version simply stops referring to the old entries, which then age out.
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.http import Http404
+from .models import Course
+def timeout():
+    return getattr(settings, 'COURSE_CACHE_TIMEOUT', 3600)
+def _version_key(course_id):
+    return f"course_version:{course_id}"
+def _new_token():
+    return str(time.time_ns())
+def get_version(course_id):
+    key = _version_key(course_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_token(), None)
+        version = cache.get(key)
+    return version
+def get_versions(course_ids):
+    """Returns {course_id: version} for many courses with one cache round trip."""
+    keys = {_version_key(pk): pk for pk in course_ids}
+    found = cache.get_many(keys)
+    versions = {keys[key]: value for key, value in found.items()}
+    missing = {key: _new_token() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update({keys[key]: value for key, value in missing.items()})
+    return versions
+def _set_new_versions(course_ids):
+    token = _new_token()
+    cache.set_many({_version_key(pk): token for pk in course_ids}, None)
+def bump(course_ids):
+    """
+    Invalidates every cached object and fragment for the given courses. The version is
+    replaced again on commit so a reader cannot cache pre-commit rows under the new token.
+    """
+    course_ids = list(course_ids)
+    if not course_ids:
+        return
+    _set_new_versions(course_ids)
+    transaction.on_commit(lambda: _set_new_versions(course_ids))
+def annotate_versions(courses):
+    """Sets `cache_version` on each course so templates can vary {% cache %} blocks on it."""
+    courses = list(courses)
+    versions = get_versions([course.pk for course in courses])
+    for course in courses:
+        course.cache_version = versions[course.pk]
+    return courses
+# What the course pages and the catalog API read. The teacher is a User, so anything beyond
+# their name (password hash, email, OTP columns) stays out of the cache.
+COURSE_FIELDS = (
+    'title', 'description', 'price', 'created_at', 'updated_at', 'teacher', 'category',
+    'teacher__username', 'teacher__first_name', 'teacher__last_name', 'category__name',
+)
+def get_course(course_id):
+    """Returns the course with COURSE_FIELDS loaded, from cache when possible."""
+    version = get_version(course_id)
+    key = f"course:{course_id}:{version}"
+    course = cache.get(key)
+    if course is None:
+        # Cache fills read the primary so a lagging replica (core/db_router.py) is never cached.
+        course = (Course.objects.using(DEFAULT_DB_ALIAS).select_related('teacher', 'category')
+                  .only(*COURSE_FIELDS).filter(pk=course_id).first())
+        if course is None:
+            raise Http404("No Course matches the given query.")
+        cache.set(key, course, timeout())
+    course.cache_version = version
+    return course
+def get_contents(course):
+    """Returns the course's contents as a list in display order, from cache when possible."""
+    key = f"course_contents:{course.pk}:{course.cache_version}"
+    contents = cache.get(key)
+    if contents is None:
+        contents = list(course.contents.using(DEFAULT_DB_ALIAS))
+        cache.set(key, contents, timeout())
+    return contents
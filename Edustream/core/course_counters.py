@@ -0,0 +1,51 @@
+# core/course_counters.py
+"""
+Denormalized per-course enrollment counters: Course.enrollment_count, completed_count and
+gross_revenue. The Enrollment signals in core/signals.py keep them current with single-row
+F() updates. Writes that bypass signals (bulk_create, queryset.update/delete) must call
+reconcile() for the affected courses afterwards, as must anything that finds drift.
+"""
+from decimal import Decimal
+from django.db.models import Count, DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from .models import Course, Enrollment
+def apply(course_id, enrollments=0, completed=0, revenue=Decimal('0')):
+    """Adds the given deltas to one course's counters in a single UPDATE."""
+    changes = {}
+    # Counts are clamped at zero so a drifted counter cannot fail the delete that decrements it.
+    if enrollments:
+        changes['enrollment_count'] = Greatest(F('enrollment_count') + enrollments, 0)
+    if completed:
+        changes['completed_count'] = Greatest(F('completed_count') + completed, 0)
+    if revenue:
+        changes['gross_revenue'] = F('gross_revenue') + revenue
+    if changes:
+        Course.objects.filter(pk=course_id).update(**changes)
+_MONEY = DecimalField(max_digits=14, decimal_places=2)
+def _actual(aggregate, output_field):
+    totals = Enrollment.objects.filter(course=OuterRef('pk')).order_by().values('course').annotate(total=aggregate)
+    return Coalesce(Subquery(totals.values('total'), output_field=output_field), Value(0), output_field=output_field)
+def _actual_counters():
+    return {
+        'enrollment_count': _actual(Count('pk'), IntegerField()),
+        'completed_count': _actual(Count('pk', filter=Q(completed=True)), IntegerField()),
+        'gross_revenue': _actual(Sum('amount_paid'), _MONEY),
+    }
+def reconcile(course_ids=None, batch_size=1000):
+    """
+    Recomputes counters from the Enrollment table and rewrites only the courses that drifted.
+    Each rewrite is one UPDATE computing the totals itself, so it cannot lose a concurrent
+    increment. Returns the number of courses repaired.
+    """
+    courses = Course.objects.all() if course_ids is None else Course.objects.filter(pk__in=course_ids)
+    actual = {f'actual_{name}': expression for name, expression in _actual_counters().items()}
+    drifted = list(
+        courses.annotate(**actual).filter(
+            ~Q(enrollment_count=F('actual_enrollment_count'))
+            | ~Q(completed_count=F('actual_completed_count'))
+            | ~Q(gross_revenue=F('actual_gross_revenue'))
+        ).values_list('pk', flat=True)
+    )
+    for start in range(0, len(drifted), batch_size):
+        Course.objects.filter(pk__in=drifted[start:start + batch_size]).update(**_actual_counters())
+    return len(drifted)
@@ -0,0 +1,103 @@
+# core/db_router.py
+"""
+Read-replica routing. Reads of the models in REPLICA_ROUTED_MODELS go to a random alias from
+DATABASE_REPLICAS; every write, and every read of any other model, goes to the primary
+('default'). With no replicas configured the router stays out of the way.
+
+Replicas lag, so reads fall back to the primary when
+- the request carries the pin cookie, which ReplicaPinningMiddleware sets for
+  REPLICA_PIN_SECONDS after a request wrote a routed model (a student sees their new
+  enrollment straight away),
+- the current request or thread has already written a routed model,
+- the primary is inside transaction.atomic(), or
+- the code runs under use_primary().
+Caches that are filled from a query (core.course_cache, core.enrollment_cache) read the
+primary, so a lagging replica can never be frozen into them.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+from types import SimpleNamespace
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+PIN_COOKIE = 'primary_pin'
+DEFAULT_ROUTED_MODELS = ('core.course', 'core.coursecontent', 'core.category', 'core.enrollment')
+_state = contextvars.ContextVar('replica_routing', default=None)
+def _current():
+    state = _state.get()
+    if state is None:
+        # Outside a request (management commands, workers) the state lives as long as the thread.
+        state = SimpleNamespace(pinned=False, wrote=False)
+        _state.set(state)
+    return state
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+def _routed(model):
+    return model._meta.label_lower in getattr(settings, 'REPLICA_ROUTED_MODELS', DEFAULT_ROUTED_MODELS)
+@contextmanager
+def routing_scope(pinned=False):
+    """Gives the block its own routing state; ReplicaPinningMiddleware opens one per request."""
+    state = SimpleNamespace(pinned=pinned, wrote=False)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+@contextmanager
+def use_primary():
+    """Sends every read in the block to the primary."""
+    state = _current()
+    previous, state.pinned = state.pinned, True
+    try:
+        yield
+    finally:
+        state.pinned = previous
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if not aliases:
+            return None
+        if not _routed(model):
+            return DEFAULT_DB_ALIAS
+        state = _current()
+        if state.pinned or state.wrote or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(aliases)
+    def db_for_write(self, model, **hints):
+        if not replicas():
+            return None
+        if _routed(model):
+            _current().wrote = True
+        # Explicit, because Django would otherwise write an instance back to the replica it was read from.
+        return DEFAULT_DB_ALIAS
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+class ReplicaPinningMiddleware:
+    """Pins a browser's reads to the primary for REPLICA_PIN_SECONDS after it writes a routed model."""
+    sync_capable = True
+    async_capable = True
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with routing_scope(pinned=PIN_COOKIE in request.COOKIES) as state:
+            response = self.get_response(request)
+        return self._pin(state, response)
+    async def __acall__(self, request):
+        # sync_to_async() copies the context, so ORM calls in worker threads share this state.
+        with routing_scope(pinned=PIN_COOKIE in request.COOKIES) as state:
+            response = await self.get_response(request)
+        return self._pin(state, response)
+    def _pin(self, state, response):
+        if state.wrote:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 10), httponly=True, samesite='Lax',
+            )
+        return response
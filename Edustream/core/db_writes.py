@@ -0,0 +1,32 @@
+# core/db_writes.py
+"""
+Write serialization for SQLite, which allows one writer at a time. serialized() takes a
+per-database lock before opening the write transaction, so the hot writers in one process
+(Enrollment creation, OTP updates) queue on a mutex in arrival order instead of polling
+SQLite's busy handler against each other; writers in other processes still wait on the busy
+timeout. On other databases, inside an existing atomic block, or with SQLITE_SERIALIZE_WRITES
+off it is plain transaction.atomic().
+"""
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+_locks = {}
+_locks_guard = threading.Lock()
+def _lock(alias):
+    with _locks_guard:
+        return _locks.setdefault(alias, threading.Lock())
+@contextmanager
+def serialized(using=None):
+    """Runs the block in transaction.atomic(using), behind this process' write lock on SQLite."""
+    using = using or DEFAULT_DB_ALIAS
+    connection = connections[using]
+    # Inside an atomic block the transaction may already hold SQLite's write lock; waiting on
+    # the mutex there could deadlock against a thread that holds the mutex.
+    if (connection.vendor != 'sqlite' or connection.in_atomic_block
+            or not getattr(settings, 'SQLITE_SERIALIZE_WRITES', True)):
+        with transaction.atomic(using=using):
+            yield
+        return
+    with _lock(using), transaction.atomic(using=using):
+        yield
@@ -0,0 +1,38 @@
+# core/enrollment_cache.py
+"""
+Per-student cache of enrolled course IDs, shared by the catalog, detail and access views.
+Entries are dropped by the Enrollment signal handlers in core/signals.py; code that writes
+enrollments without signals (bulk_create, queryset.update/delete) must call invalidate().
+Invalidation only reaches other workers through a shared cache backend (see CACHES in settings).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from .models import Enrollment
+def _cache_key(student_id):
+    return f"enrolled_course_ids:{student_id}"
+def get_enrolled_course_ids(user):
+    """Returns a frozenset of course IDs the user is enrolled in, memoized on the user object."""
+    memo = getattr(user, '_enrolled_course_ids', None)
+    if memo is not None:
+        return memo
+    key = _cache_key(user.pk)
+    course_ids = cache.get(key)
+    if course_ids is None:
+        # Read the primary: a lagging replica (core/db_router.py) must not be cached for an hour.
+        enrollments = Enrollment.objects.using(DEFAULT_DB_ALIAS).filter(student_id=user.pk)
+        course_ids = frozenset(enrollments.values_list('course_id', flat=True))
+        cache.set(key, course_ids, getattr(settings, 'ENROLLMENT_CACHE_TIMEOUT', 3600))
+    user._enrolled_course_ids = course_ids
+    return course_ids
+def is_enrolled(user, course_id):
+    return int(course_id) in get_enrolled_course_ids(user)
+def invalidate(student_id):
+    """Drops the cached set now and again on commit, so a concurrent reader cannot re-cache stale rows."""
+    invalidate_many([student_id])
+def invalidate_many(student_ids):
+    keys = [_cache_key(student_id) for student_id in student_ids]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
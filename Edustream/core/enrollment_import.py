@@ -0,0 +1,131 @@
+# core/enrollment_import.py
+"""
+Bulk enrollment import from CSV. Each batch of rows resolves its students and courses with
+one query apiece and inserts with bulk_create(ignore_conflicts=True), relying on the
+Enrollment unique_together to make re-imports harmless. import_rows() is a generator of
+progress and per-row error events, so callers can stream them while the import runs.
+
+The CSV needs an `email` column; `course_id` is required unless a course is given, and an
+optional `amount_paid` column overrides the course price.
+"""
+import csv
+from decimal import Decimal, InvalidOperation
+from django.db.models.functions import Lower
+from . import course_counters, db_writes, enrollment_cache
+from .models import Course, Enrollment, User
+def read_csv(text_stream):
+    """Yields (line_number, row dict) pairs; raises ValueError if the header has no email column."""
+    reader = csv.DictReader(text_stream)
+    if not reader.fieldnames or 'email' not in [name.strip().lower() for name in reader.fieldnames]:
+        raise ValueError("The CSV header must include an 'email' column.")
+    for row in reader:
+        yield reader.line_num, {(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+def _resolve_students(emails):
+    """Returns {lowercased email: user id or error message} for the students among `emails`."""
+    found = {}
+    users = User.objects.annotate(email_lower=Lower('email')).filter(email_lower__in=emails)
+    for user_id, email, user_type in users.values_list('id', 'email_lower', 'user_type'):
+        if email in found:
+            found[email] = "More than one account uses this email."
+        elif user_type != 'student':
+            found[email] = "This account is not a student."
+        else:
+            found[email] = user_id
+    return found
+def _until_decode_error(rows, stopped_at):
+    """Yields rows until the file stops decoding, then appends the last good line to `stopped_at`."""
+    line = 0
+    try:
+        for line, row in rows:
+            yield line, row
+    except UnicodeDecodeError:
+        stopped_at.append(line)
+def _import_batch(batch, course):
+    """Returns (created, already_enrolled, errors, course_ids) for one batch."""
+    errors, parsed = [], []
+    for line, row in batch:
+        email = row.get('email', '').lower()
+        if '@' not in email:
+            errors.append((line, f"Invalid email '{email}'."))
+            continue
+        course_id = course.pk if course else row.get('course_id', '')
+        try:
+            course_id = int(course_id)
+            amount = Decimal(row['amount_paid']) if row.get('amount_paid') else None
+        except (ValueError, InvalidOperation):
+            errors.append((line, "Invalid course_id or amount_paid."))
+            continue
+        parsed.append((line, email, course_id, amount))
+    students = _resolve_students({email for _, email, _, _ in parsed})
+    prices = dict(Course.objects.filter(pk__in={course_id for _, _, course_id, _ in parsed}).values_list('id', 'price'))
+    candidates = {}
+    for line, email, course_id, amount in parsed:
+        student = students.get(email)
+        if student is None:
+            errors.append((line, f"No account with email {email}."))
+        elif isinstance(student, str):
+            errors.append((line, student))
+        elif course_id not in prices:
+            errors.append((line, f"Course {course_id} does not exist."))
+        else:
+            candidates.setdefault((student, course_id), amount if amount is not None else prices[course_id])
+    existing = set(
+        Enrollment.objects.filter(
+            student_id__in={student for student, _ in candidates}, course_id__in={course_id for _, course_id in candidates},
+        ).values_list('student_id', 'course_id')
+    ) if candidates else set()
+    new = [
+        Enrollment(student_id=student, course_id=course_id, amount_paid=amount)
+        for (student, course_id), amount in candidates.items() if (student, course_id) not in existing
+    ]
+    with db_writes.serialized():
+        Enrollment.objects.bulk_create(new, ignore_conflicts=True)
+        # bulk_create() sends no signals, so do the Enrollment handlers' cache work here.
+        enrollment_cache.invalidate_many({enrollment.student_id for enrollment in new})
+    return len(new), len(candidates) - len(new), errors, {course_id for _, course_id in candidates}
+def import_rows(rows, course=None, batch_size=1000):
+    """
+    Enrolls students from (line_number, row) pairs, into `course` if given. Yields
+    {'type': 'error', 'line', 'message'} for rejected rows, {'type': 'progress', ...} after each
+    batch and a final {'type': 'done', ...} with the totals. A file that stops decoding part way
+    through keeps the rows before that point and ends with an error event.
+    """
+    totals = {'rows': 0, 'created': 0, 'existing': 0, 'errors': 0}
+    touched_courses, stopped_at = set(), []
+    try:
+        for batch in _batches(_until_decode_error(rows, stopped_at), batch_size):
+            created, existing, errors, course_ids = _import_batch(batch, course)
+            touched_courses |= course_ids
+            totals['rows'] += len(batch)
+            totals['created'] += created
+            totals['existing'] += existing
+            totals['errors'] += len(errors)
+            for line, message in sorted(errors):
+                yield {'type': 'error', 'line': line, 'message': message}
+            yield {'type': 'progress', **totals}
+        if stopped_at:
+            totals['errors'] += 1
+            yield {'type': 'error', 'line': stopped_at[0], 'message': "The file is not UTF-8 encoded after this line; the rest was not imported."}
+    finally:
+        # The counters are recomputed rather than incremented because ignore_conflicts hides
+        # which rows a concurrent writer got to first.
+        if touched_courses:
+            course_counters.reconcile(touched_courses)
+    yield {'type': 'done', **totals}
+def format_event(event):
+    if event['type'] == 'error':
+        return f"Line {event['line']}: {event['message']}"
+    label = 'Done' if event['type'] == 'done' else 'Processed'
+    return (
+        f"{label} {event['rows']} rows: {event['created']} enrolled, "
+        f"{event['existing']} already enrolled, {event['errors']} errors"
+    )
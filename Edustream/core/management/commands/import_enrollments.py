@@ -0,0 +1,30 @@
+# core/management/commands/import_enrollments.py
+from django.core.management.base import BaseCommand, CommandError
+from core import enrollment_import
+from core.models import Course
+class Command(BaseCommand):
+    help = "Enrolls students listed in a CSV file (columns: email, course_id unless --course is given, optional amount_paid)."
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path')
+        parser.add_argument('--course', type=int, help="Enroll every row into this course instead of reading course_id.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows resolved and inserted per batch.")
+    def handle(self, *args, **options):
+        course = None
+        if options['course']:
+            course = Course.objects.filter(pk=options['course']).first()
+            if course is None:
+                raise CommandError(f"Course {options['course']} does not exist.")
+        try:
+            with open(options['csv_path'], newline='', encoding='utf-8-sig') as fh:
+                for event in enrollment_import.import_rows(
+                    enrollment_import.read_csv(fh), course=course, batch_size=options['batch_size'],
+                ):
+                    line = enrollment_import.format_event(event)
+                    if event['type'] == 'error':
+                        self.stderr.write(line)
+                    elif event['type'] == 'done':
+                        self.stdout.write(self.style.SUCCESS(line))
+                    else:
+                        self.stdout.write(line)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
@@ -0,0 +1,13 @@
+# core/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from core import search
+from core.models import Course
+class Command(BaseCommand):
+    help = "Rebuilds the full-text course search index from the Course table."
+    def handle(self, *args, **options):
+        if not search.is_enabled():
+            raise CommandError("The course search index is only available on SQLite with FTS5.")
+        with transaction.atomic():
+            search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {Course.objects.count()} courses."))
@@ -0,0 +1,11 @@
+# core/management/commands/reconcile_course_counters.py
+from django.core.management.base import BaseCommand
+from core import course_counters
+class Command(BaseCommand):
+    help = "Recomputes the denormalized enrollment counters and revenue on Course and repairs any drift."
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='*', type=int, help="Courses to check (default: all).")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Courses rewritten per UPDATE.")
+    def handle(self, *args, **options):
+        repaired = course_counters.reconcile(options['course_ids'] or None, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Repaired counters on {repaired} courses."))
@@ -0,0 +1,23 @@
+# core/management/commands/refresh_analytics.py
+import time
+from django.core.management.base import BaseCommand
+from core import analytics
+class Command(BaseCommand):
+    help = "Folds enrollments added since the last run into the daily course and teacher analytics rollups."
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help="Enrollments folded in per transaction.")
+        parser.add_argument('--rebuild', action='store_true', help="Discard the rollups and recompute them from scratch.")
+        parser.add_argument('--loop', action='store_true', help="Keep refreshing instead of exiting after one pass.")
+        parser.add_argument('--sleep', type=float, default=60.0, help="Seconds to wait between passes with --loop.")
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            processed = analytics.rebuild(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt rollups from {processed} enrollments."))
+            if not options['loop']:
+                return
+        while True:
+            processed = analytics.refresh(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Folded {processed} new enrollments into the rollups."))
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
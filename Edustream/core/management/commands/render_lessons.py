@@ -0,0 +1,32 @@
+# core/management/commands/render_lessons.py
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from core import course_cache, db_writes, markup
+from core.models import CourseContent
+class Command(BaseCommand):
+    help = (
+        "Renders the stored HTML of lessons whose text or renderer changed since they were saved, "
+        "e.g. rows from before the column existed or from bulk_create()."
+    )
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Lessons rewritten per UPDATE.")
+        parser.add_argument('--force', action='store_true', help="Re-render every lesson, stale or not.")
+    def handle(self, *args, **options):
+        self.stdout.write(f"Rendering with {markup.RENDERER}.")
+        contents = CourseContent.objects.using(DEFAULT_DB_ALIAS).only('id', 'course_id', 'text_content', 'text_hash').order_by('id')
+        rendered = checked = last_id = 0
+        # Keyset batches rather than iterator(): SQLite gives no isolation between a cursor and
+        # writes to the same table on one connection.
+        while batch := list(contents.filter(id__gt=last_id)[:options['batch_size']]):
+            last_id, checked = batch[-1].id, checked + len(batch)
+            if options['force']:
+                for content in batch:
+                    content.text_hash = ''
+            stale = [content for content in batch if content.render_text()]
+            if stale:
+                with db_writes.serialized():
+                    CourseContent.objects.bulk_update(stale, ['text_html', 'text_hash'])
+                # bulk_update() sends no signals, so drop the cached contents lists here.
+                course_cache.bump({content.course_id for content in stale})
+                rendered += len(stale)
+        self.stdout.write(self.style.SUCCESS(f"Rendered {rendered} of {checked} lessons."))
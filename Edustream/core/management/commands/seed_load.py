@@ -0,0 +1,124 @@
+# core/management/commands/seed_load.py
+import random
+import time
+from decimal import Decimal
+from itertools import islice
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from core import course_counters, search
+from core.models import Category, Course, CourseContent, Enrollment, User
+WORDS = (
+    'python', 'django', 'data', 'design', 'music', 'finance', 'cloud', 'security', 'writing', 'history',
+    'biology', 'drawing', 'marketing', 'statistics', 'cooking', 'physics', 'spanish', 'guitar', 'yoga', 'chess',
+)
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+class Command(BaseCommand):
+    help = "Bulk-creates a deterministic synthetic dataset (users, courses, contents, enrollments) for load testing."
+    def add_arguments(self, parser):
+        parser.add_argument('--teachers', type=int, default=100)
+        parser.add_argument('--students', type=int, default=10000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--courses', type=int, default=2000, help="Total courses, spread across the teachers.")
+        parser.add_argument('--contents-per-course', type=int, default=10)
+        parser.add_argument('--enrollments-per-student', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per bulk_create and transaction.")
+        parser.add_argument('--seed', type=int, default=42, help="Random seed; the same seed produces the same dataset.")
+        parser.add_argument('--prefix', default='load', help="Prefix for generated usernames and category names.")
+        parser.add_argument('--password', default='load-pass-123', help="Password shared by every generated user.")
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f"Users with prefix '{prefix}_' already exist; pass a different --prefix.")
+        if options['courses'] and not options['teachers']:
+            raise CommandError("--courses needs at least one teacher.")
+        password = make_password(options['password'])
+        started = time.perf_counter()
+        teacher_ids = self._create_users(prefix, 'teacher', options['teachers'], password)
+        student_ids = self._create_users(prefix, 'student', options['students'], password)
+        category_ids = self._create_categories(prefix, options['categories'])
+        course_ids = self._create_courses(options['courses'], teacher_ids, category_ids)
+        self._create_contents(course_ids, options['contents_per_course'])
+        per_student = min(options['enrollments_per_student'], len(course_ids))
+        self._create_enrollments(student_ids, course_ids, per_student)
+        # bulk_create() skips the signals that keep the search index and course counters in sync.
+        if course_ids:
+            self.stdout.write(f"Reconciled counters on {course_counters.reconcile(course_ids)} courses.")
+        if course_ids and search.is_enabled():
+            with transaction.atomic():
+                search.rebuild_index()
+            self.stdout.write("Rebuilt the course search index.")
+        self.stdout.write(self.style.SUCCESS(f"Seeded in {time.perf_counter() - started:.1f}s."))
+    def _bulk_insert(self, model, rows, total):
+        created, started = 0, time.perf_counter()
+        for batch in _batched(rows, self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(batch, batch_size=self.batch_size)
+            created += len(batch)
+            if self.stdout.isatty():
+                self.stdout.write(f"\r{model.__name__}: {created}/{total}", ending='')
+                self.stdout.flush()
+        self.stdout.write(f"\rCreated {created} {model.__name__} rows in {time.perf_counter() - started:.1f}s.")
+    def _create_users(self, prefix, user_type, count, password):
+        rows = (
+            User(
+                username=f'{prefix}_{user_type}_{i}', email=f'{prefix}_{user_type}_{i}@example.com',
+                first_name=self.rng.choice(WORDS).title(), user_type=user_type, password=password,
+            )
+            for i in range(count)
+        )
+        self._bulk_insert(User, rows, count)
+        return list(
+            User.objects.filter(username__startswith=f'{prefix}_{user_type}_').order_by('id').values_list('id', flat=True)
+        )
+    def _create_categories(self, prefix, count):
+        rows = (Category(name=f'{prefix} {WORDS[i % len(WORDS)]} {i}') for i in range(count))
+        self._bulk_insert(Category, rows, count)
+        return list(Category.objects.filter(name__startswith=f'{prefix} ').order_by('id').values_list('id', flat=True))
+    def _create_courses(self, count, teacher_ids, category_ids):
+        rng = self.rng
+        self.course_prices = []
+        def rows():
+            for i in range(count):
+                topic = ' '.join(rng.sample(WORDS, 3))
+                self.course_prices.append(Decimal(rng.randint(0, 20000)) / 100)
+                yield Course(
+                    teacher_id=teacher_ids[i % len(teacher_ids)], title=f'{topic.title()} {i}',
+                    description=f'Learn {topic} from scratch. ' * rng.randint(2, 10),
+                    price=self.course_prices[-1],
+                    category_id=rng.choice(category_ids) if category_ids else None,
+                )
+        first_id = Course.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        self._bulk_insert(Course, rows(), count)
+        return list(Course.objects.filter(id__gt=first_id).order_by('id').values_list('id', flat=True))
+    def _create_contents(self, course_ids, per_course):
+        rng = self.rng
+        def rows():
+            for course_id in course_ids:
+                for order in range(per_course):
+                    kind = rng.choice(('text', 'text', 'video', 'quiz'))
+                    content = CourseContent(
+                        course_id=course_id, title=f'Lesson {order + 1}', content_type=kind, order=order,
+                        text_content='Lorem ipsum dolor sit amet. ' * rng.randint(5, 50) if kind != 'video' else None,
+                        video_url=f'https://videos.example.com/{course_id}/{order}' if kind == 'video' else None,
+                    )
+                    # bulk_create() skips save(), which is what normally renders the lesson.
+                    content.render_text()
+                    yield content
+        self._bulk_insert(CourseContent, rows(), len(course_ids) * per_course)
+    def _create_enrollments(self, student_ids, course_ids, per_student):
+        rng = self.rng
+        prices = dict(zip(course_ids, self.course_prices))
+        def rows():
+            for student_id in student_ids:
+                for course_id in rng.sample(course_ids, per_student):
+                    yield Enrollment(
+                        student_id=student_id, course_id=course_id, completed=rng.random() < 0.2,
+                        amount_paid=prices[course_id],
+                    )
+        self._bulk_insert(Enrollment, rows(), len(student_ids) * per_student)
@@ -0,0 +1,24 @@
+# core/management/commands/send_outbox.py
+import time
+from django.core.management.base import BaseCommand
+from core.outbox import deliver_batch
+class Command(BaseCommand):
+    help = "Delivers queued outbox emails in batches over a pooled SMTP connection."
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help="Emails sent per SMTP connection.")
+        parser.add_argument('--max-attempts', type=int, default=None, help="Attempts before an email is marked failed.")
+        parser.add_argument('--loop', action='store_true', help="Keep polling the outbox instead of exiting once it is drained.")
+        parser.add_argument('--sleep', type=float, default=5.0, help="Seconds to wait between polls when the outbox is empty.")
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = deliver_batch(options['batch_size'], options['max_attempts'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f"Batch: {sent} sent, {failed} failed.")
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f"Outbox drained: {total_sent} sent, {total_failed} failed."))
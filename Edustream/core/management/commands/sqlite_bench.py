@@ -0,0 +1,123 @@
+# core/management/commands/sqlite_bench.py
+import shutil
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from core import db_writes
+from core.models import Category, Course, Enrollment, User
+PROFILES = {
+    # Django's SQLite defaults: rollback journal, DEFERRED transactions, 5 second busy timeout.
+    'default': {'options': {}, 'serialize': False},
+    'production': {'options': settings.SQLITE_PRODUCTION_OPTIONS, 'serialize': True},
+    # The production pragmas without core.db_writes, to see what the write lock adds.
+    'production-unserialized': {'options': settings.SQLITE_PRODUCTION_OPTIONS, 'serialize': False},
+}
+class Command(BaseCommand):
+    help = (
+        "Runs concurrent purchases, OTP updates and catalog reads against a scratch SQLite file "
+        "under each database profile and reports throughput and 'database is locked' errors."
+    )
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--operations', type=int, default=200, help="Operations per thread.")
+        parser.add_argument('--courses', type=int, default=200)
+        parser.add_argument('--students', type=int, default=2000)
+        parser.add_argument('--write-ratio', type=float, default=0.5, help="Fraction of operations that write.")
+        parser.add_argument('--profiles', nargs='+', choices=sorted(PROFILES), default=['default', 'production'])
+    def _setup(self, alias, directory, profile, options):
+        connections.settings[alias] = {
+            **connections.settings[DEFAULT_DB_ALIAS],
+            'NAME': str(Path(directory) / f'{alias}.sqlite3'), 'OPTIONS': profile['options'],
+            'CONN_MAX_AGE': 0, 'TEST': {},
+        }
+        call_command('migrate', database=alias, verbosity=0)
+        with transaction.atomic(using=alias):
+            teacher = User.objects.db_manager(alias).create_user('bench_teacher', user_type='teacher')
+            category = Category.objects.using(alias).create(name='Bench')
+            Course.objects.using(alias).bulk_create(
+                Course(teacher=teacher, category=category, title=f'Bench course {i}', description='x', price=10)
+                for i in range(options['courses'])
+            )
+            User.objects.db_manager(alias).bulk_create(
+                User(username=f'bench_student_{i}', email=f'bench_student_{i}@example.com', user_type='student')
+                for i in range(options['students'])
+            )
+        return (
+            list(Course.objects.using(alias).values_list('id', flat=True)),
+            list(User.objects.using(alias).filter(user_type='student').values_list('id', flat=True)),
+        )
+    def _purchase(self, alias, serialize, student_id, course_id):
+        # get_or_create() plus the counter signal, minus the signals that would write to 'default'.
+        # Reading before writing is what makes DEFERRED transactions fail on the lock upgrade.
+        with (db_writes.serialized(alias) if serialize else transaction.atomic(using=alias)):
+            enrollments = Enrollment.objects.using(alias)
+            if not enrollments.filter(student_id=student_id, course_id=course_id).exists():
+                enrollments.bulk_create([Enrollment(student_id=student_id, course_id=course_id, amount_paid=10)])
+                Course.objects.using(alias).filter(pk=course_id).update(enrollment_count=F('enrollment_count') + 1)
+    def _otp_update(self, alias, serialize, student_id):
+        with (db_writes.serialized(alias) if serialize else transaction.atomic(using=alias)):
+            User.objects.using(alias).filter(pk=student_id).update(email_otp='123456', otp_created_at=timezone.now())
+    def _read(self, alias, student_id, course_id):
+        list(Course.objects.using(alias).filter(pk__gte=course_id).order_by('pk')[:24])
+        list(Enrollment.objects.using(alias).filter(student_id=student_id).values_list('course_id', flat=True))
+    def _worker(self, alias, serialize, worker, course_ids, student_ids, options):
+        latencies, errors = [], 0
+        writes_every = max(round(1 / options['write_ratio']), 1) if options['write_ratio'] else 0
+        try:
+            for n in range(options['operations']):
+                seed = worker * options['operations'] + n
+                student_id = student_ids[seed % len(student_ids)]
+                course_id = course_ids[(seed * 7919) % len(course_ids)]
+                started = time.perf_counter()
+                try:
+                    if writes_every and n % writes_every == 0:
+                        if n % (2 * writes_every) == 0:
+                            self._purchase(alias, serialize, student_id, course_id)
+                        else:
+                            self._otp_update(alias, serialize, student_id)
+                    else:
+                        self._read(alias, student_id, course_id)
+                except OperationalError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+        finally:
+            connections[alias].close()
+        return latencies, errors
+    def _run(self, name, directory, options):
+        alias = f"bench_{name.replace('-', '_')}"
+        profile = PROFILES[name]
+        course_ids, student_ids = self._setup(alias, directory, profile, options)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            results = list(pool.map(
+                lambda worker: self._worker(alias, profile['serialize'], worker, course_ids, student_ids, options),
+                range(options['threads']),
+            ))
+        elapsed = time.perf_counter() - started
+        connections[alias].close()
+        latencies = sorted(latency for worker_latencies, _ in results for latency in worker_latencies)
+        errors = sum(worker_errors for _, worker_errors in results)
+        self.stdout.write(f"{name}: {len(latencies)} ok, {errors} 'database is locked' in {elapsed:.2f}s "
+                          f"-> {len(latencies) / elapsed:.0f} ops/s")
+        if latencies:
+            p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)]
+            self.stdout.write(f"    latency: median {statistics.median(latencies) * 1000:.1f} ms, "
+                              f"p99 {p99 * 1000:.1f} ms")
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp(prefix='edustream-sqlite-bench-')
+        self.stdout.write(f"{options['threads']} threads x {options['operations']} operations, "
+                          f"{options['write_ratio']:.0%} writes, scratch files in {directory}")
+        try:
+            for name in options['profiles']:
+                self._run(name, directory, options)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,106 @@
+# core/markup.py
+"""
+Markdown rendering for text lessons. CourseContent.save() renders text_content once into the
+sanitized text_html column, together with content_hash() of the source, so lesson pages only
+output stored HTML. The hash covers the renderer as well as the text: when RENDERER changes,
+`render_lessons` finds every stale row and rebuilds it.
+
+With the `markdown` and `nh3` packages installed, lessons are rendered by Python-Markdown and
+sanitized by nh3. Otherwise a built-in renderer handles the common subset (headings, emphasis,
+inline and fenced code, lists, block quotes, links and rules). It escapes the text before
+adding any markup, so its output is safe by construction. Both keep single line breaks, which
+is how lessons were displayed before they supported Markdown.
+"""
+import hashlib
+import html
+import re
+try:
+    import markdown
+    import nh3
+except ImportError:
+    markdown = nh3 = None
+RENDERER = 'markdown+nh3-1' if markdown else 'builtin-1'
+ALLOWED_SCHEMES = {'http', 'https', 'mailto'}
+_FENCE = re.compile(r'^\s*```')
+_HEADING = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+_RULE = re.compile(r'^\s*([-*_])(\s*\1){2,}\s*$')
+_BULLET = re.compile(r'^\s*[-*+]\s+(.*)$')
+_NUMBERED = re.compile(r'^\s*\d+[.)]\s+(.*)$')
+_QUOTE = re.compile(r'^\s*>\s?(.*)$')
+_CODE_SPAN = re.compile(r'`([^`]+)`')
+_LINK = re.compile(r'\[([^\]]+)\]\(([^)\s]+)\)')
+_STRONG = re.compile(r'(\*\*|__)(?=\S)(.+?)(?<=\S)\1')
+_EMPHASIS = re.compile(r'(?<![\w*])([*_])(?=\S)(.+?)(?<=\S)\1(?![\w*])')
+def content_hash(text):
+    return hashlib.sha256(f"{RENDERER}\n{text}".encode()).hexdigest()
+def _safe_url(url):
+    url = html.unescape(url)
+    scheme = url.split(':', 1)[0].lower() if ':' in url.split('/', 1)[0] else None
+    return scheme is None or scheme in ALLOWED_SCHEMES
+def _emphasize(text):
+    text = _STRONG.sub(r'<strong>\2</strong>', text)
+    return _EMPHASIS.sub(r'<em>\2</em>', text)
+def _inline(text):
+    # Code spans and links are cut out first so emphasis never lands inside them.
+    stashed = []
+    def stash(markup):
+        stashed.append(markup)
+        return f'\x00{len(stashed) - 1}\x00'
+    def link(match):
+        label, url = match.groups()
+        if not _safe_url(url):
+            return _emphasize(label)
+        return stash(f'<a href="{url}" rel="nofollow noopener" target="_blank">{_emphasize(label)}</a>')
+    text = _CODE_SPAN.sub(lambda match: stash(f'<code>{match.group(1)}</code>'), html.escape(text, quote=True))
+    text = _emphasize(_LINK.sub(link, text))
+    return re.sub('\x00(\\d+)\x00', lambda match: stashed[int(match.group(1))], text)
+def _render_builtin(text):
+    blocks, lines = [], text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if not line.strip():
+            i += 1
+        elif _FENCE.match(line):
+            end = next((j for j in range(i + 1, len(lines)) if _FENCE.match(lines[j])), len(lines))
+            blocks.append(f"<pre><code>{html.escape(chr(10).join(lines[i + 1:end]))}</code></pre>")
+            i = end + 1
+        elif _HEADING.match(line):
+            hashes, title = _HEADING.match(line).groups()
+            blocks.append(f"<h{len(hashes)}>{_inline(title)}</h{len(hashes)}>")
+            i += 1
+        elif _RULE.match(line):
+            blocks.append('<hr>')
+            i += 1
+        elif _BULLET.match(line) or _NUMBERED.match(line):
+            pattern, tag = (_BULLET, 'ul') if _BULLET.match(line) else (_NUMBERED, 'ol')
+            items = []
+            while i < len(lines) and pattern.match(lines[i]):
+                items.append(f"<li>{_inline(pattern.match(lines[i]).group(1))}</li>")
+                i += 1
+            blocks.append(f"<{tag}>{''.join(items)}</{tag}>")
+        elif _QUOTE.match(line):
+            quoted = []
+            while i < len(lines) and _QUOTE.match(lines[i]):
+                quoted.append(_QUOTE.match(lines[i]).group(1))
+                i += 1
+            blocks.append(f"<blockquote>{_render_builtin(chr(10).join(quoted))}</blockquote>")
+        else:
+            paragraph = []
+            while i < len(lines) and lines[i].strip() and not any(
+                pattern.match(lines[i]) for pattern in (_FENCE, _HEADING, _RULE, _BULLET, _NUMBERED, _QUOTE)
+            ):
+                paragraph.append(_inline(lines[i].strip()))
+                i += 1
+            blocks.append(f"<p>{'<br>'.join(paragraph)}</p>")
+    return '\n'.join(blocks)
+def render(text):
+    """Returns sanitized HTML for a lesson's Markdown source."""
+    # NUL marks stashed spans in the built-in renderer and has no place in a lesson anyway.
+    text = (text or '').replace('\x00', '')
+    if not text:
+        return ''
+    if markdown is not None:
+        rendered = markdown.markdown(text, extensions=['fenced_code', 'nl2br', 'sane_lists'])
+        return nh3.clean(rendered, url_schemes=ALLOWED_SCHEMES, link_rel='nofollow noopener')
+    return _render_builtin(text)
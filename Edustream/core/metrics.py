@@ -0,0 +1,199 @@
+# core/metrics.py
+"""
+In-process runtime metrics rendered in the Prometheus text format at /metrics.
+
+MetricsMiddleware times every request, sync or async, and counts its SQL through an execute
+wrapper installed on every connection, labelled by URL name. Outbound SMTP and PayPal calls are timed with
+`timed(service, operation)`. Each worker process keeps its own registry, so scrape every
+worker (or run one) and let Prometheus aggregate. log_event() replaces ad-hoc debug prints
+with key=value log lines, sampled at LOG_SAMPLE_RATE.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+class Counter:
+    kind = 'counter'
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help_text, self.labels = name, help_text, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_number(value)}"
+class Histogram:
+    kind = 'histogram'
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help_text, self.labels = name, help_text, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += 1
+            series[2] += value
+    def samples(self):
+        with self._lock:
+            snapshot = {key: (list(counts), count, total) for key, (counts, count, total) in self._series.items()}
+        for label_values, (counts, count, total) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, label_values, [('le', _format_number(bound))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(self.labels, label_values, [('le', '+Inf')])} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labels, label_values)} {_format_number(total)}"
+            yield f"{self.name}_count{_format_labels(self.labels, label_values)} {count}"
+REQUEST_LATENCY = Histogram(
+    'edustream_http_request_duration_seconds', "Request latency by URL name.", ('view', 'method'),
+)
+REQUESTS = Counter('edustream_http_requests_total', "Requests by URL name and status code.", ('view', 'method', 'status'))
+REQUEST_QUERIES = Histogram(
+    'edustream_db_queries_per_request', "SQL queries executed per request.", ('view',), QUERY_COUNT_BUCKETS,
+)
+QUERY_SECONDS = Counter('edustream_db_query_seconds_total', "Time spent executing SQL, by URL name.", ('view',))
+QUERIES = Counter('edustream_db_queries_total', "SQL queries executed, by URL name.", ('view',))
+EXTERNAL_LATENCY = Histogram(
+    'edustream_external_call_duration_seconds', "Outbound SMTP and PayPal call latency.",
+    ('service', 'operation', 'outcome'),
+)
+REGISTRY = [REQUEST_LATENCY, REQUESTS, REQUEST_QUERIES, QUERY_SECONDS, QUERIES, EXTERNAL_LATENCY]
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+@contextmanager
+def timed(service, operation):
+    """
+    Records the duration of an outbound call. The outcome is 'error' if the block raises; the
+    block can also set `.outcome` on the yielded object, e.g. for an HTTP 5xx response.
+    """
+    call = SimpleNamespace(outcome='ok')
+    started = time.perf_counter()
+    try:
+        yield call
+    except BaseException:
+        call.outcome = 'error'
+        raise
+    finally:
+        EXTERNAL_LATENCY.observe(time.perf_counter() - started, service, operation, call.outcome)
+class QueryCounter:
+    """An execute wrapper that counts queries and the time they take."""
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+# The current request's QueryCounter. A context variable rather than a per-request
+# execute_wrapper() so that queries an async view runs through sync_to_async() in another
+# thread are counted too.
+_request_queries = contextvars.ContextVar('metrics_request_queries', default=None)
+def _count_queries(execute, sql, params, many, context):
+    counter = _request_queries.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+def install_query_counter(connection):
+    """Adds the request query counter to a new connection (see core/signals.py)."""
+    if _count_queries not in connection.execute_wrappers:
+        # Prepended, so that execute_wrapper() blocks open at the time still pop their own wrapper.
+        connection.execute_wrappers.insert(0, _count_queries)
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route or 'unnamed'
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'METRICS_ENABLED', True)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        counter = QueryCounter()
+        token = _request_queries.set(counter)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self._record(request, response, counter, time.perf_counter() - started)
+        return response
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        counter = QueryCounter()
+        token = _request_queries.set(counter)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self._record(request, response, counter, time.perf_counter() - started)
+        return response
+    def _record(self, request, response, counter, elapsed):
+        view = _view_name(request)
+        REQUEST_LATENCY.observe(elapsed, view, request.method)
+        REQUESTS.inc(view, request.method, str(response.status_code))
+        REQUEST_QUERIES.observe(counter.count, view)
+        QUERIES.inc(view, amount=counter.count)
+        QUERY_SECONDS.inc(view, amount=counter.seconds)
+def _format_fields(fields):
+    parts = []
+    for key, value in fields.items():
+        value = str(value)
+        if not value or any(ch in value for ch in ' "='):
+            value = '"' + value.replace('"', r'\"') + '"'
+        parts.append(f"{key}={value}")
+    return ' '.join(parts)
+def log_event(logger, event, level=logging.INFO, **fields):
+    """
+    Logs `event key=value ...` with the fields also attached to the record. INFO and below are
+    sampled at LOG_SAMPLE_RATE; warnings and errors are always logged. Pass only values the
+    caller already has in hand so logging never triggers queries.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if level < logging.WARNING and random.random() >= getattr(settings, 'LOG_SAMPLE_RATE', 0.1):
+        return
+    logger.log(level, "%s %s", event, _format_fields(fields), extra={'event': event, 'fields': fields})
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+
+CREATE_INDEX = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS core_course_search USING fts5("
+    "title, description, teacher, category, "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "INSERT INTO core_course_search(rowid, title, description, teacher, category) "
+    "SELECT c.id, c.title, c.description, u.username, COALESCE(cat.name, '') "
+    "FROM core_course c "
+    "JOIN core_user u ON u.id = c.teacher_id "
+    "LEFT JOIN core_category cat ON cat.id = c.category_id",
+]
+DROP_INDEX = ["DROP TABLE IF EXISTS core_course_search"]
+
+
+class SQLiteRunSQL(migrations.RunSQL):
+    """RunSQL for SQLite only; on other databases the catalog falls back to icontains search."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_outboundemail'),
+    ]
+
+    operations = [
+        SQLiteRunSQL(CREATE_INDEX, DROP_INDEX),
+    ]
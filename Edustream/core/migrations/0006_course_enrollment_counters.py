@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:34
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def _total(Enrollment, aggregate, output_field):
+    totals = Enrollment.objects.filter(course=OuterRef('pk')).order_by().values('course').annotate(total=aggregate)
+    return Coalesce(Subquery(totals.values('total'), output_field=output_field), Value(0), output_field=output_field)
+
+
+def backfill_counters(apps, schema_editor):
+    Course = apps.get_model('core', 'Course')
+    Enrollment = apps.get_model('core', 'Enrollment')
+    db_alias = schema_editor.connection.alias
+    Enrollment.objects.using(db_alias).filter(amount_paid__isnull=True).update(
+        amount_paid=Subquery(Course.objects.filter(pk=OuterRef('course_id')).values('price')[:1]),
+    )
+    Course.objects.using(db_alias).update(
+        enrollment_count=_total(Enrollment, Count('pk'), IntegerField()),
+        completed_count=_total(Enrollment, Count('pk', filter=Q(completed=True)), IntegerField()),
+        gross_revenue=_total(Enrollment, Sum('amount_paid'), DecimalField(max_digits=14, decimal_places=2)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='completed_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='enrollment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='gross_revenue',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='amount_paid',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
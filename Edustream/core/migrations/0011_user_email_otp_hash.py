@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_coursecontent_text_html'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='email_otp',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
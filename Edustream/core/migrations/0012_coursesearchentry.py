@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:30
+
+import core.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_user_email_otp_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseSearchEntry',
+            fields=[
+                ('course', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='core.course')),
+                ('document', core.models.FullTextField(db_column='core_course_search')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'core_course_search',
+                'managed': False,
+            },
+        ),
+    ]
@@ -1,14 +1,23 @@
 # core/models.py
+import uuid
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Lower
+from django.utils import timezone
+from . import db_writes, markup
 class User(AbstractUser):
     USER_TYPE_CHOICES = (
         ('student', 'Student'),
         ('teacher', 'Teacher'),
     )
     user_type = models.CharField(max_length=10, choices=USER_TYPE_CHOICES, default='student')
-    email_otp = models.CharField(max_length=6, blank=True, null=True)
+    # HMAC of the OTP written by core.otp_store.DatabaseOTPStore, never the OTP itself.
+    email_otp = models.CharField(max_length=64, blank=True, null=True)
     otp_created_at = models.DateTimeField(blank=True, null=True)
+    class Meta(AbstractUser.Meta):
+        swappable = 'AUTH_USER_MODEL'
+        # Case-insensitive email lookups, e.g. batched resolution in core.enrollment_import.
+        indexes = [models.Index(Lower('email'), name='core_user_email_lower_idx')]
     def __str__(self):
         return self.username
 class Category(models.Model):
@@ -26,8 +35,39 @@ class Course(models.Model):
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='courses')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized from Enrollment by core.course_counters; repair with reconcile_course_counters.
+    enrollment_count = models.PositiveIntegerField(default=0, editable=False)
+    completed_count = models.PositiveIntegerField(default=0, editable=False)
+    gross_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
+    class Meta:
+        indexes = [
+            models.Index(fields=['title']),
+            models.Index(fields=['teacher', '-created_at']),
+        ]
     def __str__(self):
         return self.title
+class FullTextField(models.TextField):
+    """An FTS5 column; supports `__match=<FTS5 query>`."""
+@FullTextField.register_lookup
+class FullTextMatch(models.Lookup):
+    lookup_name = 'match'
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", [*lhs_params, *rhs_params]
+class CourseSearchEntry(models.Model):
+    """
+    A row of the FTS5 index maintained by core/search.py, joined to its course by rowid.
+    `rank` is the bm25 score of the current MATCH (lower is better); it only has a value in
+    queries that filter with `document__match`.
+    """
+    course = models.OneToOneField(Course, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid', related_name='search_entry')
+    # FTS5's hidden column named after the table, the left-hand side of a table-wide MATCH.
+    document = FullTextField(db_column='core_course_search')
+    rank = models.FloatField()
+    class Meta:
+        managed = False
+        db_table = 'core_course_search'
 class CourseContent(models.Model):
     CONTENT_TYPE_CHOICES = (
         ('text', 'Text Lesson'),
@@ -42,17 +82,150 @@ class CourseContent(models.Model):
     video_url = models.URLField(blank=True, null=True)
     file = models.FileField(upload_to='course_files/', blank=True, null=True) 
     order = models.PositiveIntegerField(default=0) 
+    # text_content rendered from Markdown to sanitized HTML on save, and the hash of the
+    # source it was rendered from (core/markup.py); lesson pages output text_html as is.
+    text_html = models.TextField(blank=True, default='', editable=False)
+    text_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
     class Meta:
         ordering = ['order']
         verbose_name_plural = "Course Contents"
+    def render_text(self):
+        """Re-renders text_html if text_content or the renderer changed; returns True if it did."""
+        digest = markup.content_hash(self.text_content or '')
+        if digest == self.text_hash:
+            return False
+        self.text_html, self.text_hash = markup.render(self.text_content), digest
+        return True
+    def save(self, *args, **kwargs):
+        if self.render_text() and kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'text_html', 'text_hash'}
+        super().save(*args, **kwargs)
     def __str__(self):
         return f"{self.course.title} - {self.title}"
+class EnrollmentQuerySet(models.QuerySet):
+    def get_or_create(self, defaults=None, **kwargs):
+        # get_or_create() opens its own atomic block before save(), where serialized() no longer
+        # takes the write lock; take it first. aget_or_create() runs this in a thread.
+        self._for_write = True
+        with db_writes.serialized(self.db):
+            return super().get_or_create(defaults, **kwargs)
 class Enrollment(models.Model):
     student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='enrolled_courses', limit_choices_to={'user_type': 'student'})
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='enrollments')
     enrollment_date = models.DateTimeField(auto_now_add=True)
     completed = models.BooleanField(default=False)
+    # What the student paid; defaults to the course price when the enrollment is created.
+    amount_paid = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    objects = EnrollmentQuerySet.as_manager()
     class Meta:
         unique_together = ('student', 'course')
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the counter signals tell what changed on the next save.
+        instance._loaded_counters = (instance.__dict__.get('completed'), instance.__dict__.get('amount_paid'))
+        return instance
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.amount_paid is None:
+            self.amount_paid = self.course.price
+        # The post_save counter update runs inside this transaction with the row itself.
+        with db_writes.serialized(kwargs.get('using')):
+            super().save(*args, **kwargs)
+    def __str__(self):
+        return f"{self.student.username} enrolled in {self.course.title}"
+class OutboundEmail(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    template_name = models.CharField(max_length=200)
+    context = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+    def __str__(self):
+        return f"{self.subject} -> {self.to_email} ({self.status})"
+
+class PayPalWebhookEvent(models.Model):
+    """A PayPal webhook delivery, stored as received and processed by `process_paypal_webhooks`."""
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('rejected', 'Rejected'),
+        ('failed', 'Failed'),
+    )
+    # PayPal redelivers an event with the same id until it is acknowledged; the unique
+    # constraint turns redeliveries into no-ops.
+    event_id = models.CharField(max_length=128, unique=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    # The PAYPAL-* transmission headers, needed to verify the signature later.
+    headers = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+    def __str__(self):
+        return f"{self.event_type} {self.event_id} ({self.status})"
+
+class ChunkedUpload(models.Model):
+    STATUS_CHOICES = (
+        ('uploading', 'Uploading'),
+        ('complete', 'Complete'),
+    )
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    teacher = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chunked_uploads')
+    filename = models.CharField(max_length=255)
+    total_size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='uploading')
+    file = models.FileField(upload_to='course_files/', blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.total_size} bytes, {self.status})"
+class CourseDailyStats(models.Model):
+    """Enrollments and revenue per course per day, maintained by core.analytics.refresh()."""
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='daily_stats')
+    teacher = models.ForeignKey(User, on_delete=models.CASCADE, related_name='course_daily_stats')
+    date = models.DateField()
+    enrollments = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    class Meta:
+        unique_together = ('course', 'date')
+        indexes = [models.Index(fields=['teacher', 'date'])]
+        verbose_name_plural = "Course daily stats"
+    def __str__(self):
+        return f"{self.course_id} on {self.date}: {self.enrollments} enrollments"
+class TeacherDailyStats(models.Model):
+    """Enrollments and revenue across all of a teacher's courses per day."""
+    teacher = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    enrollments = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    class Meta:
+        unique_together = ('teacher', 'date')
+        verbose_name_plural = "Teacher daily stats"
+    def __str__(self):
+        return f"{self.teacher_id} on {self.date}: {self.enrollments} enrollments"
+class AnalyticsWatermark(models.Model):
+    """The highest Enrollment id already folded into the daily rollups."""
+    name = models.CharField(max_length=50, unique=True)
+    last_enrollment_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
     def __str__(self):
-        return f"{self.student.username} enrolled in {self.course.title}"
\ No newline at end of file
+        return f"{self.name} at enrollment {self.last_enrollment_id}"
+
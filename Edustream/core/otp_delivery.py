@@ -0,0 +1,80 @@
+# core/otp_delivery.py
+"""
+Sends login OTP emails off the request thread. A small bounded thread pool does the SMTP
+work; when it is saturated the email is dropped and the user is asked to request a new OTP,
+so the login request never waits on SMTP. OTPs are never queued in the outbox: that would
+store the code in the database and could deliver it after it expired.
+Delivery progress is kept in the cache so verify_otp_view can report it.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import send_mail
+from . import metrics
+logger = logging.getLogger('edustream.otp')
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(getattr(settings, 'OTP_EMAIL_QUEUE_SIZE', 50))
+def send_otp_email(email, otp):
+    """Sends the OTP email synchronously; raises on SMTP failure."""
+    subject = 'Your EduStream Login OTP'
+    message = (
+        f'Dear User,\n\n'
+        f'Your One-Time Password (OTP) for EduStream login is: {otp}\n\n'
+        f'This OTP is valid for 5 minutes. Please do not share it with anyone.\n\n'
+        f'If you did not request this OTP, please ignore this email.'
+    )
+    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@edustream.com')
+    with metrics.timed('smtp', 'otp'):
+        send_mail(subject, message, from_email, [email], fail_silently=False)
+def _status_key(user_id):
+    return f"otp_delivery:{user_id}"
+def _set_status(user_id, status, error=''):
+    cache.set(_status_key(user_id), {'status': status, 'error': error}, 10 * 60)
+def get_delivery_status(user_id):
+    """Returns 'pending', 'sent', 'failed', 'retry' (pool full) or None if nothing was dispatched."""
+    entry = cache.get(_status_key(user_id))
+    return entry['status'] if entry else None
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'OTP_EMAIL_WORKERS', 4), thread_name_prefix='otp-email',
+                )
+    return _executor
+def _deliver(user_id, email, otp):
+    try:
+        send_otp_email(email, otp)
+        _set_status(user_id, 'sent')
+        metrics.log_event(logger, 'otp_email_sent', user_id=user_id)
+    except Exception as e:
+        _set_status(user_id, 'failed', str(e))
+        metrics.log_event(logger, 'otp_email_failed', logging.WARNING, user_id=user_id, error=e)
+def _deliver_and_release(user_id, email, otp):
+    try:
+        _deliver(user_id, email, otp)
+    finally:
+        _slots.release()
+def _drop(user_id, reason):
+    _set_status(user_id, 'retry', reason)
+    metrics.log_event(logger, 'otp_email_dropped', logging.WARNING, user_id=user_id, reason=reason)
+def dispatch_otp_email(user_id, email, otp):
+    """Hands the OTP email to the background pool; never sends from the calling thread."""
+    if not getattr(settings, 'OTP_EMAIL_ASYNC', True):
+        _set_status(user_id, 'pending')
+        _deliver(user_id, email, otp)
+        return
+    if not _slots.acquire(blocking=False):
+        _drop(user_id, 'queue full')
+        return
+    _set_status(user_id, 'pending')
+    try:
+        _get_executor().submit(_deliver_and_release, user_id, email, otp)
+    except RuntimeError:
+        # The pool is shutting down with the process.
+        _slots.release()
+        _drop(user_id, 'shutting down')
@@ -0,0 +1,106 @@
+# core/otp_store.py
+"""
+Pluggable storage for login OTPs, selected with the OTP_STORE setting.
+
+CacheOTPStore (the default) keeps a hashed OTP in the cache with a native TTL and never
+touches the User table. DatabaseOTPStore keeps a hashed OTP in the legacy
+User.email_otp/otp_created_at columns and writes only those two columns. Both keep their
+attempt counters and the issue rate limit in the cache, so guessing OTPs is stopped before
+it reaches the database. That cache must be shared by every worker (Redis in production,
+see CACHES in settings.py) and must increment atomically, so the database and file caches
+are refused.
+"""
+import datetime
+import hashlib
+import hmac
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from . import db_writes
+from .models import User
+# Their incr() is a get followed by a set, so concurrent attempts could share one count.
+NON_ATOMIC_INCR_BACKENDS = (
+    'django.core.cache.backends.db.DatabaseCache',
+    'django.core.cache.backends.filebased.FileBasedCache',
+)
+VALID, INVALID, EXPIRED, LOCKED = 'valid', 'invalid', 'expired', 'locked'
+def _hash(user_id, otp):
+    return hmac.new(settings.SECRET_KEY.encode(), f"{user_id}:{otp}".encode(), hashlib.sha256).hexdigest()
+class BaseOTPStore:
+    def __init__(self):
+        backend = settings.CACHES['default']['BACKEND']
+        if backend in NON_ATOMIC_INCR_BACKENDS:
+            raise ImproperlyConfigured(f"OTP counters need a cache with an atomic incr(), not {backend}.")
+        self.ttl = getattr(settings, 'OTP_TTL_SECONDS', 300)
+        self.max_attempts = getattr(settings, 'OTP_MAX_ATTEMPTS', 5)
+        self.issue_limit, self.issue_window = getattr(settings, 'OTP_ISSUE_RATE_LIMIT', (5, 900))
+    def _attempts_key(self, user_id):
+        return f"otp_attempts:{user_id}"
+    def _issued_key(self, user_id):
+        return f"otp_issued:{user_id}"
+    def _count(self, key, timeout):
+        """
+        Increments a counter that expires `timeout` seconds after it was created. add() and
+        incr() are atomic on Redis and Memcached; LocMemCache is atomic within one process only.
+        """
+        if cache.add(key, 1, timeout):
+            return 1
+        try:
+            return cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout)
+            return 1
+    def allow_issue(self, user_id):
+        """Counts an OTP request and returns False once the user exceeds OTP_ISSUE_RATE_LIMIT."""
+        return self._count(self._issued_key(user_id), self.issue_window) <= self.issue_limit
+    def issue(self, user_id, otp):
+        self._save(user_id, otp)
+        cache.delete(self._attempts_key(user_id))
+    def verify(self, user_id, otp):
+        """Returns VALID, INVALID, EXPIRED or LOCKED. A valid or locked OTP is discarded."""
+        if self._count(self._attempts_key(user_id), self.ttl) > self.max_attempts:
+            self.clear(user_id)
+            return LOCKED
+        result = self._check(user_id, otp)
+        if result == VALID:
+            self.clear(user_id)
+        return result
+    def clear(self, user_id):
+        self._delete(user_id)
+        cache.delete(self._attempts_key(user_id))
+    def _save(self, user_id, otp):
+        raise NotImplementedError
+    def _check(self, user_id, otp):
+        raise NotImplementedError
+    def _delete(self, user_id):
+        raise NotImplementedError
+class CacheOTPStore(BaseOTPStore):
+    def _key(self, user_id):
+        return f"otp:{user_id}"
+    def _save(self, user_id, otp):
+        cache.set(self._key(user_id), _hash(user_id, otp), self.ttl)
+    def _check(self, user_id, otp):
+        stored = cache.get(self._key(user_id))
+        if stored is None:
+            return EXPIRED
+        return VALID if hmac.compare_digest(stored, _hash(user_id, otp)) else INVALID
+    def _delete(self, user_id):
+        cache.delete(self._key(user_id))
+class DatabaseOTPStore(BaseOTPStore):
+    def _save(self, user_id, otp):
+        with db_writes.serialized():
+            User.objects.filter(pk=user_id).update(email_otp=_hash(user_id, otp), otp_created_at=timezone.now())
+    def _check(self, user_id, otp):
+        row = User.objects.filter(pk=user_id).values('email_otp', 'otp_created_at').first()
+        if not row or not row['email_otp'] or not row['otp_created_at']:
+            return EXPIRED
+        if timezone.now() - row['otp_created_at'] >= datetime.timedelta(seconds=self.ttl):
+            return EXPIRED
+        return VALID if hmac.compare_digest(row['email_otp'], _hash(user_id, otp)) else INVALID
+    def _delete(self, user_id):
+        with db_writes.serialized():
+            User.objects.filter(pk=user_id).update(email_otp=None, otp_created_at=None)
+def get_otp_store():
+    return import_string(getattr(settings, 'OTP_STORE', 'core.otp_store.CacheOTPStore'))()
@@ -0,0 +1,118 @@
+# core/outbox.py
+import datetime
+import logging
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.html import strip_tags
+from . import metrics
+from .models import OutboundEmail
+logger = logging.getLogger('edustream.outbox')
+def queue_email(to_email, subject, template_name, context):
+    """Queues a single templated email for the outbox worker."""
+    return OutboundEmail.objects.create(
+        to_email=to_email, subject=subject, template_name=template_name, context=context,
+    )
+def queue_emails(subject, template_name, recipients, batch_size=500):
+    """
+    Queues one templated email per (email, context) pair in `recipients`.
+    Rendering is deferred to the worker, so the caller only pays for a batched INSERT.
+    """
+    now = timezone.now()
+    rows = (
+        OutboundEmail(to_email=email, subject=subject, template_name=template_name,
+                      context=context, next_attempt_at=now)
+        for email, context in recipients if email
+    )
+    return len(OutboundEmail.objects.bulk_create(rows, batch_size=batch_size))
+def _backoff(attempts):
+    base = getattr(settings, 'EMAIL_OUTBOX_BACKOFF_SECONDS', 30)
+    return datetime.timedelta(seconds=base * (2 ** (attempts - 1)))
+def _claim_batch(batch_size):
+    """
+    Leases up to `batch_size` due emails by pushing their next_attempt_at forward.
+    A worker that dies mid-batch leaves the rows to be picked up again once the lease expires.
+    """
+    now = timezone.now()
+    lease = datetime.timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_LEASE_SECONDS', 300))
+    with transaction.atomic():
+        ids = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if ids:
+            OutboundEmail.objects.filter(id__in=ids).update(
+                next_attempt_at=now + lease, attempts=F('attempts') + 1,
+            )
+    return list(OutboundEmail.objects.filter(id__in=ids).order_by('id'))
+def _build_message(email, connection):
+    html_message = render_to_string(email.template_name, email.context)
+    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@edustream.com')
+    message = EmailMultiAlternatives(
+        email.subject, strip_tags(html_message), from_email, [email.to_email], connection=connection,
+    )
+    message.attach_alternative(html_message, 'text/html')
+    return message
+def _fail(email, error, max_attempts):
+    """Records a failed attempt, rescheduling the email with backoff or giving up on it."""
+    email.last_error = str(error)
+    if email.attempts >= max_attempts:
+        email.status = 'failed'
+    else:
+        email.next_attempt_at = timezone.now() + _backoff(email.attempts)
+    email.save(update_fields=['status', 'next_attempt_at', 'last_error'])
+    metrics.log_event(
+        logger, 'outbox_send_failed', logging.WARNING,
+        email_id=email.id, attempts=email.attempts, status=email.status, error=error,
+    )
+def deliver_batch(batch_size=None, max_attempts=None):
+    """
+    Sends one batch of due outbox emails over a single SMTP connection.
+    Returns a (sent, failed) tuple; failed emails are rescheduled with exponential backoff
+    until they reach `max_attempts`. If the SMTP server cannot be reached, every claimed email
+    counts as a failed attempt rather than the error escaping to the worker loop.
+    """
+    batch_size = batch_size or getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 100)
+    max_attempts = max_attempts or getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    emails = _claim_batch(batch_size)
+    if not emails:
+        return 0, 0
+    sent_ids, failed = [], 0
+    connection = get_connection(fail_silently=False)
+    try:
+        pending = iter(emails)
+        try:
+            connection.open()
+        except Exception as e:
+            for email in pending:
+                _fail(email, e, max_attempts)
+            return 0, len(emails)
+        for email in pending:
+            try:
+                with metrics.timed('smtp', 'outbox'):
+                    _build_message(email, connection).send()
+                sent_ids.append(email.id)
+            except Exception as e:
+                failed += 1
+                _fail(email, e, max_attempts)
+                # The SMTP session may be unusable after an error; start a fresh one.
+                # If that fails too, the rest of the batch is rescheduled like the failed email.
+                try:
+                    connection.close()
+                    connection.open()
+                except Exception as e:
+                    for email in pending:
+                        failed += 1
+                        _fail(email, e, max_attempts)
+    finally:
+        connection.close()
+    if sent_ids:
+        OutboundEmail.objects.filter(id__in=sent_ids).update(
+            status='sent', sent_at=timezone.now(), last_error='',
+        )
+    return len(sent_ids), failed
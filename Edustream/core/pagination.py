@@ -0,0 +1,104 @@
+# core/pagination.py
+"""
+Keyset (cursor) pagination. Pages are addressed by the sort key of the last/first row
+rather than an OFFSET, so every page costs one indexed range scan however deep it is.
+"""
+import base64
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+class KeysetPage:
+    def __init__(self, object_list, params, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self._params = params
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+    def __iter__(self):
+        return iter(self.object_list)
+    def __len__(self):
+        return len(self.object_list)
+    def __bool__(self):
+        return bool(self.object_list)
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+    def _query(self, key, cursor):
+        params = self._params.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params[key] = cursor
+        return params.urlencode()
+    @property
+    def next_query(self):
+        return self._query('after', self.next_cursor)
+    @property
+    def previous_query(self):
+        return self._query('before', self.previous_cursor)
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode().rstrip('=')
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) and len(values) == 2 else None
+def _ordering_field(queryset, path):
+    # Annotations (e.g. the catalog's search_rank) sort by their output field.
+    if path in queryset.query.annotations:
+        return queryset.query.annotations[path].output_field
+    model, parts = queryset.model, path.split('__')
+    for part in parts[:-1]:
+        model = model._meta.get_field(part).related_model
+    return model._meta.get_field(parts[-1])
+def _cursor_values(cursor, queryset, field):
+    """
+    Decodes a cursor into its (value, pk) sort key, converted to the ordering field's type.
+    Cursors come from the query string, so anything that does not convert is treated as absent.
+    """
+    values = decode_cursor(cursor)
+    if values is None or None in values:
+        return None
+    try:
+        return [_ordering_field(queryset, field).to_python(values[0]), queryset.model._meta.pk.to_python(values[1])]
+    except (ValidationError, ValueError, TypeError):
+        return None
+def _key_values(obj, field):
+    value = obj
+    for part in field.split('__'):
+        value = getattr(value, part)
+    return [value, obj.pk]
+def _seek(field, descending, value, pk, forward):
+    """Builds the (field, pk) row comparison for rows after (forward) or before the cursor."""
+    op = 'lt' if descending == forward else 'gt'
+    return Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'pk__{op}': pk})
+def keyset_paginate(request, queryset, ordering, per_page):
+    """
+    Returns a KeysetPage of `queryset` sorted by `ordering` (e.g. 'title' or '-created_at')
+    with the primary key as tie-breaker. The cursor is read from ?after= or ?before=.
+    """
+    descending = ordering.startswith('-')
+    field = ordering.lstrip('-')
+    after = _cursor_values(request.GET.get('after', ''), queryset, field)
+    before = None if after else _cursor_values(request.GET.get('before', ''), queryset, field)
+    forward = before is None
+    order = [f'-{field}', '-pk'] if descending == forward else [field, 'pk']
+    if after:
+        queryset = queryset.filter(_seek(field, descending, after[0], after[1], True))
+    elif before:
+        queryset = queryset.filter(_seek(field, descending, before[0], before[1], False))
+    rows = list(queryset.order_by(*order)[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+    next_cursor = previous_cursor = None
+    if rows:
+        if has_more or not forward:
+            next_cursor = encode_cursor(_key_values(rows[-1], field))
+        if (has_more and not forward) or after:
+            previous_cursor = encode_cursor(_key_values(rows[0], field))
+    return KeysetPage(rows, request.GET, next_cursor, previous_cursor)
@@ -0,0 +1,106 @@
+# core/profiling.py
+"""
+Opt-in request profiler for staff. Add `?_profile=1` to a URL (or send `X-Profile: 1`) and
+the view runs under cProfile with every SQL statement recorded. The stats are dumped in
+pstats format under PROFILER_DIR (open them with snakeviz, or convert to a flamegraph with
+flameprof/gprof2dot) and a summary of the top functions and queries replaces the response.
+Untriggered requests only pay for a query-string and header check; the user is not even loaded.
+Streamed response bodies are produced after the view returns and are not profiled. Under
+ASGI a profiled request runs in a worker thread; an async view's sync_to_async() work is
+profiled with it, its awaits on the event loop are not.
+"""
+import cProfile
+import json
+import pstats
+import re
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.shortcuts import render
+from django.utils import timezone
+QUERY_FLAG = '_profile'
+HEADER = 'HTTP_X_PROFILE'
+DUMP_NAME_RE = re.compile(r'^[\w-]+\.prof$')
+def profile_dir():
+    path = Path(getattr(settings, 'PROFILER_DIR', Path(settings.BASE_DIR) / 'profiles'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+class QueryRecorder:
+    """A connection execute wrapper that keeps each statement with its duration."""
+    def __init__(self):
+        self.queries = []
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias, 'sql': sql, 'params': repr(params),
+                'seconds': time.perf_counter() - started,
+            })
+def _top_functions(profiler, limit):
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, name), (calls, total_calls, own_time, cumulative, _) in stats.stats.items():
+        rows.append({
+            'function': f"{filename}:{line}({name})", 'calls': total_calls, 'primitive_calls': calls,
+            'own_time': own_time, 'cumulative': cumulative,
+        })
+    rows.sort(key=lambda row: row['cumulative'], reverse=True)
+    return rows[:limit]
+def _save(profiler, queries, request):
+    stamp = timezone.now().strftime('%Y%m%d-%H%M%S')
+    view = getattr(request.resolver_match, 'url_name', None) or 'unmatched'
+    name = f"{stamp}-{view}-{uuid.uuid4().hex[:8]}.prof"
+    directory = profile_dir()
+    profiler.dump_stats(directory / name)
+    (directory / f"{name}.sql.json").write_text(json.dumps(queries, indent=1))
+    return name
+def _requested(request):
+    return any(flag not in (None, '', '0') for flag in (request.GET.get(QUERY_FLAG), request.META.get(HEADER)))
+class ProfilerMiddleware:
+    sync_capable = True
+    async_capable = True
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not _requested(request) or not request.user.is_staff:
+            return self.get_response(request)
+        return self._profile(request, self.get_response)
+    async def __acall__(self, request):
+        if not _requested(request) or not (await request.auser()).is_staff:
+            return await self.get_response(request)
+        # The async view's thread-sensitive ORM calls come back to this thread, so its
+        # connections, and the recorder on them, see the queries.
+        return await sync_to_async(self._profile)(request, async_to_sync(self.get_response))
+    def _profile(self, request, get_response):
+        recorder = QueryRecorder()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(recorder))
+            response = profiler.runcall(get_response, request)
+        elapsed = time.perf_counter() - started
+        name = _save(profiler, recorder.queries, request)
+        repeated = Counter(query['sql'] for query in recorder.queries)
+        context = {
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'elapsed': elapsed,
+            'dump_name': name,
+            'functions': _top_functions(profiler, getattr(settings, 'PROFILER_TOP_FUNCTIONS', 40)),
+            'queries': sorted(recorder.queries, key=lambda query: query['seconds'], reverse=True),
+            'query_seconds': sum(query['seconds'] for query in recorder.queries),
+            'repeated_queries': [(sql, count) for sql, count in repeated.most_common() if count > 1],
+        }
+        return render(request, 'profiling/summary.html', context)
@@ -0,0 +1,71 @@
+# core/search.py
+"""
+Full-text course search backed by an SQLite FTS5 table (core_course_search).
+The table is created by migration 0003, read through the unmanaged CourseSearchEntry
+model, kept in sync by the signal handlers in core/signals.py and can be rebuilt with
+`python manage.py rebuild_search_index`. On databases without FTS5 the catalog falls
+back to the original icontains filter.
+"""
+import re
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+SEARCH_TABLE = 'core_course_search'
+_INDEX_SELECT = (
+    "SELECT c.id, c.title, c.description, u.username, COALESCE(cat.name, '') "
+    "FROM core_course c "
+    "JOIN core_user u ON u.id = c.teacher_id "
+    "LEFT JOIN core_category cat ON cat.id = c.category_id"
+)
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_enabled_aliases = set()
+def is_enabled(using=None):
+    conn = using or connection
+    if conn.alias in _enabled_aliases:
+        return True
+    if conn.vendor != 'sqlite' or SEARCH_TABLE not in conn.introspection.table_names():
+        return False
+    _enabled_aliases.add(conn.alias)
+    return True
+def rebuild_index(using=None):
+    conn = using or connection
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}(rowid, title, description, teacher, category) {_INDEX_SELECT}")
+def index_courses(course_ids=None, category_id=None):
+    """Re-indexes the given courses, or every course in `category_id`."""
+    if not is_enabled():
+        return
+    if course_ids is not None:
+        ids = [int(pk) for pk in course_ids]
+        if not ids:
+            return
+        where, params = f"c.id IN ({', '.join(['%s'] * len(ids))})", ids
+    else:
+        where, params = "c.category_id = %s", [category_id]
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN (SELECT c.id FROM core_course c WHERE {where})", params)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}(rowid, title, description, teacher, category) {_INDEX_SELECT} WHERE {where}", params)
+def remove_course(course_id):
+    if not is_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [course_id])
+def build_match_query(query):
+    """Turns free text into an FTS5 query where every word is a quoted prefix term."""
+    return ' '.join(f'"{token}"*' for token in _TOKEN_RE.findall(query))
+def search_courses(queryset, query):
+    """Filters a Course queryset by `query` and orders it by search relevance (bm25, best first)."""
+    if not is_enabled():
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(description__icontains=query) |
+            Q(teacher__username__icontains=query) |
+            Q(category__name__icontains=query)
+        )
+    match = build_match_query(query)
+    if not match:
+        # Keep the annotation: the catalog orders and paginates by it.
+        return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+    # Joining the index keeps the MATCH, the caller's filters and the ordering in one query,
+    # so the catalog's keyset pagination can page through every match.
+    return queryset.filter(search_entry__document__match=match).annotate(search_rank=F('search_entry__rank')).order_by('search_rank')
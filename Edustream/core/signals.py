@@ -0,0 +1,82 @@
+# core/signals.py
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from . import course_cache, course_counters, enrollment_cache, metrics, search
+from .models import Category, Course, CourseContent, Enrollment, User
+# --- Course search index, course page cache and Course.updated_at ---
+def touch_courses(course_ids):
+    """Moves updated_at forward for courses whose related data changed (read by the catalog API's ETags)."""
+    Course.objects.filter(pk__in=list(course_ids)).update(updated_at=timezone.now())
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, **kwargs):
+    search.index_courses(course_ids=[instance.pk])
+    course_cache.bump([instance.pk])
+@receiver(post_delete, sender=Course)
+def course_deleted(sender, instance, **kwargs):
+    search.remove_course(instance.pk)
+    course_cache.bump([instance.pk])
+@receiver(post_save, sender=CourseContent)
+@receiver(post_delete, sender=CourseContent)
+def course_content_changed(sender, instance, origin=None, **kwargs):
+    if not (isinstance(origin, Course) or getattr(origin, 'model', None) is Course):
+        touch_courses([instance.course_id])
+    course_cache.bump([instance.course_id])
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    if not created:
+        search.index_courses(category_id=instance.pk)
+        course_ids = list(instance.courses.values_list('id', flat=True))
+        touch_courses(course_ids)
+        course_cache.bump(course_ids)
+@receiver(pre_delete, sender=Category)
+def remember_category_courses(sender, instance, **kwargs):
+    # Courses are detached with a bulk SET_NULL update, which sends no Course signals.
+    instance._detached_course_ids = list(instance.courses.values_list('id', flat=True))
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    course_ids = getattr(instance, '_detached_course_ids', [])
+    search.index_courses(course_ids=course_ids)
+    touch_courses(course_ids)
+    course_cache.bump(course_ids)
+@receiver(post_save, sender=User)
+def teacher_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Logins save last_login with update_fields; only a username change affects courses.
+    if created or instance.user_type != 'teacher' or (update_fields and 'username' not in update_fields):
+        return
+    course_ids = list(instance.courses_taught.values_list('id', flat=True))
+    search.index_courses(course_ids=course_ids)
+    touch_courses(course_ids)
+    course_cache.bump(course_ids)
+# --- Enrollment cache ---
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def invalidate_enrollment_cache(sender, instance, **kwargs):
+    enrollment_cache.invalidate(instance.student_id)
+# --- Course enrollment counters ---
+@receiver(post_save, sender=Enrollment)
+def count_enrollment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    amount = instance.amount_paid or 0
+    if created:
+        course_counters.apply(instance.course_id, 1, int(instance.completed), amount)
+    elif getattr(instance, '_loaded_counters', None):
+        was_completed, old_amount = instance._loaded_counters
+        course_counters.apply(
+            instance.course_id,
+            completed=int(instance.completed) - int(was_completed) if was_completed is not None else 0,
+            revenue=amount - (old_amount or 0),
+        )
+    instance._loaded_counters = (instance.completed, instance.amount_paid)
+@receiver(post_delete, sender=Enrollment)
+def count_enrollment_deleted(sender, instance, origin=None, **kwargs):
+    # A deleted course takes its enrollments with it; there are no counters left to update.
+    if isinstance(origin, Course) or getattr(origin, 'model', None) is Course:
+        return
+    course_counters.apply(instance.course_id, -1, -int(instance.completed), -(instance.amount_paid or 0))
+# --- Request SQL metrics ---
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    metrics.install_query_counter(connection)
@@ -0,0 +1,90 @@
+# core/testing.py
+"""
+Helpers for the per-view query and wall-time budget tests in */tests.py.
+
+Views are measured on the cold path (the test settings swap in DummyCache), so a budget
+covers what a request costs when nothing is cached. assertConstantQueries() catches N+1
+regressions by growing the data between two requests and requiring the same query count.
+"""
+import tempfile
+import time
+from pathlib import Path
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from .models import Category, Course, CourseContent, Enrollment, User
+TEST_MEDIA_ROOT = Path(tempfile.gettempdir()) / 'edustream-test-media'
+FAST_TEST_SETTINGS = override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    OTP_EMAIL_ASYNC=False,
+    MEDIA_ROOT=TEST_MEDIA_ROOT,
+    CHUNKED_UPLOAD_TEMP_DIR=TEST_MEDIA_ROOT / 'chunked_uploads',
+    PROFILER_DIR=TEST_MEDIA_ROOT / 'profiles',
+)
+PASSWORD = 'budget-pass-123'
+def make_users(prefix, count, user_type='student'):
+    password = make_password(PASSWORD)
+    User.objects.bulk_create([
+        User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', user_type=user_type, password=password)
+        for i in range(count)
+    ])
+    return list(User.objects.filter(username__startswith=prefix, user_type=user_type).order_by('id'))
+def make_courses(teacher, count, categories=(), contents_per_course=0, prefix='Course'):
+    courses = Course.objects.bulk_create([
+        Course(
+            teacher=teacher, title=f'{prefix} {teacher.username} {i}', description=f'Description {i} ' * 20,
+            price=Decimal('19.99'), category=categories[i % len(categories)] if categories else None,
+        )
+        for i in range(count)
+    ])
+    contents = [
+        CourseContent(course=course, title=f'Lesson {j}', content_type='text', text_content='Lorem ipsum ' * 50, order=j)
+        for course in courses for j in range(contents_per_course)
+    ]
+    for content in contents:
+        content.render_text()
+    CourseContent.objects.bulk_create(contents)
+    return courses
+def make_categories(count, prefix='Category'):
+    return Category.objects.bulk_create([Category(name=f'{prefix} {i}') for i in range(count)])
+def enroll(students, courses):
+    Enrollment.objects.bulk_create(
+        [Enrollment(student=student, course=course) for student in students for course in courses],
+        ignore_conflicts=True,
+    )
+class QueryBudgetMixin:
+    """Mixed into TestCase classes; `time_budget` is the default wall-time limit per request in seconds."""
+    time_budget = 1.0
+    def measure(self, url, method='get', data=None, **extra):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = getattr(self.client, method)(url, data, **extra)
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        return response, captured.captured_queries, elapsed
+    def assertWithinBudget(self, url, max_queries, method='get', data=None, status=200, time_budget=None, **extra):
+        response, queries, elapsed = self.measure(url, method, data, **extra)
+        self.assertEqual(response.status_code, status, f"{method.upper()} {url} returned {response.status_code}")
+        self.assertLessEqual(
+            len(queries), max_queries,
+            f"{method.upper()} {url} ran {len(queries)} queries (budget {max_queries}):\n"
+            + '\n'.join(q['sql'] for q in queries),
+        )
+        budget = time_budget or self.time_budget
+        self.assertLessEqual(elapsed, budget, f"{method.upper()} {url} took {elapsed:.3f}s (budget {budget}s)")
+        return response
+    def assertConstantQueries(self, url, grow, method='get', data=None, **extra):
+        """Requests `url`, calls grow() to add rows, requests again and requires equal query counts."""
+        _, before, _ = self.measure(url, method, data, **extra)
+        grow()
+        _, after, _ = self.measure(url, method, data, **extra)
+        self.assertEqual(
+            len(before), len(after),
+            f"{url} query count grew from {len(before)} to {len(after)} with more rows (N+1?):\n"
+            + '\n'.join(q['sql'] for q in after),
+        )
@@ -1,2 +1,374 @@
 # core/tests.py
-from django.test import TestCase
+import datetime
+import socket
+import threading
+from unittest import mock
+from decimal import Decimal
+from io import StringIO
+from django.core import mail
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import URLPattern, get_resolver
+from django.utils import timezone
+from . import checks, course_counters, db_router, db_writes, enrollment_cache, markup, otp_delivery, otp_store, outbox, profiling, search
+from .metrics import timed
+from .models import Course, CourseContent, Enrollment, OutboundEmail, User
+from .testing import FAST_TEST_SETTINGS, PASSWORD, QueryBudgetMixin, enroll, make_categories, make_courses, make_users
+# Every named route in these URLconfs must be driven by a budget test in one of the apps.
+BUDGETED_URL_MODULES = ('core.urls', 'student.urls', 'teacher.urls')
+BUDGETED_URL_NAMES = {
+    'signup', 'login', 'verify_otp', 'logout',
+    'student_dashboard', 'course_list', 'course_detail', 'course_purchase', 'course_content_access',
+    'view_content_detail', 'download_content_file', 'paypal_return', 'paypal_cancel', 'paypal_webhook',
+    'teacher_dashboard', 'course_create', 'course_update', 'course_delete', 'course_content_manage',
+    'course_content_edit', 'course_content_delete', 'course_content_reorder',
+    'course_students_view', 'course_roster_export', 'course_enrollment_import',
+    'teacher_analytics', 'upload_start', 'upload_chunk',
+    'api_catalog', 'api_course_detail', 'api_course_contents',
+}
+class URLCoverageTests(TestCase):
+    def test_every_view_has_a_budget(self):
+        for module in BUDGETED_URL_MODULES:
+            for pattern in get_resolver(module).url_patterns:
+                if isinstance(pattern, URLPattern):
+                    self.assertIn(pattern.name, BUDGETED_URL_NAMES, f"{module}:{pattern.name} has no query budget test")
+@FAST_TEST_SETTINGS
+class AuthViewBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = make_users('budget_student', 1)[0]
+    def test_signup_and_login_pages(self):
+        self.assertWithinBudget('/accounts/signup/', 0)
+        self.assertWithinBudget('/accounts/login/', 0)
+    def test_login_post_sends_otp(self):
+        # Session load/save plus the user lookup; the OTP itself must not write the User row.
+        self.assertWithinBudget(
+            '/accounts/login/', 6, method='post', status=302,
+            data={'username': self.student.username, 'password': PASSWORD},
+        )
+    def test_verify_otp_page(self):
+        session = self.client.session
+        session['user_id_for_otp'] = self.student.id
+        session['email_for_otp'] = self.student.email
+        session.save()
+        self.assertWithinBudget('/accounts/verify-otp/', 2)
+    def test_logout(self):
+        self.client.force_login(self.student)
+        self.assertWithinBudget('/accounts/logout/', 4, status=302)
+METRICS_AUTH = {'Authorization': 'Bearer scrape-token'}
+@FAST_TEST_SETTINGS
+@override_settings(METRICS_TOKEN='scrape-token')
+class MetricsTests(TestCase):
+    def test_requests_are_recorded_by_url_name(self):
+        self.client.get('/accounts/login/')
+        body = self.client.get('/metrics', headers=METRICS_AUTH).content.decode()
+        self.assertIn('edustream_http_request_duration_seconds_bucket{view="login",method="GET",le="+Inf"}', body)
+        self.assertIn('edustream_http_requests_total{view="login",method="GET",status="200"}', body)
+        self.assertIn('# TYPE edustream_db_queries_per_request histogram', body)
+    def test_outbound_calls_are_timed(self):
+        with self.assertRaises(ValueError), timed('smtp', 'test'):
+            raise ValueError
+        body = self.client.get('/metrics', headers=METRICS_AUTH).content.decode()
+        self.assertIn('edustream_external_call_duration_seconds_count{service="smtp",operation="test",outcome="error"}', body)
+    def test_scrapes_need_staff_or_the_token(self):
+        # Loopback is no exception: behind a proxy every request would qualify.
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 403)
+        with self.settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer '}).status_code, 403)
+        staff = make_users('metrics_staff', 1)[0]
+        User.objects.filter(pk=staff.pk).update(is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+@FAST_TEST_SETTINGS
+class ProfilerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = make_users('budget_staff', 1)[0]
+        cls.staff.is_staff = True
+        cls.staff.save()
+    def test_staff_get_summary_and_dump(self):
+        self.client.force_login(self.staff)
+        response = self.client.get('/student/dashboard/', {'_profile': '1'})
+        self.assertTemplateUsed(response, 'profiling/summary.html')
+        name = response.context['dump_name']
+        self.assertTrue((profiling.profile_dir() / name).is_file())
+        self.assertTrue(response.context['queries'])
+        download = self.client.get(f'/profiles/{name}')
+        self.assertEqual(download.status_code, 200)
+        b''.join(download.streaming_content)
+        self.assertEqual(self.client.get('/profiles/..%2Fsettings.py').status_code, 404)
+    def test_false_flags_do_not_profile(self):
+        self.client.force_login(self.staff)
+        for flag in ('0', ''):
+            response = self.client.get('/student/dashboard/', {'_profile': flag}, HTTP_X_PROFILE=flag)
+            self.assertTemplateNotUsed(response, 'profiling/summary.html')
+    def test_flag_is_ignored_for_other_users(self):
+        self.client.force_login(make_users('budget_student', 1)[0])
+        response = self.client.get('/student/dashboard/', HTTP_X_PROFILE='1')
+        self.assertTemplateNotUsed(response, 'profiling/summary.html')
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'otp-tests'}})
+@FAST_TEST_SETTINGS
+@override_settings(OTP_MAX_ATTEMPTS=2, OTP_ISSUE_RATE_LIMIT=(2, 900))
+class OTPStoreTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_users('otp_user', 1)[0]
+    def tearDown(self):
+        caches['default'].clear()
+    def test_issue_rate_limit(self):
+        for store_class in (otp_store.CacheOTPStore, otp_store.DatabaseOTPStore):
+            with self.subTest(store_class.__name__):
+                caches['default'].clear()
+                self.assertEqual([store_class().allow_issue(self.user.pk) for _ in range(3)], [True, True, False])
+    def test_attempts_lock_the_otp(self):
+        for store_class in (otp_store.CacheOTPStore, otp_store.DatabaseOTPStore):
+            with self.subTest(store_class.__name__):
+                store = store_class()
+                store.issue(self.user.pk, '123456')
+                self.assertEqual(store.verify(self.user.pk, '000000'), otp_store.INVALID)
+                self.assertEqual(store_class().verify(self.user.pk, '000000'), otp_store.INVALID)
+                self.assertEqual(store.verify(self.user.pk, '123456'), otp_store.LOCKED)
+                store.issue(self.user.pk, '654321')
+                self.assertEqual(store.verify(self.user.pk, '654321'), otp_store.VALID)
+                self.assertEqual(store.verify(self.user.pk, '654321'), otp_store.EXPIRED)
+    def test_cache_store_leaves_the_user_row_alone(self):
+        with self.assertNumQueries(0):
+            otp_store.CacheOTPStore().issue(self.user.pk, '123456')
+        self.assertIsNone(User.objects.get(pk=self.user.pk).email_otp)
+    def test_database_store_keeps_only_a_hash(self):
+        store = otp_store.DatabaseOTPStore()
+        store.issue(self.user.pk, '123456')
+        stored = User.objects.get(pk=self.user.pk).email_otp
+        self.assertNotIn('123456', stored)
+        self.assertEqual(store.verify(self.user.pk, stored), otp_store.INVALID)
+        self.assertEqual(store.verify(self.user.pk, '123456'), otp_store.VALID)
+    def test_non_atomic_caches_are_refused(self):
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'otp'}}):
+            with self.assertRaises(ImproperlyConfigured):
+                otp_store.get_otp_store()
+            self.assertEqual([error.id for error in checks.check_shared_cache(None)], ['core.E001'])
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost'}}):
+            self.assertEqual(checks.check_shared_cache(None), [])
+def _closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+@override_settings(OTP_EMAIL_ASYNC=True, CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'otp-delivery-tests'}})
+@FAST_TEST_SETTINGS
+class OTPDeliveryTests(TestCase):
+    def test_full_pool_asks_for_a_new_otp_without_storing_the_code(self):
+        with mock.patch.object(otp_delivery, '_slots', threading.BoundedSemaphore(1)) as slots, \
+                mock.patch.object(otp_delivery, 'send_otp_email') as send:
+            slots.acquire()
+            otp_delivery.dispatch_otp_email(1, 'student@example.com', '424242')
+        send.assert_not_called()
+        self.assertEqual(otp_delivery.get_delivery_status(1), 'retry')
+        self.assertFalse(OutboundEmail.objects.exists())
+@FAST_TEST_SETTINGS
+@override_settings(EMAIL_OUTBOX_BACKOFF_SECONDS=30, EMAIL_OUTBOX_LEASE_SECONDS=300)
+class OutboxTests(TestCase):
+    def queue(self, count):
+        return outbox.queue_emails('Hello', 'emails/new_topic_notification.html', [(f'to{i}@example.com', {'course_pk': 1}) for i in range(count)])
+    def test_claim_leases_due_emails(self):
+        self.queue(3)
+        OutboundEmail.objects.filter(to_email='to2@example.com').update(next_attempt_at=timezone.now() + datetime.timedelta(hours=1))
+        claimed = outbox._claim_batch(10)
+        self.assertEqual([email.to_email for email in claimed], ['to0@example.com', 'to1@example.com'])
+        self.assertTrue(all(email.attempts == 1 and email.next_attempt_at > timezone.now() for email in claimed))
+        # Leased rows are not handed to a second worker.
+        self.assertEqual(outbox._claim_batch(10), [])
+    def test_deliver_sends_batch(self):
+        self.queue(3)
+        self.assertEqual(outbox.deliver_batch(batch_size=2), (2, 0))
+        self.assertEqual(outbox.deliver_batch(batch_size=2), (1, 0))
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(OutboundEmail.objects.exclude(status='sent').exists())
+    def test_smtp_down_backs_off_then_gives_up(self):
+        self.queue(2)
+        with self.settings(EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend', EMAIL_HOST='127.0.0.1',
+                           EMAIL_PORT=_closed_port(), EMAIL_USE_TLS=False, EMAIL_TIMEOUT=1):
+            self.assertEqual(outbox.deliver_batch(max_attempts=2), (0, 2))
+            for email in OutboundEmail.objects.all():
+                self.assertEqual(email.status, 'pending')
+                self.assertTrue(email.last_error)
+                self.assertGreater(email.next_attempt_at, timezone.now() + datetime.timedelta(seconds=20))
+            # The worker loop survives the outage and stops once nothing is due.
+            call_command('send_outbox', max_attempts=2, stdout=StringIO())
+            OutboundEmail.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(outbox.deliver_batch(max_attempts=2), (0, 2))
+        self.assertEqual(list(OutboundEmail.objects.values_list('status', 'attempts').distinct()), [('failed', 2)])
+# Applied over FAST_TEST_SETTINGS' DummyCache: these need a real cache.
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'enrollment-tests'}})
+@FAST_TEST_SETTINGS
+class EnrollmentCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        teacher = make_users('cache_teacher', 1, user_type='teacher')[0]
+        cls.courses = make_courses(teacher, 2)
+        cls.student = make_users('cache_student', 1)[0]
+    def cached_in_another_worker(self):
+        # A fresh backend instance on the same store stands in for another worker reading Redis.
+        return caches.create_connection('default').get(f'enrolled_course_ids:{self.student.pk}')
+    def enrolled(self):
+        return enrollment_cache.get_enrolled_course_ids(User.objects.get(pk=self.student.pk))
+    def test_enrollment_changes_invalidate_the_shared_set(self):
+        first, second = self.courses
+        self.assertEqual(self.enrolled(), frozenset())
+        self.assertEqual(self.cached_in_another_worker(), frozenset())
+        enrollment = Enrollment.objects.create(student=self.student, course=first)
+        self.assertIsNone(self.cached_in_another_worker())
+        self.assertEqual(self.enrolled(), {first.pk})
+        enrollment.delete()
+        self.assertEqual(self.enrolled(), frozenset())
+        # Writes without signals go through invalidate_many().
+        enroll([self.student], [second])
+        enrollment_cache.invalidate_many([self.student.pk])
+        self.assertIsNone(self.cached_in_another_worker())
+        self.assertEqual(self.enrolled(), {second.pk})
+@FAST_TEST_SETTINGS
+class CourseSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        teacher = make_users('search_teacher', 1, user_type='teacher')[0]
+        cls.popular, cls.niche = make_categories(2)
+        # Six strong matches in one category rank above the two weak ones in the other.
+        cls.strong = make_courses(teacher, 6, [cls.popular], prefix='Python')
+        Course.objects.filter(pk__in=[course.pk for course in cls.strong]).update(description='python ' * 20)
+        cls.weak = make_courses(teacher, 2, [cls.niche], prefix='Python')
+        cls.student = make_users('search_student', 1)[0]
+        search.rebuild_index()
+    def ids(self, courses):
+        return sorted(course.pk for course in courses)
+    def test_filters_apply_inside_the_ranked_query(self):
+        ranked = list(search.search_courses(Course.objects.all(), 'python'))
+        self.assertEqual(self.ids(ranked[:6]), self.ids(self.strong))
+        self.assertEqual(self.ids(ranked[6:]), self.ids(self.weak))
+        niche = search.search_courses(Course.objects.filter(category=self.niche), 'python')
+        self.assertEqual(self.ids(niche), self.ids(self.weak))
+        self.assertEqual(list(search.search_courses(Course.objects.all(), 'nomatch')), [])
+    def test_catalog_search_skips_enrolled_courses(self):
+        enroll([self.student], self.strong)
+        self.client.force_login(self.student)
+        response = self.client.get('/student/courses/', {'q': 'python'})
+        self.assertEqual(self.ids(response.context['courses']), self.ids(self.weak))
+        response = self.client.get('/student/api/courses/', {'q': 'python', 'category': self.niche.pk})
+        self.assertEqual(sorted(course['id'] for course in response.json()['results']), self.ids(self.weak))
+        self.assertEqual(self.client.get('/student/courses/', {'q': 'nomatch'}).status_code, 200)
+    @override_settings(CATALOG_PAGE_SIZE=3)
+    def test_pagination_reaches_every_match(self):
+        self.client.force_login(self.student)
+        found, url = [], '/student/api/courses/?q=python'
+        while url:
+            body = self.client.get(url).json()
+            found += [course['id'] for course in body['results']]
+            url = body['next']
+        self.assertEqual(sorted(found[:6]), self.ids(self.strong))
+        self.assertEqual(sorted(found[6:]), self.ids(self.weak))
+@FAST_TEST_SETTINGS
+class CourseCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = make_users('counter_teacher', 1, user_type='teacher')[0]
+        cls.course = make_courses(cls.teacher, 1)[0]
+        cls.students = make_users('counter_student', 3)
+    def counters(self):
+        return Course.objects.filter(pk=self.course.pk).values_list('enrollment_count', 'completed_count', 'gross_revenue').get()
+    def test_signals_keep_counters_in_step(self):
+        first = Enrollment.objects.create(student=self.students[0], course=self.course)
+        Enrollment.objects.create(student=self.students[1], course=self.course, amount_paid=Decimal('5.00'))
+        self.assertEqual(self.counters(), (2, 0, Decimal('24.99')))
+        first = Enrollment.objects.get(pk=first.pk)
+        first.completed = True
+        first.save()
+        first.save()
+        self.assertEqual(self.counters(), (2, 1, Decimal('24.99')))
+        first.delete()
+        self.assertEqual(self.counters(), (1, 0, Decimal('5.00')))
+        self.course.delete()
+    def test_reconcile_repairs_bulk_writes(self):
+        enroll(self.students, [self.course])
+        self.assertEqual(self.counters(), (0, 0, Decimal('0')))
+        Enrollment.objects.filter(student=self.students[0]).update(completed=True, amount_paid=Decimal('10'))
+        self.assertEqual(course_counters.reconcile(), 1)
+        self.assertEqual(self.counters(), (3, 1, Decimal('10')))
+        self.assertEqual(course_counters.reconcile(), 0)
+@FAST_TEST_SETTINGS
+class LessonMarkupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = make_users('markup_teacher', 1, user_type='teacher')[0]
+        cls.course = make_courses(cls.teacher, 1)[0]
+    def test_render_escapes_html_and_unsafe_links(self):
+        rendered = markup.render(
+            "# Title\n**Bold** and `<b>code</b>`\nsecond line <script>alert(1)</script>\n\n"
+            "- [docs](https://example.com/a_b_c) [bad](javascript:alert(1))\n- two"
+        )
+        self.assertIn('<h1>Title</h1>', rendered)
+        self.assertIn('<strong>Bold</strong> and <code>&lt;b&gt;code&lt;/b&gt;</code><br>second line', rendered)
+        self.assertIn('&lt;script&gt;', rendered)
+        self.assertIn('<a href="https://example.com/a_b_c"', rendered)
+        self.assertNotIn('javascript:alert', rendered.replace('bad', ''))
+        self.assertNotIn('<script>', rendered)
+        self.assertIn('<li>two</li></ul>', rendered)
+    def test_save_renders_only_when_the_text_changes(self):
+        lesson = CourseContent.objects.create(course=self.course, title='L', content_type='text', text_content='*one*')
+        self.assertEqual(lesson.text_html, '<p><em>one</em></p>')
+        self.assertEqual(lesson.text_hash, markup.content_hash('*one*'))
+        self.assertFalse(lesson.render_text())
+        lesson.text_content = '*two*'
+        lesson.save(update_fields=['text_content'])
+        lesson.refresh_from_db()
+        self.assertEqual((lesson.text_html, lesson.text_hash), ('<p><em>two</em></p>', markup.content_hash('*two*')))
+    def test_render_lessons_backfills_stale_rows(self):
+        CourseContent.objects.bulk_create([
+            CourseContent(course=self.course, title=f'L{i}', content_type='text', text_content=f'**{i}**', order=i)
+            for i in range(5)
+        ])
+        out = StringIO()
+        call_command('render_lessons', batch_size=2, stdout=out)
+        self.assertIn('Rendered 5 of 5 lessons.', out.getvalue())
+        self.assertEqual(CourseContent.objects.get(order=3).text_html, '<p><strong>3</strong></p>')
+        call_command('render_lessons', stdout=out)
+        self.assertIn('Rendered 0 of 5 lessons.', out.getvalue())
+@FAST_TEST_SETTINGS
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(TransactionTestCase):
+    # Two separate SQLite test databases and nothing replicating between them, so a row
+    # written to 'default' is missing on 'replica' and shows where each read went.
+    databases = {'default', 'replica'}
+    def setUp(self):
+        with db_router.routing_scope():
+            self.teacher = make_users('router_teacher', 1, user_type='teacher')[0]
+            self.course = make_courses(self.teacher, 1)[0]
+            self.student = make_users('router_student', 1)[0]
+    def test_routed_reads_use_the_replica_until_a_write(self):
+        with db_router.routing_scope():
+            self.assertFalse(Course.objects.filter(pk=self.course.pk).exists())
+            self.assertTrue(User.objects.filter(pk=self.teacher.pk).exists())
+            with db_router.use_primary():
+                self.assertTrue(Course.objects.filter(pk=self.course.pk).exists())
+            enrollment = Enrollment.objects.create(student=self.student, course=self.course)
+            self.assertEqual(enrollment._state.db, 'default')
+            self.assertTrue(Enrollment.objects.filter(student=self.student).exists())
+    def test_browser_is_pinned_to_the_primary_after_writing(self):
+        self.client.force_login(self.student)
+        response = self.client.post(f'/student/courses/{self.course.pk}/purchase/', {'simulate_submit': '1'})
+        self.assertEqual(response.cookies[db_router.PIN_COOKIE]['max-age'], 10)
+        self.assertContains(self.client.get('/student/dashboard/'), self.course.title)
+        del self.client.cookies[db_router.PIN_COOKIE]
+        self.assertNotContains(self.client.get('/student/dashboard/'), self.course.title)
+class WriteSerializationTests(TransactionTestCase):
+    def test_writers_take_the_lock_and_nested_blocks_reuse_it(self):
+        lock = db_writes._lock('default')
+        with db_writes.serialized():
+            self.assertTrue(lock.locked())
+            self.assertTrue(connection.in_atomic_block)
+            # Already inside a transaction: must not wait on the lock this thread holds.
+            with db_writes.serialized():
+                make_users('serialized', 1)
+        self.assertFalse(lock.locked())
+        self.assertTrue(User.objects.filter(username__startswith='serialized').exists())
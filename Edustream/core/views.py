@@ -1,32 +1,21 @@
 # core/views.py
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib import messages
-from django.core.mail import send_mail
-from django.utils import timezone
 from django.conf import settings 
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden
+import hmac
 import random
-import datetime
 from .forms import UserSignUpForm, EmailOTPForm
 from .models import User
+from . import metrics, otp_store, profiling
+from .otp_delivery import dispatch_otp_email, get_delivery_status
+from .otp_store import get_otp_store
 def generate_otp():
     return str(random.randint(100000, 999999))
-def send_otp_email(email, otp):
-    subject = 'Your EduStream Login OTP'
-    message = (
-        f'Dear User,\n\n'
-        f'Your One-Time Password (OTP) for EduStream login is: {otp}\n\n'
-        f'This OTP is valid for 5 minutes. Please do not share it with anyone.\n\n'
-        f'If you did not request this OTP, please ignore this email.'
-    )
-    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@edustream.com')
-    recipient_list = [email]
-    try:
-        send_mail(subject, message, from_email, recipient_list, fail_silently=False)
-        print(f"OTP email sent to {email}") 
-    except Exception as e:
-        print(f"Failed to send OTP email to {email}: {e}")
 def signup_view(request):
     if request.user.is_authenticated:
         if request.user.user_type == 'teacher':
@@ -44,37 +33,43 @@ def signup_view(request):
     else:
         form = UserSignUpForm()
     return render(request, 'registration/signup.html', {'form': form})
-def login_view(request):
+def _issue_login_otp(user):
+    """Issues a login OTP and hands its email to the background sender; False if rate-limited."""
+    store = get_otp_store()
+    if not store.allow_issue(user.id):
+        return False
+    otp = generate_otp()
+    store.issue(user.id, otp)
+    dispatch_otp_email(user.id, user.email, otp)
+    return True
+async def login_view(request):
     """Handles user login and initiates 2FA OTP process."""
-    if request.user.is_authenticated:
-        if request.user.user_type == 'teacher':
+    # Replacing the lazy request.user saves the template context a second user query.
+    user = request.user = await request.auser()
+    if user.is_authenticated:
+        if user.user_type == 'teacher':
             return redirect('teacher_dashboard')
         else:
             return redirect('student_dashboard')
     if request.method == 'POST':
         form = AuthenticationForm(request, data=request.POST)
-        if form.is_valid():
-            username = form.cleaned_data.get('username')
-            password = form.cleaned_data.get('password')
-            user = authenticate(request, username=username, password=password)
-            if user is not None:
-                # User authenticated, now send OTP for 2FA
-                otp = generate_otp()
-                user.email_otp = otp
-                user.otp_created_at = timezone.now()
-                user.save()
-                send_otp_email(user.email, otp)
-                # Store user ID in session temporarily for OTP verification
-                request.session['user_id_for_otp'] = user.id
-                messages.info(request, 'An OTP has been sent to your email. Please enter it to complete your login.')
-                return redirect('verify_otp')
-            else:
-                messages.error(request, 'Invalid username or password.')
+        # is_valid() authenticates the user (password hash and user query) and keeps them for get_user().
+        if await sync_to_async(form.is_valid)():
+            user = form.get_user()
+            # User authenticated, now send OTP for 2FA
+            if not await sync_to_async(_issue_login_otp)(user):
+                messages.error(request, 'Too many login attempts. Please wait a few minutes and try again.')
+                return await sync_to_async(render)(request, 'registration/login.html', {'form': form})
+            # Store user ID in session temporarily for OTP verification
+            await request.session.aset('user_id_for_otp', user.id)
+            await request.session.aset('email_for_otp', user.email)
+            messages.info(request, 'An OTP has been sent to your email. Please enter it to complete your login.')
+            return redirect('verify_otp')
         else:
             messages.error(request, 'Invalid username or password.')
     else:
         form = AuthenticationForm()
-    return render(request, 'registration/login.html', {'form': form})
+    return await sync_to_async(render)(request, 'registration/login.html', {'form': form})
 
 def verify_otp_view(request):
     """Handles 2FA OTP verification."""
@@ -84,45 +79,46 @@ def verify_otp_view(request):
         messages.error(request, 'Authentication session expired or invalid. Please log in again.')
         return redirect('login')
 
-    try:
-        user = User.objects.get(id=user_id)
-    except User.DoesNotExist:
-        messages.error(request, 'User not found. Please log in again.')
-        # Clear the session key if user doesn't exist to prevent looping
-        if 'user_id_for_otp' in request.session:
-            del request.session['user_id_for_otp']
-        return redirect('login')
-
     if request.method == 'POST':
         form = EmailOTPForm(request.POST)
         if form.is_valid():
-            entered_otp = form.cleaned_data['otp']
-            if user.email_otp == entered_otp:
-                # Check OTP expiry (5 minutes)
-                if user.otp_created_at and (timezone.now() - user.otp_created_at) < datetime.timedelta(minutes=5):
-                    # OTP is valid and not expired
-                    user.email_otp = None  # Clear OTP after successful verification
-                    user.otp_created_at = None
-                    user.save()
-                    login(request, user) 
-                    del request.session['user_id_for_otp']
-                    messages.success(request, 'Login successful!')
-                    if user.user_type == 'teacher':
-                        return redirect('teacher_dashboard')
-                    else:
-                        return redirect('student_dashboard')
+            # The OTP store answers from its own backend (the cache by default) and rate-limits
+            # attempts, so wrong guesses never load or write the User row.
+            result = get_otp_store().verify(user_id, form.cleaned_data['otp'])
+            if result == otp_store.VALID:
+                request.session.pop('user_id_for_otp', None)
+                request.session.pop('email_for_otp', None)
+                try:
+                    user = User.objects.get(id=user_id)
+                except User.DoesNotExist:
+                    messages.error(request, 'User not found. Please log in again.')
+                    return redirect('login')
+                login(request, user)
+                messages.success(request, 'Login successful!')
+                if user.user_type == 'teacher':
+                    return redirect('teacher_dashboard')
+                else:
+                    return redirect('student_dashboard')
+            elif result in (otp_store.EXPIRED, otp_store.LOCKED):
+                if result == otp_store.LOCKED:
+                    messages.error(request, 'Too many incorrect OTP attempts. Please log in again.')
                 else:
                     messages.error(request, 'OTP expired. Please try logging in again.')
-                    # Clear session key to force new login process
-                    if 'user_id_for_otp' in request.session:
-                        del request.session['user_id_for_otp']
-                    return redirect('login')
+                # Clear session keys to force new login process
+                request.session.pop('user_id_for_otp', None)
+                request.session.pop('email_for_otp', None)
+                return redirect('login')
             else:
                 messages.error(request, 'Invalid OTP. Please try again.')
     else:
         form = EmailOTPForm()
 
-    return render(request, 'registration/verify_otp.html', {'form': form, 'email': user.email})
+    context = {
+        'form': form,
+        'email': request.session.get('email_for_otp', ''),
+        'delivery_status': get_delivery_status(user_id),
+    }
+    return render(request, 'registration/verify_otp.html', context)
 
 
 def logout_view(request):
@@ -130,3 +126,20 @@ def logout_view(request):
     logout(request)
     messages.info(request, 'You have been successfully logged out.')
     return redirect('home')
+def _has_metrics_token(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    return bool(token) and hmac.compare_digest(supplied.encode(), token.encode())
+def metrics_view(request):
+    """Prometheus scrape endpoint; open to staff and to scrapers sending `Bearer <METRICS_TOKEN>`."""
+    # No address allowlist: behind a reverse proxy every request comes from the proxy's address.
+    if not (request.user.is_staff or _has_metrics_token(request)):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+@staff_member_required
+def profile_download(request, name):
+    """Downloads a pstats dump written by core.profiling.ProfilerMiddleware."""
+    path = profiling.profile_dir() / name
+    if not profiling.DUMP_NAME_RE.match(name) or not path.is_file():
+        raise Http404("Profile not found.")
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
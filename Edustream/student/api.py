@@ -0,0 +1,102 @@
+# student/api.py
+"""
+Read-only JSON catalog API for the mobile client. Every response carries a strong ETag and a
+Last-Modified derived from Course.updated_at (which the signals in core/signals.py also touch
+when a course's contents, category or teacher change), and the conditional check runs before
+anything is serialized, so an unchanged resource costs one small query and a 304.
+"""
+import hashlib
+from django.conf import settings
+from django.db.models import Count, Max
+from django.http import Http404, JsonResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_safe
+from core import course_cache, search
+from core.models import Course
+from core.pagination import keyset_paginate
+def _catalog_queryset(request):
+    courses = Course.objects.select_related('teacher', 'category')
+    if request.GET.get('category', '').isdigit():
+        courses = courses.filter(category_id=request.GET['category'])
+    query = request.GET.get('q')
+    if query:
+        courses = search.search_courses(courses, query)
+    return courses
+def _catalog_stamp(request):
+    """(latest updated_at, row count) of the filtered catalog, computed once per request."""
+    if not hasattr(request, '_catalog_stamp'):
+        stamp = _catalog_queryset(request).order_by().aggregate(last=Max('updated_at'), count=Count('pk'))
+        request._catalog_stamp = stamp
+    return request._catalog_stamp
+def _catalog_etag(request):
+    stamp = _catalog_stamp(request)
+    # The query string selects the page and filters, so it is part of the representation.
+    last = stamp['last'].timestamp() if stamp['last'] else 0
+    return hashlib.sha1(f"{last}-{stamp['count']}-{request.GET.urlencode()}".encode()).hexdigest()
+def _catalog_last_modified(request):
+    return _catalog_stamp(request)['last']
+def _course_updated_at(request, pk):
+    if not hasattr(request, '_course_updated_at'):
+        request._course_updated_at = Course.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    return request._course_updated_at
+def _course_etag(prefix):
+    def etag(request, pk):
+        updated_at = _course_updated_at(request, pk)
+        return f"{prefix}-{pk}-{updated_at.timestamp()}" if updated_at else None
+    return etag
+def _course_last_modified(request, pk):
+    return _course_updated_at(request, pk)
+def _json(payload):
+    response = JsonResponse(payload)
+    # Clients may keep the body but must revalidate it, which is what makes polling cheap.
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+def _course_summary(course):
+    return {
+        'id': course.pk,
+        'title': course.title,
+        'price': str(course.price),
+        'category': {'id': course.category_id, 'name': course.category.name} if course.category_id else None,
+        'teacher': course.teacher.get_full_name() or course.teacher.username,
+        'updated_at': course.updated_at.isoformat(),
+        'url': reverse('api_course_detail', args=[course.pk]),
+    }
+@require_safe
+@condition(etag_func=_catalog_etag, last_modified_func=_catalog_last_modified)
+def catalog(request):
+    """Lists courses by title (or search rank with ?q=), filtered by ?category=, keyset-paginated."""
+    ordering = 'search_rank' if request.GET.get('q') and search.is_enabled() else 'title'
+    page = keyset_paginate(request, _catalog_queryset(request), ordering, settings.CATALOG_PAGE_SIZE)
+    base = reverse('api_catalog')
+    return _json({
+        'results': [_course_summary(course) for course in page],
+        'next': f"{base}?{page.next_query}" if page.has_next else None,
+        'previous': f"{base}?{page.previous_query}" if page.has_previous else None,
+    })
+@require_safe
+@condition(etag_func=_course_etag('course'), last_modified_func=_course_last_modified)
+def course_detail(request, pk):
+    if _course_updated_at(request, pk) is None:
+        raise Http404("No Course matches the given query.")
+    course = course_cache.get_course(pk)
+    return _json({
+        **_course_summary(course),
+        'description': course.description,
+        'created_at': course.created_at.isoformat(),
+        'contents_url': reverse('api_course_contents', args=[course.pk]),
+    })
+@require_safe
+@condition(etag_func=_course_etag('contents'), last_modified_func=_course_last_modified)
+def course_contents(request, pk):
+    """The lesson outline only; lesson bodies and files stay behind enrollment checks."""
+    if _course_updated_at(request, pk) is None:
+        raise Http404("No Course matches the given query.")
+    course = course_cache.get_course(pk)
+    return _json({
+        'course': course.pk,
+        'contents': [
+            {'id': item.pk, 'title': item.title, 'content_type': item.content_type, 'order': item.order}
+            for item in course_cache.get_contents(course)
+        ],
+    })
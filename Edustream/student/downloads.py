@@ -0,0 +1,104 @@
+# student/downloads.py
+"""
+Serves stored course files with HTTP Range/If-Range support. The caller is responsible for
+access control. With PROTECTED_MEDIA_SERVER set, the bytes are handed off to the front-end
+server via X-Accel-Redirect (nginx) or X-Sendfile (Apache/lighttpd) instead.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+def _chunk_size():
+    return getattr(settings, 'DOWNLOAD_CHUNK_SIZE', 64 * 1024)
+def parse_range(header, size):
+    """
+    Returns (start, end) inclusive for a single-range `bytes=` header, None when the header
+    should be ignored (absent, malformed or multi-range), or 'unsatisfiable'.
+    """
+    match = _RANGE_RE.match(header.strip()) if header else None
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            return 'unsatisfiable'
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return 'unsatisfiable'
+    return start, end
+def _iter_range(file, start, length):
+    try:
+        file.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = file.read(min(_chunk_size(), remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+def _offload(field_file, filename):
+    server = getattr(settings, 'PROTECTED_MEDIA_SERVER', None)
+    response = HttpResponse()
+    if server == 'nginx':
+        internal = getattr(settings, 'PROTECTED_MEDIA_INTERNAL_URL', '/protected-media/')
+        response['X-Accel-Redirect'] = internal.rstrip('/') + '/' + quote(field_file.name)
+    else:
+        response['X-Sendfile'] = field_file.path
+    # Let the front-end server fill in Content-Type, length and ranges.
+    del response['Content-Type']
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+def serve_file(request, field_file):
+    """Returns a 200/206/304/416 response streaming `field_file` in DOWNLOAD_CHUNK_SIZE blocks."""
+    filename = os.path.basename(field_file.name)
+    if getattr(settings, 'PROTECTED_MEDIA_SERVER', None):
+        return _offload(field_file, filename)
+    storage, name = field_file.storage, field_file.name
+    try:
+        size = storage.size(name)
+        last_modified = int(storage.get_modified_time(name).timestamp())
+    except OSError:
+        raise Http404("File not found.")
+    etag = quote_etag(f"{size:x}-{last_modified:x}")
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+    byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    if byte_range and not _if_range_matches(request, etag, last_modified):
+        byte_range = None
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range:
+        start, end = byte_range
+        content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = StreamingHttpResponse(
+            _iter_range(storage.open(name, 'rb'), start, end - start + 1), status=206, content_type=content_type,
+        )
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+    else:
+        response = FileResponse(storage.open(name, 'rb'), as_attachment=True, filename=filename)
+        response.block_size = _chunk_size()
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
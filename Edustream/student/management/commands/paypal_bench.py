@@ -0,0 +1,65 @@
+# student/management/commands/paypal_bench.py
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from student import paypal
+from student.paypal import PayPalError, get_client
+import requests
+class Command(BaseCommand):
+    help = "Measures create+capture checkout throughput through the shared (or, with --async, the async) PayPal client."
+    def add_arguments(self, parser):
+        parser.add_argument('--checkouts', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--async', dest='use_async', action='store_true',
+                            help="Run the checkouts as coroutines on the AsyncPayPalClient used by the ASGI views.")
+    def _checkout(self, client):
+        started = time.perf_counter()
+        try:
+            order = client.create_order({
+                'intent': 'CAPTURE',
+                'purchase_units': [{'amount': {'currency_code': 'USD', 'value': '10.00'}}],
+            })
+            client.capture_order(order['id'])
+        except (PayPalError, requests.exceptions.RequestException):
+            return None
+        return time.perf_counter() - started
+    async def _acheckout(self, client, slots):
+        async with slots:
+            started = time.perf_counter()
+            try:
+                order = await client.create_order({
+                    'intent': 'CAPTURE',
+                    'purchase_units': [{'amount': {'currency_code': 'USD', 'value': '10.00'}}],
+                })
+                await client.capture_order(order['id'])
+            except (PayPalError, requests.exceptions.RequestException):
+                return None
+            return time.perf_counter() - started
+    async def _run_async(self, checkouts, concurrency):
+        client = paypal.get_async_client()
+        slots = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(self._acheckout(client, slots) for _ in range(checkouts)))
+    def handle(self, *args, **options):
+        client = get_client()
+        mode = 'workers'
+        if options['use_async']:
+            transport = 'httpx' if paypal.get_async_client().use_httpx else 'the sync session in threads'
+            mode = f'coroutines over {transport}'
+        self.stdout.write(f"Benchmarking {options['checkouts']} checkouts against {client.api_base} "
+                          f"with {options['concurrency']} {mode}...")
+        started = time.perf_counter()
+        if options['use_async']:
+            results = asyncio.run(self._run_async(options['checkouts'], options['concurrency']))
+        else:
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                results = list(pool.map(lambda _: self._checkout(client), range(options['checkouts'])))
+        elapsed = time.perf_counter() - started
+        latencies = sorted(r for r in results if r is not None)
+        failures = len(results) - len(latencies)
+        self.stdout.write(f"Completed: {len(latencies)}, failed: {failures}, breaker: {client.breaker.state}")
+        self.stdout.write(f"Throughput: {len(latencies) / elapsed:.1f} checkouts/s over {elapsed:.2f}s")
+        if latencies:
+            p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1]
+            self.stdout.write(f"Latency: median {statistics.median(latencies) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms")
@@ -0,0 +1,108 @@
+# student/management/commands/paypal_stub.py
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.core.management.base import BaseCommand
+class StubPayPalHandler(BaseHTTPRequestHandler):
+    """
+    Answers the PayPal endpoints used at checkout and by the webhook worker with sandbox-shaped
+    responses. Orders are kept in memory, so a capture reports the order's amount and
+    custom_id, and a repeated capture replays the first one under the same PayPal-Request-Id.
+    """
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    error_rate = 0.0
+    orders = {}
+    _counter = 0
+    _lock = threading.Lock()
+    def log_message(self, format, *args):
+        pass
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    def _should_fail(self):
+        if not self.error_rate:
+            return False
+        with self._lock:
+            type(self)._counter += 1
+            return self._counter % max(round(1 / self.error_rate), 1) == 0
+    @staticmethod
+    def _public(order):
+        return {key: value for key, value in order.items() if key != 'capture_request_id'}
+    def _capture(self, order_id):
+        with self._lock:
+            order = self.orders.get(order_id)
+            if order is None:
+                return 404, {'name': 'RESOURCE_NOT_FOUND'}
+            request_id = self.headers.get('PayPal-Request-Id')
+            if order['status'] == 'COMPLETED':
+                if request_id and request_id == order['capture_request_id']:
+                    return 201, self._public(order)
+                return 422, {'name': 'UNPROCESSABLE_ENTITY', 'details': [{'issue': 'ORDER_ALREADY_CAPTURED'}]}
+            order['status'], order['capture_request_id'] = 'COMPLETED', request_id
+            for unit in order['purchase_units']:
+                unit['payments'] = {'captures': [{
+                    'id': uuid.uuid4().hex[:17].upper(), 'status': 'COMPLETED',
+                    'amount': unit.get('amount'), 'custom_id': unit.get('custom_id'),
+                }]}
+            return 201, self._public(order)
+    def do_GET(self):
+        if self.path.startswith('/v2/checkout/orders/'):
+            with self._lock:
+                order = self.orders.get(self.path.split('/')[4])
+            if order is not None:
+                return self._reply(200, self._public(order))
+        return self._reply(404, {'name': 'RESOURCE_NOT_FOUND'})
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        # The token request is form-encoded; only the JSON bodies are of interest.
+        body = json.loads(body) if body and 'json' in self.headers.get('Content-Type', '') else {}
+        if self.latency:
+            time.sleep(self.latency)
+        if self._should_fail():
+            return self._reply(503, {'name': 'SERVICE_UNAVAILABLE'})
+        host = self.headers.get('Host', 'localhost')
+        if self.path == '/v1/oauth2/token':
+            return self._reply(200, {'access_token': uuid.uuid4().hex, 'token_type': 'Bearer', 'expires_in': 32400})
+        if self.path == '/v2/checkout/orders':
+            order_id = uuid.uuid4().hex[:17].upper()
+            order = {
+                'id': order_id,
+                # The stub has no buyer, so every order counts as approved.
+                'status': 'APPROVED',
+                'purchase_units': body.get('purchase_units', []),
+                'links': [{'rel': 'approve', 'href': f'http://{host}/checkoutnow?token={order_id}', 'method': 'GET'}],
+            }
+            with self._lock:
+                self.orders[order_id] = {**order, 'capture_request_id': None}
+            return self._reply(201, {**order, 'status': 'CREATED'})
+        if self.path.startswith('/v2/checkout/orders/') and self.path.endswith('/capture'):
+            return self._reply(*self._capture(self.path.split('/')[4]))
+        if self.path == '/v1/notifications/verify-webhook-signature':
+            return self._reply(200, {'verification_status': 'SUCCESS'})
+        return self._reply(404, {'name': 'RESOURCE_NOT_FOUND'})
+class Command(BaseCommand):
+    help = "Runs a local PayPal API stub. Set PAYPAL_API_BASE to its URL to benchmark checkout offline."
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency-ms', type=float, default=0, help="Artificial delay added to every response.")
+        parser.add_argument('--error-rate', type=float, default=0, help="Fraction of requests answered with 503 (0-1).")
+    def handle(self, *args, **options):
+        StubPayPalHandler.latency = options['latency_ms'] / 1000
+        StubPayPalHandler.error_rate = options['error_rate']
+        server = ThreadingHTTPServer((options['host'], options['port']), StubPayPalHandler)
+        self.stdout.write(f"PayPal stub listening on http://{options['host']}:{options['port']} (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
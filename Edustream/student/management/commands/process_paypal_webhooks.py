@@ -0,0 +1,29 @@
+# student/management/commands/process_paypal_webhooks.py
+import time
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from student.webhooks import process_batch
+class Command(BaseCommand):
+    help = "Verifies stored PayPal webhook events and creates the enrollments they pay for, in batches."
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help="Events processed per batch.")
+        parser.add_argument('--max-attempts', type=int, default=None, help="Verification attempts before an event is marked failed.")
+        parser.add_argument('--loop', action='store_true', help="Keep polling for events instead of exiting once the queue is drained.")
+        parser.add_argument('--sleep', type=float, default=5.0, help="Seconds to wait between polls when the queue is empty.")
+    def handle(self, *args, **options):
+        totals = {}
+        while True:
+            try:
+                counts = process_batch(options['batch_size'], options['max_attempts'])
+            except ImproperlyConfigured as e:
+                raise CommandError(str(e))
+            if counts['events']:
+                for key, value in counts.items():
+                    totals[key] = totals.get(key, 0) + value
+                self.stdout.write("Batch: " + ", ".join(f"{value} {key}" for key, value in counts.items()) + ".")
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
+        summary = ", ".join(f"{value} {key}" for key, value in totals.items()) or "nothing to do"
+        self.stdout.write(self.style.SUCCESS(f"Webhook queue drained: {summary}."))
@@ -0,0 +1,275 @@
+# student/paypal.py
+"""
+Shared PayPal REST client: one pooled requests.Session per process, a cached OAuth token,
+connect/read timeouts on every call and a circuit breaker that fails fast while PayPal is
+degraded. Point PAYPAL_API_BASE at `python manage.py paypal_stub` to run checkouts offline.
+AsyncPayPalClient exposes the same calls to the async views; it uses httpx (optional) when
+served through EduStream/asgi.py and the pooled sync session otherwise.
+"""
+import asyncio
+import threading
+import time
+import weakref
+import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from core import metrics
+try:
+    import httpx
+except ImportError:  # optional: only the ASGI transport of AsyncPayPalClient needs it
+    httpx = None
+class PayPalError(requests.exceptions.RequestException):
+    """Raised for PayPal failures; subclasses RequestException so existing handlers catch it."""
+class CircuitOpenError(PayPalError):
+    """Raised without contacting PayPal while the circuit breaker is open."""
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds, then lets a single trial call through (half-open).
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+    def before_call(self):
+        with self._lock:
+            state = self._state()
+            if state == 'open' or (state == 'half-open' and self._trial_in_flight):
+                raise CircuitOpenError("PayPal is temporarily unavailable. Please try again shortly.")
+            if state == 'half-open':
+                self._trial_in_flight = True
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+class PayPalClient:
+    def __init__(self, client_id, secret, api_base, timeout=(3.05, 10), pool_size=10,
+                 failure_threshold=5, reset_timeout=30.0):
+        self.client_id = client_id
+        self.secret = secret
+        self.api_base = api_base.rstrip('/')
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._token = None
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+    def _send(self, method, path, operation, **kwargs):
+        """Sends one request through the breaker; 5xx, timeouts and connection errors count as failures."""
+        self.breaker.before_call()
+        with metrics.timed('paypal', operation) as call:
+            try:
+                response = self.session.request(method, f"{self.api_base}{path}", timeout=self.timeout, **kwargs)
+            except requests.exceptions.RequestException:
+                self.breaker.record_failure()
+                raise
+            if response.status_code >= 500:
+                call.outcome = 'error'
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+        return response
+    def get_access_token(self, force_refresh=False):
+        """Returns a cached OAuth token, fetching a new one shortly before it expires."""
+        with self._token_lock:
+            if not force_refresh and self._token and time.monotonic() < self._token_expires_at:
+                return self._token
+            response = self._send(
+                'POST', '/v1/oauth2/token', 'oauth_token',
+                headers={'Accept': 'application/json', 'Accept-Language': 'en_US'},
+                auth=(self.client_id, self.secret),
+                data={'grant_type': 'client_credentials'},
+            )
+            response.raise_for_status()
+            payload = response.json()
+            # Refresh a minute early so a token never expires mid-checkout.
+            self._token = payload['access_token']
+            self._token_expires_at = time.monotonic() + max(int(payload.get('expires_in', 300)) - 60, 0)
+            return self._token
+    def _api_call(self, method, path, operation, json_body=None, headers=None):
+        for attempt in range(2):
+            response = self._send(
+                method, path, operation, json=json_body,
+                headers={
+                    'Content-Type': 'application/json',
+                    'Authorization': f'Bearer {self.get_access_token(force_refresh=attempt > 0)}',
+                    **(headers or {}),
+                },
+            )
+            # A 401 usually means the cached token was revoked early; refresh it once.
+            if response.status_code != 401:
+                break
+        response.raise_for_status()
+        return response.json()
+    def create_order(self, order_data):
+        return self._api_call('POST', '/v2/checkout/orders', 'create_order', order_data)
+    def capture_order(self, order_id):
+        # The order id as PayPal-Request-Id makes a repeated capture (the buyer's return and the
+        # webhook worker) replay the first capture's response instead of failing.
+        return self._api_call(
+            'POST', f'/v2/checkout/orders/{order_id}/capture', 'capture_order', headers={'PayPal-Request-Id': order_id},
+        )
+    def get_order(self, order_id):
+        return self._api_call('GET', f'/v2/checkout/orders/{order_id}', 'get_order')
+    def verify_webhook_signature(self, webhook_id, headers, event):
+        """Asks PayPal whether a webhook delivery is genuine; `headers` holds its PAYPAL-* headers."""
+        result = self._api_call('POST', '/v1/notifications/verify-webhook-signature', 'verify_webhook', {
+            'auth_algo': headers.get('PAYPAL-AUTH-ALGO'),
+            'cert_url': headers.get('PAYPAL-CERT-URL'),
+            'transmission_id': headers.get('PAYPAL-TRANSMISSION-ID'),
+            'transmission_sig': headers.get('PAYPAL-TRANSMISSION-SIG'),
+            'transmission_time': headers.get('PAYPAL-TRANSMISSION-TIME'),
+            'webhook_id': webhook_id,
+            'webhook_event': event,
+        })
+        return result.get('verification_status') == 'SUCCESS'
+_client = None
+_client_lock = threading.Lock()
+def get_client():
+    """Returns the process-wide PayPalClient, built from settings on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = PayPalClient(
+                    settings.PAYPAL_CLIENT_ID,
+                    settings.PAYPAL_SECRET,
+                    getattr(settings, 'PAYPAL_API_BASE', 'https://api-m.sandbox.paypal.com'),
+                    timeout=getattr(settings, 'PAYPAL_TIMEOUT', (3.05, 10)),
+                    pool_size=getattr(settings, 'PAYPAL_POOL_SIZE', 10),
+                    failure_threshold=getattr(settings, 'PAYPAL_BREAKER_FAILURE_THRESHOLD', 5),
+                    reset_timeout=getattr(settings, 'PAYPAL_BREAKER_RESET_SECONDS', 30),
+                )
+    return _client
+class AsyncPayPalClient:
+    """
+    Async counterpart of PayPalClient, sharing its circuit breaker, OAuth token and metrics.
+    With `use_httpx` (and httpx installed) calls go out on a pooled httpx.AsyncClient, so no
+    thread waits on PayPal. Otherwise they run on the sync client's pooled session in a worker
+    thread: under WSGI every async view gets a new event loop, so a per-loop httpx pool would
+    mean a new TLS handshake per checkout.
+    """
+    def __init__(self, client, pool_size=100, use_httpx=True):
+        self.client = client
+        self.pool_size = pool_size
+        self.use_httpx = use_httpx and httpx is not None
+        # An AsyncClient's connections belong to the event loop that opened them, so each loop
+        # (one per worker under ASGI) gets its own.
+        self._http = weakref.WeakKeyDictionary()
+        self._http_lock = threading.Lock()
+    async def _closer(self, http):
+        # Started once and left suspended: loop shutdown (asyncio.run() and ASGI servers call
+        # shutdown_asyncgens()) closes the generator, which closes the loop's pool.
+        try:
+            yield
+        finally:
+            with self._http_lock:
+                self._http.pop(asyncio.get_running_loop(), None)
+            await http.aclose()
+    async def _http_client(self):
+        loop = asyncio.get_running_loop()
+        with self._http_lock:
+            entry = self._http.get(loop)
+            created = entry is None
+            if created:
+                connect, read = self.client.timeout
+                http = httpx.AsyncClient(
+                    timeout=httpx.Timeout(read, connect=connect),
+                    limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                )
+                entry = self._http[loop] = (http, self._closer(http))
+        if created:
+            await anext(entry[1])
+        return entry[0]
+    async def _send(self, method, path, operation, **kwargs):
+        breaker = self.client.breaker
+        breaker.before_call()
+        http = await self._http_client()
+        with metrics.timed('paypal', operation) as call:
+            try:
+                response = await http.request(method, f"{self.client.api_base}{path}", **kwargs)
+            except httpx.HTTPError as e:
+                breaker.record_failure()
+                raise PayPalError(str(e)) from e
+            if response.status_code >= 500:
+                call.outcome = 'error'
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+        return response
+    async def _access_token(self, force_refresh=False):
+        client = self.client
+        if not force_refresh and client._token and time.monotonic() < client._token_expires_at:
+            return client._token
+        # Token fetches are rare; let the sync client do them under its lock.
+        return await sync_to_async(client.get_access_token, thread_sensitive=False)(force_refresh=force_refresh)
+    async def _api_call(self, method, path, operation, json_body=None, headers=None):
+        if not self.use_httpx:
+            return await sync_to_async(self.client._api_call, thread_sensitive=False)(
+                method, path, operation, json_body, headers,
+            )
+        for attempt in range(2):
+            response = await self._send(
+                method, path, operation, json=json_body,
+                headers={
+                    'Content-Type': 'application/json',
+                    'Authorization': f'Bearer {await self._access_token(force_refresh=attempt > 0)}',
+                    **(headers or {}),
+                },
+            )
+            if response.status_code != 401:
+                break
+        if response.is_error:
+            raise PayPalError(f"PayPal returned HTTP {response.status_code} for {operation}.", response=response)
+        return response.json()
+    async def create_order(self, order_data):
+        return await self._api_call('POST', '/v2/checkout/orders', 'create_order', order_data)
+    async def capture_order(self, order_id):
+        return await self._api_call(
+            'POST', f'/v2/checkout/orders/{order_id}/capture', 'capture_order', headers={'PayPal-Request-Id': order_id},
+        )
+_async_client = None
+def get_async_client():
+    """Returns the process-wide AsyncPayPalClient, wrapping get_client()."""
+    global _async_client
+    if _async_client is None:
+        client = get_client()
+        with _client_lock:
+            if _async_client is None:
+                _async_client = AsyncPayPalClient(
+                    client, getattr(settings, 'PAYPAL_ASYNC_POOL_SIZE', 100),
+                    use_httpx=getattr(settings, 'PAYPAL_ASYNC_HTTP', 'sync') == 'httpx',
+                )
+    return _async_client
+@receiver(setting_changed)
+def _reset_clients(setting, **kwargs):
+    # Rebuilds the clients from settings after override_settings(PAYPAL_...).
+    global _client, _async_client
+    if setting.startswith('PAYPAL_'):
+        _client = _async_client = None
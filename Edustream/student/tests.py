@@ -1,5 +1,349 @@
 # student/tests.py
-
-from django.test import TestCase
-
-# Create your tests here.
+import asyncio
+import json
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+from decimal import Decimal
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models.signals import pre_save
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from core import course_cache, db_writes, search
+from core.pagination import encode_cursor
+from core.models import Course, CourseContent, Enrollment, PayPalWebhookEvent
+from student import paypal, webhooks
+from student.management.commands.paypal_stub import StubPayPalHandler
+from core.testing import (
+    FAST_TEST_SETTINGS, PASSWORD, QueryBudgetMixin, enroll, make_categories, make_courses, make_users,
+)
+@FAST_TEST_SETTINGS
+class StudentViewBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teachers = make_users('budget_teacher', 3, user_type='teacher')
+        cls.categories = make_categories(4)
+        cls.courses = []
+        for teacher in cls.teachers:
+            cls.courses += make_courses(teacher, 10, cls.categories, contents_per_course=5)
+        cls.student, cls.other = make_users('budget_student', 2)
+        enroll([cls.student], cls.courses[:5])
+        cls.course = cls.courses[0]
+        cls.content = cls.course.contents.first()
+        search.rebuild_index()
+    def setUp(self):
+        self.client.force_login(self.student)
+    def test_dashboard(self):
+        self.assertWithinBudget('/student/dashboard/', 3)
+        self.assertConstantQueries('/student/dashboard/', lambda: enroll([self.student], self.courses[5:12]))
+    def test_course_list(self):
+        self.assertWithinBudget('/student/courses/', 5)
+        self.assertConstantQueries(
+            '/student/courses/',
+            lambda: make_courses(self.teachers[1], 5, self.categories, prefix='Extra'),
+        )
+    def test_course_list_search_and_filter(self):
+        # Includes the once-per-process FTS table lookup in search.is_enabled().
+        self.assertWithinBudget('/student/courses/', 7, data={'q': 'cours', 'category': self.categories[0].pk})
+    def test_course_detail(self):
+        self.assertWithinBudget(f'/student/courses/{self.course.pk}/', 4)
+    def test_course_purchase_confirm(self):
+        self.client.force_login(self.other)
+        self.assertWithinBudget(f'/student/courses/{self.course.pk}/purchase/', 4)
+    def test_course_content_access(self):
+        url = f'/student/courses/{self.course.pk}/access/'
+        self.assertWithinBudget(url, 5)
+        self.assertConstantQueries(
+            url,
+            lambda: CourseContent.objects.bulk_create([
+                CourseContent(course=self.course, title=f'More {i}', content_type='text', text_content='x', order=10 + i)
+                for i in range(10)
+            ]),
+        )
+    def test_view_content_detail(self):
+        self.assertWithinBudget(f'/student/courses/{self.course.pk}/content/{self.content.pk}/', 5)
+        lesson = CourseContent.objects.create(
+            course=self.course, title='Markdown', content_type='text', text_content='**Bold** <i>x</i>', order=50,
+        )
+        response = self.client.get(f'/student/courses/{self.course.pk}/content/{lesson.pk}/')
+        self.assertContains(response, '<strong>Bold</strong> &lt;i&gt;x&lt;/i&gt;', html=False)
+    def test_download_content_file(self):
+        content = CourseContent(course=self.course, title='Slides', content_type='file', order=99)
+        content.file.save('budget-slides.pdf', ContentFile(b'%PDF' * 1024))
+        self.assertWithinBudget(
+            f'/student/courses/{self.course.pk}/content/{content.pk}/download/', 4, HTTP_RANGE='bytes=0-99',
+            status=206,
+        )
+        content.file.delete()
+    def test_paypal_return_and_cancel_without_session(self):
+        self.assertWithinBudget('/student/paypal/return/', 3, status=302)
+        self.assertWithinBudget('/student/paypal/cancel/', 3, status=302)
+    def test_paypal_webhook(self):
+        self.client.logout()
+        payload = json.dumps({'id': 'WH-1', 'event_type': 'CHECKOUT.ORDER.COMPLETED', 'resource': {'id': 'ORDER-1'}})
+        # Storing the event is a single INSERT, whether or not it is a redelivery.
+        for _ in range(2):
+            self.assertWithinBudget(
+                '/student/paypal/webhook/', 1, method='post', data=payload, content_type='application/json',
+            )
+# Applied over FAST_TEST_SETTINGS' DummyCache, so the {% cache %} fragments are really stored.
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'fragments'}})
+@FAST_TEST_SETTINGS
+class CourseFragmentCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = make_courses(make_users('fragment_teacher', 1, user_type='teacher')[0], 1)[0]
+        cls.student = make_users('fragment_student', 1)[0]
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.student)
+    def rename(self, title):
+        # A queryset update sends no signals, so only an explicit bump invalidates the fragments.
+        Course.objects.filter(pk=self.course.pk).update(title=title)
+    def test_version_bump_invalidates_the_fragments(self):
+        for url in ('/student/courses/', f'/student/courses/{self.course.pk}/'):
+            self.assertContains(self.client.get(url), self.course.title)
+        self.rename('Renamed course')
+        for url in ('/student/courses/', f'/student/courses/{self.course.pk}/'):
+            self.assertNotContains(self.client.get(url), 'Renamed course')
+        course_cache.bump([self.course.pk])
+        for url in ('/student/courses/', f'/student/courses/{self.course.pk}/'):
+            self.assertContains(self.client.get(url), 'Renamed course')
+    def test_cached_course_holds_only_public_fields(self):
+        course_cache.get_course(self.course.pk)
+        with self.assertNumQueries(0):
+            course = course_cache.get_course(self.course.pk)
+            self.assertEqual(course.teacher.get_full_name() or course.teacher.username, self.course.teacher.username)
+        self.assertTrue({'password', 'email', 'email_otp'} <= course.teacher.get_deferred_fields())
+    @override_settings(COURSE_CACHE_TIMEOUT=0)
+    def test_fragments_use_course_cache_timeout(self):
+        self.client.get('/student/courses/')
+        self.rename('Renamed course')
+        self.assertContains(self.client.get('/student/courses/'), 'Renamed course')
+@FAST_TEST_SETTINGS
+class CatalogApiTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        teacher = make_users('api_teacher', 1, user_type='teacher')[0]
+        cls.categories = make_categories(2)
+        cls.courses = make_courses(teacher, 30, cls.categories, contents_per_course=3)
+        cls.course = cls.courses[0]
+        search.rebuild_index()
+    def test_catalog(self):
+        response = self.assertWithinBudget('/student/api/courses/', 2)
+        body = response.json()
+        self.assertEqual(len(body['results']), 24)
+        self.assertIsNotNone(body['next'])
+        self.assertConstantQueries(
+            '/student/api/courses/',
+            lambda: make_courses(self.course.teacher, 5, self.categories, prefix='Extra'),
+        )
+    def test_search_results_page_by_rank(self):
+        first = self.client.get('/student/api/courses/', {'q': 'course'}).json()
+        second = self.client.get(first['next']).json()
+        ids = [course['id'] for course in first['results'] + second['results']]
+        self.assertEqual(sorted(ids), sorted(course.pk for course in self.courses))
+        self.assertIsNone(second['next'])
+    def test_forged_cursors_return_the_first_page(self):
+        first_page = self.client.get('/student/api/courses/').json()['results']
+        for values in [[None, 'x'], ['Course', 'x'], ['Course', None]]:
+            response = self.client.get('/student/api/courses/', {'after': encode_cursor(values)})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['results'], first_page)
+    def test_course_detail_and_contents(self):
+        detail = self.assertWithinBudget(f'/student/api/courses/{self.course.pk}/', 2).json()
+        self.assertEqual(detail['contents_url'], f'/student/api/courses/{self.course.pk}/contents/')
+        # Stamp, course and contents; the last two come from course_cache outside of tests.
+        contents = self.assertWithinBudget(detail['contents_url'], 3).json()
+        self.assertEqual(len(contents['contents']), 3)
+        self.assertNotIn('text_content', contents['contents'][0])
+        self.client.get('/student/api/courses/999999/')
+        self.assertWithinBudget('/student/api/courses/999999/', 1, status=404)
+    def test_unchanged_resources_return_304_from_one_query(self):
+        for url in (
+            '/student/api/courses/?category=%d' % self.categories[0].pk,
+            f'/student/api/courses/{self.course.pk}/',
+            f'/student/api/courses/{self.course.pk}/contents/',
+        ):
+            response = self.client.get(url)
+            self.assertTrue(response['ETag'].startswith('"'))
+            self.assertIn('Last-Modified', response)
+            not_modified = self.assertWithinBudget(url, 1, status=304, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(not_modified.content, b'')
+            self.assertWithinBudget(url, 1, status=304, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+    def test_lesson_edit_changes_the_etag(self):
+        url = f'/student/api/courses/{self.course.pk}/contents/'
+        etag = self.client.get(url)['ETag']
+        content = self.course.contents.first()
+        content.title = 'Renamed lesson'
+        content.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Renamed lesson', response.content.decode())
+class StubPayPalMixin:
+    """Points the PayPal clients at an in-process paypal_stub server."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = ThreadingHTTPServer(('127.0.0.1', 0), StubPayPalHandler)
+        threading.Thread(target=cls.stub.serve_forever, daemon=True).start()
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.shutdown()
+        cls.stub.server_close()
+        super().tearDownClass()
+    def setUp(self):
+        super().setUp()
+        self.enterContext(override_settings(PAYPAL_API_BASE=f'http://127.0.0.1:{self.stub.server_port}'))
+class AsyncPayPalClientTests(StubPayPalMixin, SimpleTestCase):
+    async def checkout(self, client):
+        order = await client.create_order({'intent': 'CAPTURE', 'purchase_units': [
+            {'amount': {'currency_code': 'USD', 'value': '19.99'}, 'custom_id': '1:1'},
+        ]})
+        return (await client.capture_order(order['id']))['status']
+    @override_settings(PAYPAL_ASYNC_HTTP='sync')
+    def test_wsgi_checkouts_share_the_pooled_session(self):
+        client = paypal.get_async_client()
+        session = paypal.get_client().session
+        with mock.patch.object(session, 'request', wraps=session.request) as request:
+            # Under WSGI every async view call runs in a fresh loop on the request's thread.
+            with ThreadPoolExecutor(4) as executor:
+                statuses = list(executor.map(lambda _: async_to_sync(self.checkout)(client), range(8)))
+        self.assertEqual(statuses, ['COMPLETED'] * 8)
+        # One token fetch plus create and capture per checkout, and no per-loop httpx pools.
+        self.assertEqual(request.call_count, 17)
+        self.assertEqual(len(client._http), 0)
+    @unittest.skipIf(paypal.httpx is None, "httpx is not installed")
+    @override_settings(PAYPAL_ASYNC_HTTP='httpx')
+    def test_each_event_loop_has_one_pool_closed_at_shutdown(self):
+        client = paypal.get_async_client()
+        async def checkout():
+            order = await client.create_order({'intent': 'CAPTURE', 'purchase_units': [
+                {'amount': {'currency_code': 'USD', 'value': '19.99'}, 'custom_id': '1:1'},
+            ]})
+            http = client._http[asyncio.get_running_loop()][0]
+            self.assertEqual((await client.capture_order(order['id']))['status'], 'COMPLETED')
+            self.assertIs(client._http[asyncio.get_running_loop()][0], http)
+            return http
+        # Eight short-lived loops, as if the httpx transport were used under WSGI.
+        with ThreadPoolExecutor(4) as executor:
+            pools = list(executor.map(lambda _: async_to_sync(checkout)(), range(8)))
+        self.assertEqual(len({id(http) for http in pools}), 8)
+        self.assertTrue(all(http.is_closed for http in pools))
+        self.assertEqual(len(client._http), 0)
+@FAST_TEST_SETTINGS
+@override_settings(PAYPAL_WEBHOOK_VERIFY=False)
+class PayPalWebhookQueueTests(StubPayPalMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        teacher = make_users('webhook_teacher', 1, user_type='teacher')[0]
+        cls.course = make_courses(teacher, 1)[0]
+        cls.students = make_users('webhook_student', 3)
+    def deliver(self, event_id, event_type, custom_id, amount='19.99', order_id='ORDER'):
+        amount = {'currency_code': 'USD', 'value': amount}
+        if event_type.startswith('CHECKOUT.ORDER.'):
+            resource = {'id': order_id, 'purchase_units': [{'custom_id': custom_id, 'amount': amount}]}
+        else:
+            resource = {'id': 'CAPTURE', 'custom_id': custom_id, 'amount': amount}
+        payload = {'id': event_id, 'event_type': event_type, 'resource': resource}
+        return self.client.post(
+            '/student/paypal/webhook/', json.dumps(payload), content_type='application/json',
+            HTTP_PAYPAL_TRANSMISSION_ID='t-1',
+        )
+    def test_redeliveries_are_stored_once(self):
+        for _ in range(3):
+            self.assertEqual(self.deliver('WH-A', 'CHECKOUT.ORDER.COMPLETED', '1:1').status_code, 200)
+        event = PayPalWebhookEvent.objects.get()
+        self.assertEqual(event.headers, {'PAYPAL-TRANSMISSION-ID': 't-1'})
+        self.assertEqual(self.client.post('/student/paypal/webhook/', '{}', content_type='application/json').status_code, 400)
+    def test_batch_enrolls_each_buyer_once(self):
+        first, second, third = self.students
+        Enrollment.objects.create(student=third, course=self.course)
+        self.deliver('WH-1', 'CHECKOUT.ORDER.COMPLETED', f'{first.pk}:{self.course.pk}')
+        self.deliver('WH-2', 'PAYMENT.CAPTURE.COMPLETED', f'{first.pk}:{self.course.pk}')
+        self.deliver('WH-3', 'PAYMENT.CAPTURE.COMPLETED', f'{second.pk}:{self.course.pk}', amount='5.00')
+        self.deliver('WH-4', 'PAYMENT.CAPTURE.COMPLETED', f'{third.pk}:{self.course.pk}')
+        self.deliver('WH-5', 'PAYMENT.CAPTURE.COMPLETED', 'not-an-id')
+        self.deliver('WH-6', 'PAYMENT.CAPTURE.COMPLETED', f'{second.pk}:999999')
+        self.deliver('WH-7', 'BILLING.PLAN.CREATED', '')
+        counts = webhooks.process_batch()
+        self.assertEqual(counts, {'events': 7, 'enrolled': 1, 'processed': 3, 'rejected': 3, 'ignored': 1})
+        # A payment that does not match the course price enrolls nobody.
+        self.assertIn('costs 19.99', PayPalWebhookEvent.objects.get(event_id='WH-3').last_error)
+        self.assertEqual(Enrollment.objects.filter(course=self.course).count(), 2)
+        self.assertEqual(Enrollment.objects.get(student=first).amount_paid, Decimal('19.99'))
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrollment_count, 2)
+        self.assertEqual(webhooks.process_batch()['events'], 0)
+        self.assertFalse(PayPalWebhookEvent.objects.filter(status='pending').exists())
+    def order(self, student, amount='19.99'):
+        return paypal.get_client().create_order({'intent': 'CAPTURE', 'purchase_units': [{
+            'amount': {'currency_code': 'USD', 'value': amount}, 'custom_id': f'{student.pk}:{self.course.pk}',
+        }]})['id']
+    def test_approved_orders_are_captured_without_the_buyer(self):
+        first, second, _ = self.students
+        order_id = self.order(first)
+        self.deliver('WH-1', 'CHECKOUT.ORDER.APPROVED', f'{first.pk}:{self.course.pk}', order_id=order_id)
+        cheap_order = self.order(second, amount='5.00')
+        self.deliver('WH-2', 'CHECKOUT.ORDER.APPROVED', f'{second.pk}:{self.course.pk}', amount='5.00', order_id=cheap_order)
+        self.deliver('WH-3', 'CHECKOUT.ORDER.APPROVED', f'{second.pk}:{self.course.pk}', order_id='UNKNOWN')
+        counts = webhooks.process_batch()
+        self.assertEqual(counts, {'events': 3, 'enrolled': 1, 'processed': 1, 'rejected': 2})
+        self.assertTrue(Enrollment.objects.filter(student=first, course=self.course).exists())
+        self.assertFalse(Enrollment.objects.filter(student=second).exists())
+        # The cheap order was never captured, and the buyer's late return replays the first capture.
+        self.assertEqual(paypal.get_client().get_order(cheap_order)['status'], 'APPROVED')
+        self.assertEqual(paypal.get_client().capture_order(order_id)['status'], 'COMPLETED')
+    @override_settings(PAYPAL_WEBHOOK_VERIFY=True, PAYPAL_WEBHOOK_ID='')
+    def test_verification_needs_a_webhook_id(self):
+        with self.assertRaises(ImproperlyConfigured):
+            webhooks.process_batch()
+@FAST_TEST_SETTINGS
+class PurchaseWriteLockTests(StubPayPalMixin, TransactionTestCase):
+    # A TransactionTestCase, because serialized() leaves the lock alone inside an atomic block.
+    def test_paypal_return_enrolls_under_the_write_lock(self):
+        teacher = make_users('lock_teacher', 1, user_type='teacher')[0]
+        course = make_courses(teacher, 1)[0]
+        student = make_users('lock_student', 1)[0]
+        lock_held = []
+        def record(sender, **kwargs):
+            lock_held.append(db_writes._lock('default').locked())
+        pre_save.connect(record, sender=Enrollment)
+        self.addCleanup(pre_save.disconnect, record, sender=Enrollment)
+        self.client.force_login(student)
+        self.client.post(f'/student/courses/{course.pk}/purchase/', {'paypal_submit': '1'})
+        response = self.client.get('/student/paypal/return/')
+        self.assertRedirects(response, f'/student/courses/{course.pk}/access/', fetch_redirect_response=False)
+        self.assertEqual(lock_held, [True])
+        self.assertTrue(Enrollment.objects.filter(student=student, course=course).exists())
+@FAST_TEST_SETTINGS
+@override_settings(METRICS_TOKEN='scrape-token')
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        teacher = make_users('async_teacher', 1, user_type='teacher')[0]
+        cls.course = make_courses(teacher, 1)[0]
+        cls.student = make_users('async_student', 1)[0]
+    async def test_purchase_runs_through_the_asgi_handler(self):
+        await self.async_client.aforce_login(self.student)
+        url = f'/student/courses/{self.course.pk}/purchase/'
+        response = await self.async_client.get(url)
+        self.assertContains(response, self.course.title)
+        response = await self.async_client.post(url, {'simulate_submit': '1'})
+        self.assertRedirects(response, f'/student/courses/{self.course.pk}/access/', fetch_redirect_response=False)
+        self.assertTrue(await Enrollment.objects.filter(student=self.student, course=self.course).aexists())
+        # Queries made in sync_to_async() threads still reach the request metrics.
+        metrics_body = (await self.async_client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'})).content.decode()
+        self.assertRegex(metrics_body, r'edustream_db_queries_total\{view="course_purchase"\} [1-9]')
+    async def test_login_issues_an_otp(self):
+        response = await self.async_client.post(
+            '/accounts/login/', {'username': self.student.username, 'password': PASSWORD},
+        )
+        self.assertRedirects(response, '/accounts/verify-otp/', fetch_redirect_response=False)
+        session = await self.async_client.asession()
+        self.assertEqual(await session.aget('user_id_for_otp'), self.student.pk)
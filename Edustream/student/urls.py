@@ -1,6 +1,6 @@
 # student/urls.py
 from django.urls import path
-from . import views
+from . import api, views
 from django.http import HttpResponse 
 urlpatterns = [
     path('dashboard/', views.student_dashboard, name='student_dashboard'),
@@ -9,7 +9,11 @@ urlpatterns = [
     path('courses/<int:pk>/purchase/', views.course_purchase, name='course_purchase'),
     path('courses/<int:course_pk>/access/', views.course_content_access, name='course_content_access'),
     path('courses/<int:course_pk>/content/<int:content_pk>/', views.view_content_detail, name='view_content_detail'),
+    path('courses/<int:course_pk>/content/<int:content_pk>/download/', views.download_content_file, name='download_content_file'),
     path('paypal/return/', views.paypal_return_view, name='paypal_return'),
     path('paypal/cancel/', views.paypal_cancel_view, name='paypal_cancel'),
     path('paypal/webhook/', views.paypal_webhook_view, name='paypal_webhook'),
+    path('api/courses/', api.catalog, name='api_catalog'),
+    path('api/courses/<int:pk>/', api.course_detail, name='api_course_detail'),
+    path('api/courses/<int:pk>/contents/', api.course_contents, name='api_course_contents'),
 ]
\ No newline at end of file
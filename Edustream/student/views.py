@@ -1,17 +1,22 @@
 # student/views.py
-from django.shortcuts import render, get_object_or_404, redirect
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404, render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.db.models import Q
 from django.contrib import messages
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
 from django.urls import reverse
-from django.http import HttpResponse, JsonResponse 
+from django.http import Http404, HttpResponse, JsonResponse 
 from core.models import Course, Enrollment, CourseContent, Category, User
+from core import course_cache, enrollment_cache, metrics, search
+from core.pagination import keyset_paginate
+from . import downloads, paypal, webhooks
 import requests 
 import json 
+import logging
+logger = logging.getLogger('edustream.student')
 def is_student(user):
     """Check if the logged-in user is a student."""
     return user.is_authenticated and user.user_type == 'student'
@@ -28,24 +33,24 @@ def course_list(request):
     query = request.GET.get('q')
     category_id = request.GET.get('category')
     
-    courses = Course.objects.all().select_related('teacher', 'category')
-    if query:
-        courses = courses.filter(
-            Q(title__icontains=query) |
-            Q(description__icontains=query) |
-            Q(teacher__username__icontains=query) |
-            Q(category__name__icontains=query)
-        ).distinct()
+    courses = Course.objects.all().select_related('teacher', 'category').order_by('title')
     if category_id:
         courses = courses.filter(category__id=category_id)
-    enrolled_course_ids = Enrollment.objects.filter(student=request.user).values_list('course__id', flat=True)
-    available_courses = courses.exclude(id__in=enrolled_course_ids).order_by('title')
+    enrolled_course_ids = enrollment_cache.get_enrolled_course_ids(request.user)
+    available_courses = courses.exclude(id__in=enrolled_course_ids) if enrolled_course_ids else courses
+    # Searched last, so the filters above are part of the ranked FTS query and its limit.
+    if query:
+        available_courses = search.search_courses(available_courses, query)
+    ordering = 'search_rank' if query and search.is_enabled() else 'title'
+    page = keyset_paginate(request, available_courses, ordering, settings.CATALOG_PAGE_SIZE)
+    page.object_list = course_cache.annotate_versions(page.object_list)
     all_categories = Category.objects.all().order_by('name')
     context = {
-        'courses': available_courses,
+        'courses': page,
         'query': query,
         'all_categories': all_categories,
         'selected_category': category_id,
+        'course_cache_timeout': course_cache.timeout(),
     }
     return render(request, 'student/course_list.html', context)
 
@@ -53,48 +58,38 @@ def course_list(request):
 @user_passes_test(is_student, login_url='login')
 def course_detail(request, pk):
     """Displays details of a specific course."""
-    course = get_object_or_404(Course, pk=pk)
-    
-    print(f"\n--- DEBUG: In course_detail (URL: /student/courses/{pk}/): User {request.user.username} (ID: {request.user.id}), Course ID: {course.title} (ID: {course.id}). Is enrolled: {Enrollment.objects.filter(student=request.user, course=course).exists()} ---")
+    course = course_cache.get_course(pk)
+    is_enrolled = enrollment_cache.is_enrolled(request.user, course.pk)
 
-    is_enrolled = Enrollment.objects.filter(student=request.user, course=course).exists()
-    return render(request, 'student/course_detail.html', {'course': course, 'is_enrolled': is_enrolled})
+    metrics.log_event(logger, 'course_detail', user_id=request.user.id, course_id=course.pk, enrolled=is_enrolled)
+
+    return render(request, 'student/course_detail.html', {
+        'course': course, 'is_enrolled': is_enrolled, 'course_cache_timeout': course_cache.timeout(),
+    })
 
 @login_required
 @user_passes_test(is_student, login_url='login')
-def course_purchase(request, pk):
-    """Handles course purchase, differentiating between PayPal and simulated."""
-    course = get_object_or_404(Course, pk=pk)
+async def course_purchase(request, pk):
+    """
+    Handles course purchase, differentiating between PayPal and simulated. Async so that
+    waiting on PayPal does not hold a worker under ASGI; ORM and cache work runs in sync_to_async.
+    """
+    # Replacing the lazy request.user saves the template context a second user query.
+    user = request.user = await request.auser()
+    course = await sync_to_async(course_cache.get_course)(pk)
     
-    print(f"\n--- DEBUG: Entering course_purchase for user: {request.user.username} (ID: {request.user.id}), Course ID: {pk} ({course.title}) ---")
-    print(f"--- DEBUG: request.POST content: {request.POST} ---") # ADDED THIS PRINT
+    metrics.log_event(logger, 'course_purchase', user_id=user.id, course_id=course.pk, method=request.method)
 
-    if Enrollment.objects.filter(student=request.user, course=course).exists():
+    if await sync_to_async(enrollment_cache.is_enrolled)(user, course.pk):
         messages.info(request, f'You are already enrolled in "{course.title}".')
-        print(f"--- DEBUG: User {request.user.username} already enrolled in {course.title}. Redirecting to access page. ---")
+        metrics.log_event(logger, 'purchase_already_enrolled', user_id=user.id, course_id=course.pk)
         return redirect('course_content_access', course_pk=course.pk)
 
     if request.method == 'POST':
         try:
             if 'paypal_submit' in request.POST:
-                paypal_client_id = settings.PAYPAL_CLIENT_ID
-                paypal_secret = settings.PAYPAL_SECRET
-                access_token_url = "https://api-m.sandbox.paypal.com/v1/oauth2/token"
-                orders_api_url = "https://api-m.sandbox.paypal.com/v2/checkout/orders"
-                request.session['course_pk_for_paypal'] = course.pk
-                request.session['user_id_for_paypal'] = request.user.id
-                # 1. Obtain Access Token
-                print("--- DEBUG: Attempting to get PayPal Access Token ---")
-                auth_response = requests.post(access_token_url,
-                    headers={'Accept': 'application/json', 'Accept-Language': 'en_US'},
-                    auth=(paypal_client_id, paypal_secret),
-                    data={'grant_type': 'client_credentials'}
-                )
-                auth_response.raise_for_status()
-                access_token = auth_response.json()['access_token']
-                print("--- DEBUG: PayPal Access Token obtained. ---")
-                # 2. Create Order
-                print("--- DEBUG: Attempting to create PayPal Order ---")
+                await request.session.aset('course_pk_for_paypal', course.pk)
+                await request.session.aset('user_id_for_paypal', user.id)
                 order_data = {
                     "intent": "CAPTURE",
                     "purchase_units": [{
@@ -102,127 +97,100 @@ def course_purchase(request, pk):
                             "currency_code": "USD", # Or your desired currency
                             "value": str(course.price)
                         },
-                        "description": f"Course: {course.title}"
+                        "description": f"Course: {course.title}",
+                        # Lets the webhook worker (student/webhooks.py) match the payment to the enrollment.
+                        "custom_id": f"{user.id}:{course.pk}"
                     }],
                     "application_context": {
                         "return_url": request.build_absolute_uri(reverse('paypal_return')),
                         "cancel_url": request.build_absolute_uri(reverse('paypal_cancel'))
                     }
                 }
-                order_response = requests.post(orders_api_url,
-                    headers={
-                        'Content-Type': 'application/json',
-                        'Authorization': f'Bearer {access_token}'
-                    },
-                    data=json.dumps(order_data)
-                )
-                order_response.raise_for_status()
-                order_details = order_response.json()
-                print(f"--- DEBUG: PayPal Order created. Order ID: {order_details.get('id')} ---")
-                request.session['paypal_order_id'] = order_details['id']
+                order_details = await paypal.get_async_client().create_order(order_data)
+                metrics.log_event(logger, 'paypal_order_created', user_id=user.id, course_id=course.pk, order_id=order_details.get('id'))
+                await request.session.aset('paypal_order_id', order_details['id'])
                 for link in order_details['links']:
                     if link['rel'] == 'approve':
-                        print(f"--- DEBUG: Redirecting to PayPal approval URL: {link['href']} ---")
                         return redirect(link['href'])
                 
                 messages.error(request, "Could not find PayPal approval URL to redirect.")
-                print("--- DEBUG: No PayPal approval URL found. ---")
+                metrics.log_event(logger, 'paypal_approval_url_missing', logging.WARNING, order_id=order_details.get('id'))
                 return redirect('course_detail', pk=course.pk)
             elif 'simulate_submit' in request.POST:
-                print(f"--- DEBUG: SIMULATING ENROLLMENT CREATION (THIS IS ACTIVE NOW) ---")
-                enrollment = Enrollment.objects.create(student=request.user, course=course)
+                enrollment = await Enrollment.objects.acreate(student=user, course=course)
                 messages.success(request, f'Congratulations! You have successfully purchased "{course.title}".')
-                print(f"--- DEBUG: Simulated Enrollment created successfully! ID: {enrollment.id}, Student: {enrollment.student.username}, Course: {enrollment.course.title} ---")
+                metrics.log_event(logger, 'enrollment_created', source='simulated', enrollment_id=enrollment.id, user_id=user.id, course_id=course.pk)
                 return redirect('course_content_access', course_pk=course.pk)
             else:
                 messages.error(request, "Invalid purchase action. Please select a payment option.")
-                print("--- DEBUG: Neither purchase button name found in request. ---")
+                metrics.log_event(logger, 'purchase_invalid_action', logging.WARNING, user_id=user.id, course_id=course.pk)
                 return redirect('course_detail', pk=course.pk)
 
         except requests.exceptions.RequestException as req_e:
             messages.error(request, f"PayPal API communication error: {req_e}. Please try again.")
-            print(f"--- DEBUG: PayPal API RequestException: {req_e} ---")
-            if req_e.response is not None:
-                print(f"--- DEBUG: PayPal API Response Error: {req_e.response.status_code} - {req_e.response.text} ---")
+            metrics.log_event(
+                logger, 'paypal_create_failed', logging.WARNING, course_id=course.pk, error=req_e,
+                status=req_e.response.status_code if req_e.response is not None else '',
+            )
             return redirect('course_detail', pk=course.pk)
         except Exception as e:
             messages.error(request, f'An unexpected error occurred during payment initiation: {e}. Please try again.')
-            print(f"--- DEBUG: UNEXPECTED ERROR during purchase initiation: {e} ---")
+            metrics.log_event(logger, 'purchase_error', logging.ERROR, course_id=course.pk, error=e)
             return redirect('course_detail', pk=course.pk)
             
-    return render(request, 'student/course_purchase_confirm.html', {'course': course})
+    # Rendering may touch lazy objects (request.user in the context processors) that query the database.
+    return await sync_to_async(render)(request, 'student/course_purchase_confirm.html', {'course': course})
 @login_required
 @user_passes_test(is_student, login_url='login')
-def paypal_return_view(request):
+async def paypal_return_view(request):
     """
-    Handles PayPal's successful return after payment.
-    This is where you'd CAPTURE the payment and create the Enrollment.
+    Handles PayPal's successful return after payment: captures the order and creates the
+    Enrollment. Async, like course_purchase, so the capture call does not hold a worker.
     """
-    paypal_order_id = request.session.pop('paypal_order_id', None)
-    course_pk = request.session.pop('course_pk_for_paypal', None)
-    user_id = request.session.pop('user_id_for_paypal', None)
+    paypal_order_id = await request.session.apop('paypal_order_id', None)
+    course_pk = await request.session.apop('course_pk_for_paypal', None)
+    user_id = await request.session.apop('user_id_for_paypal', None)
 
-    print(f"\n--- DEBUG: Entering paypal_return_view. Order ID: {paypal_order_id}, Course PK: {course_pk}, User ID: {user_id} ---")
+    metrics.log_event(logger, 'paypal_return', order_id=paypal_order_id, course_id=course_pk, user_id=user_id)
 
     if not paypal_order_id or not course_pk or not user_id:
         messages.error(request, "Payment session expired or invalid.")
-        print("--- DEBUG: Payment session data missing. ---")
+        metrics.log_event(logger, 'paypal_return_session_missing', logging.WARNING, user_id=(await request.auser()).id)
         return redirect('student_dashboard')
     
     try:
-        course = get_object_or_404(Course, pk=course_pk)
-        student = get_object_or_404(User, pk=user_id)
-        paypal_client_id = settings.PAYPAL_CLIENT_ID
-        paypal_secret = settings.PAYPAL_SECRET
+        course = await aget_object_or_404(Course, pk=course_pk)
+        student = await aget_object_or_404(User, pk=user_id)
 
-        access_token_url = "https://api-m.sandbox.paypal.com/v1/oauth2/token"
-        capture_order_url = f"https://api-m.sandbox.paypal.com/v2/checkout/orders/{paypal_order_id}/capture"
-
-        print("--- DEBUG: Attempting to get Access Token for capture. ---")
-        auth_response = requests.post(access_token_url,
-            headers={'Accept': 'application/json', 'Accept-Language': 'en_US'},
-            auth=(paypal_client_id, paypal_secret),
-            data={'grant_type': 'client_credentials'}
-        )
-        auth_response.raise_for_status()
-        access_token = auth_response.json()['access_token']
-        print("--- DEBUG: Access Token obtained for capture. ---")
-
-        print("--- DEBUG: Attempting to Capture PayPal Order. ---")
-        capture_response = requests.post(capture_order_url,
-            headers={
-                'Content-Type': 'application/json',
-                'Authorization': f'Bearer {access_token}'
-            }
-        )
-        capture_response.raise_for_status()
-        capture_details = capture_response.json()
-        print(f"--- DEBUG: PayPal Capture API response: {capture_details} ---")
+        capture_details = await paypal.get_async_client().capture_order(paypal_order_id)
+        metrics.log_event(logger, 'paypal_order_captured', order_id=paypal_order_id, status=capture_details.get('status'))
 
         if capture_details.get('status') == 'COMPLETED':
-            if not Enrollment.objects.filter(student=student, course=course).exists():
-                enrollment = Enrollment.objects.create(student=student, course=course)
+            # The webhook worker may have enrolled the student already; get_or_create copes with that
+            # race, and takes the SQLite write lock first (see EnrollmentQuerySet).
+            enrollment, created = await Enrollment.objects.aget_or_create(student=student, course=course)
+            if created:
                 messages.success(request, f"Course '{course.title}' purchased successfully via PayPal!")
-                print(f"--- DEBUG: Enrollment for {student.username} in {course.title} created after PayPal capture. Enrollment ID: {enrollment.id} ---")
+                metrics.log_event(logger, 'enrollment_created', source='paypal', enrollment_id=enrollment.id, user_id=student.pk, course_id=course.pk)
             else:
                 messages.info(request, f"You were already enrolled in '{course.title}'.")
-                print(f"--- DEBUG: Enrollment for {student.username} in {course.title} already exists. ---")
             
             return redirect('course_content_access', course_pk=course_pk)
         else:
             messages.error(request, f"PayPal payment not completed. Status: {capture_details.get('status')}. Please try again.")
-            print(f"--- DEBUG: PayPal capture status not COMPLETED: {capture_details.get('status')} ---")
+            metrics.log_event(logger, 'paypal_capture_incomplete', logging.WARNING, order_id=paypal_order_id, status=capture_details.get('status'))
             return redirect('course_detail', pk=course_pk)
 
     except requests.exceptions.RequestException as req_e:
         messages.error(request, f"PayPal API communication error during capture: {req_e}. Please try again.")
-        print(f"--- DEBUG: PayPal Capture RequestException: {req_e} ---")
-        if req_e.response is not None:
-            print(f"--- DEBUG: PayPal Capture Response Error: {req_e.response.status_code} - {req_e.response.text} ---")
+        metrics.log_event(
+            logger, 'paypal_capture_failed', logging.WARNING, order_id=paypal_order_id, error=req_e,
+            status=req_e.response.status_code if req_e.response is not None else '',
+        )
         return redirect('course_list')
     except Exception as e:
         messages.error(request, f"An unexpected error occurred during payment verification: {e}. Please try again.")
-        print(f"--- DEBUG: UNEXPECTED ERROR in paypal_return_view: {e} ---")
+        metrics.log_event(logger, 'paypal_return_error', logging.ERROR, order_id=paypal_order_id, error=e)
         return redirect('course_list')
 
 @login_required
@@ -234,7 +202,7 @@ def paypal_cancel_view(request):
     request.session.pop('user_id_for_paypal', None)
 
     messages.info(request, "PayPal payment was cancelled.")
-    print("--- DEBUG: PayPal payment cancelled by user. ---")
+    metrics.log_event(logger, 'paypal_cancelled', user_id=request.user.id)
     return redirect('course_list')
 
 from django.views.decorators.csrf import csrf_exempt
@@ -242,63 +210,63 @@ from django.views.decorators.csrf import csrf_exempt
 @csrf_exempt
 def paypal_webhook_view(request):
     """
-    Conceptual view for handling PayPal Webhooks (IPN).
-    This is critical for reliable payment confirmation.
+    Receives PayPal webhooks. Each event is stored for `process_paypal_webhooks` and acknowledged
+    straight away; redeliveries of a stored event id are acknowledged without a second row.
     """
     if request.method == 'POST':
-        print("\n--- DEBUG: Received a PayPal webhook POST request. ---")
         try:
             payload = json.loads(request.body)
-            event_type = payload.get('event_type')
-            order_id = payload.get('resource', {}).get('id')
-            if event_type == 'CHECKOUT.ORDER.COMPLETED':
-                print(f"--- DEBUG: Webhook: Order {order_id} completed. ---")
-            else:
-                print(f"--- DEBUG: Webhook: Unhandled event type: {event_type} ---")
-        except Exception as e:
-            print(f"--- DEBUG: Error processing webhook: {e} ---")
+            stored = webhooks.store(payload, request.headers)
+        except ValueError as e:
+            metrics.log_event(logger, 'paypal_webhook_invalid', logging.WARNING, error=e)
             return HttpResponse(status=400)
-
+        if not stored:
+            metrics.log_event(logger, 'paypal_webhook_invalid', logging.WARNING, error='missing event id')
+            return HttpResponse(status=400)
+        metrics.log_event(logger, 'paypal_webhook', event_id=payload['id'], event_type=payload.get('event_type'))
         return HttpResponse(status=200)
     
-    print("--- DEBUG: Received non-POST request to PayPal webhook. ---")
     return HttpResponse(status=405)
 
 # --- Course Content Access View ---
 @login_required
 @user_passes_test(is_student, login_url='login')
 def course_content_access(request, course_pk):
-    course = get_object_or_404(Course, pk=course_pk)
+    course = course_cache.get_course(course_pk)
     
-    print(f"\n--- DEBUG: Entering course_content_access for user: {request.user.username} (ID: {request.user.id}), Course ID: {course_pk} ({course.title}) ---")
-    
-    try:
-        enrollment = get_object_or_404(Enrollment, student=request.user, course=course)
-        print(f"--- DEBUG: Enrollment found successfully for {request.user.username} in {course.title}. Enrollment ID: {enrollment.id} ---")
-    except Exception as e:
-        print(f"--- DEBUG: ERROR: No Enrollment found for {request.user.username} (ID: {request.user.id}) in {course.title} (ID: {course.id}). Exception: {e} ---")
+    if not enrollment_cache.is_enrolled(request.user, course.pk):
+        metrics.log_event(logger, 'content_access_denied', user_id=request.user.id, course_id=course.pk)
         messages.error(request, "You are not enrolled in this course or your enrollment could not be verified.")
         return redirect('course_detail', pk=course_pk)
 
-    course_contents = course.contents.all()
+    course_contents = course_cache.get_contents(course)
 
-    return render(request, 'student/course_content_access.html', {'course': course, 'contents': course_contents})
+    return render(request, 'student/course_content_access.html', {
+        'course': course, 'contents': course_contents, 'course_cache_timeout': course_cache.timeout(),
+    })
 
 # --- View Specific Content Detail ---
 @login_required
 @user_passes_test(is_student, login_url='login')
 def view_content_detail(request, course_pk, content_pk):
-    course = get_object_or_404(Course, pk=course_pk)
-    content = get_object_or_404(CourseContent, pk=content_pk, course=course)
+    course = course_cache.get_course(course_pk)
+    content = next((item for item in course_cache.get_contents(course) if item.pk == content_pk), None)
+    if content is None:
+        raise Http404("No CourseContent matches the given query.")
 
-    print(f"\n--- DEBUG: Entering view_content_detail for user: {request.user.username} (ID: {request.user.id}), Course ID: {course_pk}, Content ID: {content_pk} ---")
-    
-    try:
-        get_object_or_404(Enrollment, student=request.user, course=course)
-        print(f"--- DEBUG: Enrollment confirmed for {request.user.username} in {course.title} to view content {content.title}. ---")
-    except Exception as e:
-        print(f"--- DEBUG: ERROR: Enrollment check failed in view_content_detail. Exception: {e} ---")
+    if not enrollment_cache.is_enrolled(request.user, course.pk):
+        metrics.log_event(logger, 'content_access_denied', user_id=request.user.id, course_id=course.pk, content_id=content.pk)
         messages.error(request, "You do not have access to this course content. Please ensure you are enrolled.")
         return redirect('course_content_access', course_pk=course_pk)
 
     return render(request, 'student/content_detail.html', {'course': course, 'content': content})
+
+# --- Protected File Download ---
+@login_required
+def download_content_file(request, course_pk, content_pk):
+    """Streams a content file to enrolled students and the course's teacher, with Range support."""
+    content = get_object_or_404(CourseContent.objects.select_related('course'), pk=content_pk, course_id=course_pk)
+    is_owner = content.course.teacher_id == request.user.id
+    if not content.file or not (is_owner or enrollment_cache.is_enrolled(request.user, course_pk)):
+        raise Http404("File not found.")
+    return downloads.serve_file(request, content.file)
\ No newline at end of file
@@ -0,0 +1,223 @@
+# student/webhooks.py
+"""
+PayPal webhook queue. The webhook view only stores each delivery as a PayPalWebhookEvent
+(one INSERT that ignores redelivered event ids) and acknowledges it; process_batch() later
+leases due events, verifies their signatures with PayPal and enrolls the buyers with one
+bulk_create(ignore_conflicts=True) per batch, so a replayed event, a second event for the
+same sale or a race with paypal_return_view never enrolls anyone twice.
+
+An approved order (CHECKOUT.ORDER.APPROVED) is captured here, so a buyer who approves the
+payment but never comes back to paypal_return_view is still charged and enrolled. Captures
+are idempotent per order id (see PayPalClient.capture_order). A purchase is only enrolled
+when the amount paid matches the course price in CURRENCY.
+
+Orders carry `custom_id = "<student id>:<course id>"` (set in course_purchase), which is how
+an event is matched to the enrollment it pays for.
+"""
+import datetime
+import logging
+from decimal import Decimal, InvalidOperation
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from core import course_counters, db_writes, enrollment_cache, metrics
+from core.models import Course, Enrollment, PayPalWebhookEvent, User
+from . import paypal
+logger = logging.getLogger('edustream.student')
+HANDLED_EVENT_TYPES = {'CHECKOUT.ORDER.APPROVED', 'CHECKOUT.ORDER.COMPLETED', 'PAYMENT.CAPTURE.COMPLETED'}
+# The currency course_purchase charges in.
+CURRENCY = 'USD'
+HEADER_PREFIX = 'PAYPAL-'
+def store(payload, headers):
+    """Saves a delivery unless its event id is already stored; returns False for malformed payloads."""
+    event_id = payload.get('id') if isinstance(payload, dict) else None
+    if not isinstance(event_id, str) or not event_id or len(event_id) > 128:
+        return False
+    PayPalWebhookEvent.objects.bulk_create([
+        PayPalWebhookEvent(
+            event_id=event_id, event_type=str(payload.get('event_type', ''))[:100], payload=payload,
+            headers={key.upper(): value for key, value in headers.items() if key.upper().startswith(HEADER_PREFIX)},
+        ),
+    ], ignore_conflicts=True)
+    return True
+def _backoff(attempts):
+    base = getattr(settings, 'PAYPAL_WEBHOOK_BACKOFF_SECONDS', 30)
+    return datetime.timedelta(seconds=base * (2 ** (attempts - 1)))
+def _claim_batch(batch_size):
+    """Leases up to `batch_size` due events; see core.outbox._claim_batch."""
+    now = timezone.now()
+    lease = datetime.timedelta(seconds=getattr(settings, 'PAYPAL_WEBHOOK_LEASE_SECONDS', 300))
+    with transaction.atomic():
+        ids = list(
+            PayPalWebhookEvent.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if ids:
+            PayPalWebhookEvent.objects.filter(id__in=ids).update(
+                next_attempt_at=now + lease, attempts=F('attempts') + 1,
+            )
+    return list(PayPalWebhookEvent.objects.filter(id__in=ids).order_by('id'))
+def _purchase(custom_id, amount):
+    amount = amount or {}
+    if amount.get('currency_code') != CURRENCY:
+        raise ValueError(f"Unexpected currency {amount.get('currency_code')!r}.")
+    try:
+        student_id, course_id = (int(part) for part in str(custom_id).split(':'))
+        return student_id, course_id, Decimal(amount.get('value'))
+    except (ValueError, TypeError, InvalidOperation):
+        raise ValueError(f"Unrecognised custom_id {custom_id!r} or amount {amount.get('value')!r}.")
+def parse_purchase(event):
+    """Returns (student id, course id, amount) from an order or capture event."""
+    resource = event.payload.get('resource') or {}
+    if event.event_type.startswith('CHECKOUT.ORDER.'):
+        unit = (resource.get('purchase_units') or [{}])[0]
+        return _purchase(unit.get('custom_id'), unit.get('amount'))
+    return _purchase(resource.get('custom_id'), resource.get('amount'))
+def parse_capture(order):
+    """Returns (student id, course id, amount) of an order's completed capture, or None while it is pending."""
+    unit = (order.get('purchase_units') or [{}])[0]
+    captures = (unit.get('payments') or {}).get('captures') or []
+    capture = next((capture for capture in captures if capture.get('status') == 'COMPLETED'), None)
+    if capture is None:
+        return None
+    return _purchase(capture.get('custom_id') or unit.get('custom_id'), capture.get('amount'))
+def _issue(response):
+    try:
+        return response.json()['details'][0]['issue']
+    except (ValueError, KeyError, IndexError, TypeError):
+        return ''
+def _capture(event, purchase):
+    """Captures an approved order and returns parse_capture() of the result."""
+    _, course_id, amount = purchase
+    order_id = str((event.payload.get('resource') or {}).get('id', ''))
+    # Never take money for an order that would then be refused, e.g. after a price change.
+    if not Course.objects.filter(pk=course_id, price=amount).exists():
+        raise ValueError(f"Order {order_id} is for {amount} {CURRENCY}, not the price of course {course_id}; not captured.")
+    client = paypal.get_client()
+    try:
+        order = client.capture_order(order_id)
+    except requests.exceptions.HTTPError as e:
+        response = e.response
+        if response is None or response.status_code >= 500:
+            raise
+        if _issue(response) != 'ORDER_ALREADY_CAPTURED':
+            # The order cannot be captured (unknown, not approved, voided); retrying will not help.
+            raise ValueError(f"PayPal refused to capture order {order_id}: HTTP {response.status_code} {_issue(response)}.")
+        # Captured under a different request id, e.g. outside PayPal's idempotency window.
+        order = client.get_order(order_id)
+    return parse_capture(order)
+def _verify(event):
+    if not getattr(settings, 'PAYPAL_WEBHOOK_VERIFY', True):
+        return True
+    return paypal.get_client().verify_webhook_signature(settings.PAYPAL_WEBHOOK_ID, event.headers, event.payload)
+def _enroll(purchases):
+    """
+    Creates the missing enrollments for {(student id, course id): amount paid}. Returns
+    {key: reason} for the purchases refused (unknown student or course, or an amount other
+    than the course price) and how many enrollments were created.
+    """
+    students = set(
+        User.objects.filter(pk__in={student for student, _ in purchases}, user_type='student')
+        .values_list('id', flat=True)
+    )
+    prices = dict(Course.objects.filter(pk__in={course for _, course in purchases}).values_list('id', 'price'))
+    refused = {}
+    for (student, course), amount in purchases.items():
+        if student not in students or course not in prices:
+            refused[(student, course)] = f"No student {student} or course {course}."
+        elif amount != prices[course]:
+            refused[(student, course)] = f"Paid {amount} {CURRENCY} but course {course} costs {prices[course]}."
+    valid = {key: amount for key, amount in purchases.items() if key not in refused}
+    existing = set(
+        Enrollment.objects.filter(
+            student_id__in={student for student, _ in valid}, course_id__in={course for _, course in valid},
+        ).values_list('student_id', 'course_id')
+    ) if valid else set()
+    new = [
+        Enrollment(student_id=student, course_id=course, amount_paid=amount)
+        for (student, course), amount in valid.items() if (student, course) not in existing
+    ]
+    with db_writes.serialized():
+        Enrollment.objects.bulk_create(new, ignore_conflicts=True)
+        # bulk_create() sends no signals, so do the Enrollment handlers' work here.
+        enrollment_cache.invalidate_many({enrollment.student_id for enrollment in new})
+    if new:
+        course_counters.reconcile({enrollment.course_id for enrollment in new})
+    return refused, len(new)
+def _reject(event, status, error):
+    event.status = status
+    event.last_error = str(error)
+    event.processed_at = timezone.now()
+def process_batch(batch_size=None, max_attempts=None):
+    """
+    Processes one batch of due events. Returns counts of the events claimed ('events'), the
+    enrollments created ('enrolled') and the events finished in each status.
+    Events that cannot be verified or captured because PayPal is unreachable are retried with
+    exponential backoff until `max_attempts`; the rest of the batch waits for its lease to expire.
+    """
+    if getattr(settings, 'PAYPAL_WEBHOOK_VERIFY', True) and not getattr(settings, 'PAYPAL_WEBHOOK_ID', ''):
+        raise ImproperlyConfigured("Set PAYPAL_WEBHOOK_ID (or PAYPAL_WEBHOOK_VERIFY = False) to process webhooks.")
+    batch_size = batch_size or getattr(settings, 'PAYPAL_WEBHOOK_BATCH_SIZE', 200)
+    max_attempts = max_attempts or getattr(settings, 'PAYPAL_WEBHOOK_MAX_ATTEMPTS', 5)
+    events = _claim_batch(batch_size)
+    purchases, by_purchase, finished = {}, {}, []
+    for event in events:
+        if event.event_type not in HANDLED_EVENT_TYPES:
+            _reject(event, 'ignored', '')
+            finished.append(event)
+            continue
+        try:
+            purchase = parse_purchase(event)
+            verified = _verify(event)
+            if verified and event.event_type == 'CHECKOUT.ORDER.APPROVED':
+                purchase = _capture(event, purchase)
+        except requests.exceptions.RequestException as e:
+            event.last_error = str(e)
+            if event.attempts >= max_attempts:
+                event.status = 'failed'
+            else:
+                event.next_attempt_at = timezone.now() + _backoff(event.attempts)
+            finished.append(event)
+            metrics.log_event(
+                logger, 'paypal_webhook_call_failed', logging.WARNING,
+                event_id=event.event_id, attempts=event.attempts, status=event.status, error=e,
+            )
+            break
+        except ValueError as e:
+            _reject(event, 'rejected', e)
+            finished.append(event)
+            continue
+        if not verified:
+            _reject(event, 'rejected', "Signature verification failed.")
+            finished.append(event)
+            continue
+        if purchase is None:
+            # e.g. an eCheck; PayPal sends PAYMENT.CAPTURE.COMPLETED once the money arrives.
+            _reject(event, 'ignored', "Capture is pending.")
+            finished.append(event)
+            continue
+        student, course, amount = purchase
+        purchases.setdefault((student, course), amount)
+        by_purchase.setdefault((student, course), []).append(event)
+    enrolled = 0
+    if purchases:
+        refused, enrolled = _enroll(purchases)
+        for key, key_events in by_purchase.items():
+            for event in key_events:
+                if key in refused:
+                    _reject(event, 'rejected', refused[key])
+                else:
+                    event.status, event.last_error, event.processed_at = 'processed', '', timezone.now()
+                finished.append(event)
+    PayPalWebhookEvent.objects.bulk_update(finished, ['status', 'next_attempt_at', 'last_error', 'processed_at'])
+    counts = {'events': len(events), 'enrolled': enrolled}
+    for event in finished:
+        counts[event.status] = counts.get(event.status, 0) + 1
+    if events:
+        metrics.log_event(logger, 'paypal_webhook_batch', **counts)
+    return counts
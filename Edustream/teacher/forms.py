@@ -1,6 +1,6 @@
 # teacher/forms.py
 from django import forms
-from core.models import Course, CourseContent, Category
+from core.models import ChunkedUpload, Course, CourseContent, Category
 class CourseForm(forms.ModelForm):
     class Meta:
         model = Course
@@ -26,6 +26,7 @@ class CourseForm(forms.ModelForm):
 
 
 class CourseContentForm(forms.ModelForm):
+    upload_id = forms.UUIDField(required=False, widget=forms.HiddenInput)
     class Meta:
         model = CourseContent
         fields = ['title', 'content_type', 'text_content', 'video_url', 'file', 'order']
@@ -45,8 +46,22 @@ class CourseContentForm(forms.ModelForm):
             'file': 'Downloadable File',
             'order': 'Display Order',
         }
+        help_texts = {
+            'text_content': 'Markdown is supported: headings, **bold**, *italic*, `code`, lists, > quotes and [links](https://...).',
+        }
+    def __init__(self, *args, teacher=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.teacher = teacher
     def clean(self):
         cleaned_data = super().clean()
+        upload_id = cleaned_data.get('upload_id')
+        if upload_id:
+            # The file was already uploaded in chunks; attach the stored file by name.
+            upload = ChunkedUpload.objects.filter(pk=upload_id, teacher=self.teacher, status='complete').first()
+            if upload is None:
+                self.add_error('file', 'The uploaded file could not be found. Please upload it again.')
+            else:
+                cleaned_data['file'] = upload.file.name
         content_type = cleaned_data.get('content_type')
         text_content = cleaned_data.get('text_content')
         video_url = cleaned_data.get('video_url')
@@ -59,4 +74,11 @@ class CourseContentForm(forms.ModelForm):
         if content_type == 'file' and not file:
             self.add_error('file', 'A file is required for downloadable content.')
         
-        return cleaned_data
\ No newline at end of file
+        return cleaned_data
+class EnrollmentImportForm(forms.Form):
+    csv_file = forms.FileField(
+        label='CSV file',
+        help_text="One student per row with an 'email' column (optionally 'amount_paid').",
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,text/csv'}),
+    )
+
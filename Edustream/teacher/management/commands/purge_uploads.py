@@ -0,0 +1,25 @@
+# teacher/management/commands/purge_uploads.py
+import datetime
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from core.models import ChunkedUpload
+from teacher import uploads
+class Command(BaseCommand):
+    help = (
+        "Deletes expired chunked uploads: abandoned ones with their partial files, and completed ones "
+        "with their files unless a lesson uses the file."
+    )
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=None, help="Age after which an upload is purged.")
+    def handle(self, *args, **options):
+        hours = options['hours'] or getattr(settings, 'CHUNKED_UPLOAD_EXPIRY_HOURS', 24)
+        cutoff = timezone.now() - datetime.timedelta(hours=hours)
+        counts = {'uploading': 0, 'complete': 0, 'attached': 0}
+        # Fetched up front: SQLite gives no isolation between an open cursor and these deletes.
+        for upload in list(ChunkedUpload.objects.filter(updated_at__lt=cutoff)):
+            counts['attached' if uploads.discard(upload) else upload.status] += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Purged {counts['uploading']} abandoned and {counts['complete']} unused completed uploads; "
+            f"kept the files of {counts['attached']} attached to lessons."
+        ))
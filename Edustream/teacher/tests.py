@@ -1,5 +1,216 @@
 # teacher/tests.py
-
+import datetime
+import io
+import json
+from decimal import Decimal
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import TestCase
-
-# Create your tests here.
+from django.utils import timezone
+from core import analytics
+from core.pagination import encode_cursor
+from core.models import ChunkedUpload, Course, CourseContent, CourseDailyStats, Enrollment, OutboundEmail, TeacherDailyStats
+from core.testing import (
+    FAST_TEST_SETTINGS, QueryBudgetMixin, enroll, make_categories, make_courses, make_users,
+)
+from teacher import uploads
+@FAST_TEST_SETTINGS
+class TeacherViewBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = make_users('budget_teacher', 1, user_type='teacher')[0]
+        cls.categories = make_categories(4)
+        cls.courses = make_courses(cls.teacher, 8, cls.categories, contents_per_course=5)
+        cls.course = cls.courses[0]
+        cls.students = make_users('budget_student', 30)
+        enroll(cls.students[:10], [cls.course])
+    def setUp(self):
+        self.client.force_login(self.teacher)
+    def test_dashboard(self):
+        self.assertWithinBudget('/teacher/dashboard/', 3)
+        # Regression: the template reads course.category.name per row.
+        self.assertConstantQueries(
+            '/teacher/dashboard/', lambda: make_courses(self.teacher, 6, self.categories, prefix='Extra'),
+        )
+    def test_dashboard_ignores_forged_cursors(self):
+        first_page = self.client.get('/teacher/dashboard/').context['courses']
+        for values in [['notadate', 1], [{'a': 1}, 1], [None, 'x'], ['2026-01-01', 'x']]:
+            for key in ('after', 'before'):
+                response = self.client.get('/teacher/dashboard/', {key: encode_cursor(values)})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(list(response.context['courses']), list(first_page))
+    def test_course_forms(self):
+        self.assertWithinBudget('/teacher/courses/create/', 3)
+        self.assertWithinBudget(f'/teacher/courses/{self.course.pk}/update/', 4)
+        self.assertWithinBudget(f'/teacher/courses/{self.course.pk}/delete/', 3)
+    def test_course_content_manage(self):
+        url = f'/teacher/courses/{self.course.pk}/content/'
+        self.assertWithinBudget(url, 4)
+        self.assertConstantQueries(
+            url,
+            lambda: CourseContent.objects.bulk_create([
+                CourseContent(course=self.course, title=f'More {i}', content_type='text', text_content='x', order=10 + i)
+                for i in range(10)
+            ]),
+        )
+    def test_course_content_add(self):
+        url = f'/teacher/courses/{self.course.pk}/content/'
+        data = {'title': 'Added', 'content_type': 'video', 'video_url': 'https://videos.example.com/1', 'order': 6}
+        self.assertWithinBudget(url, 7, method='post', data=data, status=302)
+        self.assertEqual(self.course.contents.last().title, 'Added')
+        self.assertEqual(OutboundEmail.objects.count(), 10)
+    def test_course_content_edit_and_delete(self):
+        content = self.course.contents.first()
+        url = f'/teacher/courses/{self.course.pk}/content/{content.pk}/'
+        self.assertWithinBudget(url + 'edit/', 3)
+        data = {'title': 'Renamed', 'content_type': 'text', 'text_content': '*new*', 'order': content.order}
+        # One lesson is loaded, validated and saved however many the course has.
+        self.assertWithinBudget(url + 'edit/', 5, method='post', data=data, status=302)
+        content.refresh_from_db()
+        self.assertEqual((content.title, content.text_html), ('Renamed', '<p><em>new</em></p>'))
+        self.assertWithinBudget(url + 'delete/', 5, method='post', status=302)
+        self.assertFalse(CourseContent.objects.filter(pk=content.pk).exists())
+        other = make_users('other_teacher', 1, user_type='teacher')[0]
+        self.client.force_login(other)
+        lesson = self.course.contents.first()
+        self.assertEqual(self.client.get(f'/teacher/courses/{self.course.pk}/content/{lesson.pk}/edit/').status_code, 404)
+    def test_course_content_reorder(self):
+        url = f'/teacher/courses/{self.course.pk}/content/reorder/'
+        for extra in (0, 50):
+            # One UPDATE for the whole new order, however many lessons move.
+            CourseContent.objects.bulk_create([
+                CourseContent(course=self.course, title=f'More {i}', content_type='quiz', order=100 + i) for i in range(extra)
+            ])
+            ids = list(self.course.contents.values_list('pk', flat=True))[::-1]
+            self.assertWithinBudget(
+                url, 8, method='post', data=json.dumps({'order': ids}), content_type='application/json',
+            )
+            self.assertEqual(list(self.course.contents.values_list('pk', flat=True)), ids)
+        # Stale or partial lists are refused rather than half-applied.
+        response = self.client.post(url, json.dumps({'order': ids[1:]}), content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        response = self.client.post(url, 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+    def test_course_students_view(self):
+        url = f'/teacher/courses/{self.course.pk}/students/'
+        self.assertWithinBudget(url, 4)
+        self.assertConstantQueries(url, lambda: enroll(self.students[10:25], [self.course]))
+    def test_course_roster_export(self):
+        url = f'/teacher/courses/{self.course.pk}/students/export/'
+        self.assertWithinBudget(url, 4)
+        lines = b''.join(self.client.get(url).streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'username,email,first_name,last_name,enrollment_date,completed,amount_paid')
+        self.assertEqual(len(lines), 11)
+        # Students come from the same SELECT, never one query per row.
+        self.assertConstantQueries(url, lambda: enroll(self.students[10:30], [self.course]), data={'format': 'jsonl'})
+        response = self.client.get(url, {'format': 'jsonl'})
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 30)
+        self.assertEqual(self.client.get(url, {'format': 'xml'}).status_code, 400)
+    def test_course_enrollment_import(self):
+        url = f'/teacher/courses/{self.course.pk}/students/import/'
+        self.assertWithinBudget(url, 3)
+        rows = ['email'] + [student.email.upper() for student in self.students[5:20]] + ['nobody@example.com', 'not-an-email']
+        upload = SimpleUploadedFile('roster.csv', '\n'.join(rows).encode(), content_type='text/csv')
+        with self.assertNumQueries(11):
+            # Session, user and course; one batch of lookups and insert; then the counter reconcile.
+            response = self.client.post(url, {'csv_file': upload})
+            output = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(output[:2], ['Line 17: No account with email nobody@example.com.', "Line 18: Invalid email 'not-an-email'."])
+        self.assertEqual(output[-1], 'Done 17 rows: 10 enrolled, 5 already enrolled, 2 errors')
+        self.assertEqual(Course.objects.get(pk=self.course.pk).enrollment_count, 20)
+        bad = SimpleUploadedFile('roster.csv', b'name\nx', content_type='text/csv')
+        self.assertContains(self.client.post(url, {'csv_file': bad}), "must include an")
+        latin1 = SimpleUploadedFile('roster.csv', 'email\ncaf\xe9@example.com'.encode('latin-1'), content_type='text/csv')
+        self.assertContains(self.client.post(url, {'csv_file': latin1}), "not UTF-8 encoded")
+    def test_enrollment_import_stops_at_a_decode_error(self):
+        url = f'/teacher/courses/{self.course.pk}/students/import/'
+        # The blank lines push the bad byte past the first chunk the view decodes up front.
+        rows = ['email', self.students[20].email, self.students[21].email] + [''] * 10000 + ['caf\xe9@example.com']
+        upload = SimpleUploadedFile('roster.csv', '\n'.join(rows).encode('latin-1'), content_type='text/csv')
+        output = b''.join(self.client.post(url, {'csv_file': upload}).streaming_content).decode().splitlines()
+        self.assertEqual(output[-2], 'Line 3: The file is not UTF-8 encoded after this line; the rest was not imported.')
+        self.assertEqual(output[-1], 'Done 2 rows: 2 enrolled, 0 already enrolled, 1 errors')
+    def test_chunked_upload_endpoints(self):
+        response = self.assertWithinBudget(
+            '/teacher/uploads/', 4, method='post', data={'filename': 'empty.txt', 'size': 0}, status=201,
+        )
+        self.assertWithinBudget(f"/teacher/uploads/{response.json()['upload_id']}/", 3)
+    def test_analytics(self):
+        analytics.rebuild()
+        self.assertWithinBudget('/teacher/analytics/', 5, data={'days': 90})
+@FAST_TEST_SETTINGS
+class ChunkedUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = make_users('upload_teacher', 1, user_type='teacher')[0]
+        cls.course = make_courses(cls.teacher, 1)[0]
+    def upload(self, data, chunk_size=4):
+        upload = uploads.start_upload(self.teacher, 'notes.txt', len(data))
+        for offset in range(0, len(data), chunk_size):
+            chunk = data[offset:offset + chunk_size]
+            upload = uploads.append_chunk(upload, offset, io.BytesIO(chunk), len(chunk))
+        return upload
+    def test_chunks_assemble_into_the_stored_file(self):
+        upload = self.upload(b'0123456789')
+        self.assertEqual(upload.status, 'complete')
+        with upload.file.open('rb') as fh:
+            self.assertEqual(fh.read(), b'0123456789')
+        self.assertFalse(uploads.part_path(upload).exists())
+    def test_only_the_next_offset_is_accepted(self):
+        upload = uploads.start_upload(self.teacher, 'notes.txt', 8)
+        uploads.append_chunk(upload, 0, io.BytesIO(b'0123'), 4)
+        for offset in (0, 2, 6):
+            with self.assertRaises(uploads.UploadOffsetMismatch) as caught:
+                uploads.append_chunk(upload, offset, io.BytesIO(b'4567'), 4)
+            self.assertEqual(caught.exception.expected, 4)
+        self.client.force_login(self.teacher)
+        response = self.client.post(
+            f'/teacher/uploads/{upload.pk}/', b'4567', content_type='application/octet-stream', headers={'Upload-Offset': '0'},
+        )
+        self.assertEqual((response.status_code, response.json()['offset']), (409, 4))
+        with self.assertRaises(ValueError):
+            uploads.append_chunk(upload, 4, io.BytesIO(b'45678'), 5)
+    def test_purge_expires_old_uploads_but_keeps_lesson_files(self):
+        abandoned = uploads.start_upload(self.teacher, 'partial.txt', 8)
+        uploads.append_chunk(abandoned, 0, io.BytesIO(b'0123'), 4)
+        unused, attached, recent = self.upload(b'unused'), self.upload(b'attached'), self.upload(b'recent')
+        CourseContent.objects.create(course=self.course, title='Notes', content_type='file', file=attached.file.name)
+        ChunkedUpload.objects.exclude(pk=recent.pk).update(updated_at=timezone.now() - datetime.timedelta(days=2))
+        out = io.StringIO()
+        call_command('purge_uploads', stdout=out)
+        self.assertIn('Purged 1 abandoned and 1 unused completed uploads; kept the files of 1 attached', out.getvalue())
+        self.assertEqual(list(ChunkedUpload.objects.values_list('pk', flat=True)), [recent.pk])
+        self.assertFalse(uploads.part_path(abandoned).exists())
+        self.assertFalse(default_storage.exists(unused.file.name))
+        self.assertTrue(default_storage.exists(attached.file.name))
+        self.assertTrue(default_storage.exists(recent.file.name))
+@FAST_TEST_SETTINGS
+class AnalyticsRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = make_users('rollup_teacher', 1, user_type='teacher')[0]
+        cls.courses = make_courses(cls.teacher, 2)
+        cls.students = make_users('rollup_student', 4)
+    def backdate(self, days):
+        Enrollment.objects.filter(enrollment_date__gt=timezone.now() - datetime.timedelta(minutes=5)).update(
+            enrollment_date=timezone.now() - datetime.timedelta(days=days),
+        )
+    def test_refresh_only_folds_new_enrollments(self):
+        Enrollment.objects.create(student=self.students[0], course=self.courses[0])
+        Enrollment.objects.create(student=self.students[1], course=self.courses[1], amount_paid=Decimal('5'))
+        self.backdate(2)
+        self.assertEqual(analytics.refresh(), 2)
+        self.assertEqual(analytics.refresh(), 0)
+        Enrollment.objects.create(student=self.students[2], course=self.courses[0])
+        # Still inside the lag window, so left for the next run.
+        self.assertEqual(analytics.refresh(), 0)
+        self.backdate(2)
+        self.assertEqual(analytics.refresh(), 1)
+        day = timezone.localdate() - datetime.timedelta(days=2)
+        course_row = CourseDailyStats.objects.get(course=self.courses[0], date=day)
+        self.assertEqual((course_row.enrollments, course_row.revenue), (2, Decimal('39.98')))
+        teacher_row = TeacherDailyStats.objects.get(teacher=self.teacher, date=day)
+        self.assertEqual((teacher_row.enrollments, teacher_row.revenue), (3, Decimal('44.98')))
+        self.assertEqual(analytics.rebuild(), 3)
+        self.assertEqual(TeacherDailyStats.objects.get(teacher=self.teacher).enrollments, 3)
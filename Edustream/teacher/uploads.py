@@ -0,0 +1,79 @@
+# teacher/uploads.py
+"""
+Resumable chunked uploads for course files. Each chunk is streamed from the request straight
+into a .part file at its offset, so neither the chunk nor the assembled file is held in memory.
+Once the last byte arrives the file is moved into default storage under course_files/.
+"""
+import os
+from pathlib import Path
+from django.conf import settings
+from django.core.files import File
+from core.models import ChunkedUpload, CourseContent
+class UploadOffsetMismatch(Exception):
+    def __init__(self, expected):
+        super().__init__(f"Expected a chunk starting at byte {expected}.")
+        self.expected = expected
+_BLOCK_SIZE = 64 * 1024
+def temp_dir():
+    path = Path(getattr(settings, 'CHUNKED_UPLOAD_TEMP_DIR', Path(settings.MEDIA_ROOT) / 'chunked_uploads'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+def part_path(upload):
+    return temp_dir() / f"{upload.pk}.part"
+def start_upload(teacher, filename, total_size):
+    upload = ChunkedUpload.objects.create(teacher=teacher, filename=filename, total_size=total_size)
+    if total_size == 0:
+        path = part_path(upload)
+        path.touch()
+        _complete(upload, path)
+    return upload
+def append_chunk(upload, offset, stream, length):
+    """
+    Writes `length` bytes from `stream` at `offset`. Only the next expected offset is accepted,
+    which makes a retried chunk idempotent and lets clients resume from the reported offset.
+    """
+    if upload.status == 'complete':
+        raise ValueError("Upload is already complete.")
+    if offset != upload.offset:
+        raise UploadOffsetMismatch(upload.offset)
+    if offset + length > upload.total_size:
+        raise ValueError("Chunk extends past the declared file size.")
+    path = part_path(upload)
+    written = 0
+    with open(path, 'r+b' if path.exists() else 'wb') as fh:
+        # Drop bytes left behind by an interrupted earlier attempt at this chunk.
+        fh.seek(offset)
+        fh.truncate()
+        while written < length:
+            block = stream.read(min(_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            fh.write(block)
+            written += len(block)
+    if written != length:
+        raise ValueError("Chunk body was shorter than its Content-Length.")
+    # Advance only if no concurrent request already did, so the offset never skips bytes.
+    if not ChunkedUpload.objects.filter(pk=upload.pk, offset=offset).update(offset=offset + length):
+        upload.refresh_from_db()
+        raise UploadOffsetMismatch(upload.offset)
+    upload.offset = offset + length
+    if upload.offset == upload.total_size:
+        _complete(upload, path)
+    return upload
+def _complete(upload, path):
+    with open(path, 'rb') as fh:
+        upload.file.save(os.path.basename(upload.filename), File(fh), save=False)
+    upload.status = 'complete'
+    upload.save(update_fields=['file', 'status', 'updated_at'])
+    path.unlink(missing_ok=True)
+def discard(upload):
+    """
+    Deletes the upload and its files. An assembled file that a lesson uses (CourseContentForm
+    attaches it by name) is kept; returns True in that case.
+    """
+    part_path(upload).unlink(missing_ok=True)
+    attached = bool(upload.file) and CourseContent.objects.filter(file=upload.file.name).exists()
+    if upload.file and not attached:
+        upload.file.delete(save=False)
+    upload.delete()
+    return attached
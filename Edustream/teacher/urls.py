@@ -9,5 +9,13 @@ urlpatterns = [
     path('courses/<int:pk>/update/', views.course_update, name='course_update'),
     path('courses/<int:pk>/delete/', views.course_delete, name='course_delete'),
     path('courses/<int:course_pk>/content/', views.course_content_manage, name='course_content_manage'),
+    path('courses/<int:course_pk>/content/reorder/', views.course_content_reorder, name='course_content_reorder'),
+    path('courses/<int:course_pk>/content/<int:pk>/edit/', views.course_content_edit, name='course_content_edit'),
+    path('courses/<int:course_pk>/content/<int:pk>/delete/', views.course_content_delete, name='course_content_delete'),
     path('courses/<int:pk>/students/', views.course_students_view, name='course_students_view'),
+    path('courses/<int:pk>/students/import/', views.course_enrollment_import, name='course_enrollment_import'),
+    path('courses/<int:pk>/students/export/', views.course_roster_export, name='course_roster_export'),
+    path('analytics/', views.teacher_analytics, name='teacher_analytics'),
+    path('uploads/', views.upload_start, name='upload_start'),
+    path('uploads/<uuid:upload_id>/', views.upload_chunk, name='upload_chunk'),
 ]
\ No newline at end of file
@@ -2,16 +2,26 @@
 
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.forms import inlineformset_factory
 from django.contrib import messages
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
 from django.conf import settings
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.urls import reverse
+from django.db.models import Sum
+from django.utils import timezone
+from django.views.decorators.http import require_POST
+import datetime
+import io
+import itertools
+import json
+import os
 
-from core.models import Course, CourseContent, Enrollment, User
-from .forms import CourseForm, CourseContentForm
+from core import analytics, course_cache, db_writes, enrollment_import
+from core.models import ChunkedUpload, Course, CourseContent, CourseDailyStats, Enrollment, TeacherDailyStats, User
+from core.outbox import queue_emails
+from core.pagination import keyset_paginate
+from core.signals import touch_courses
+from .forms import CourseForm, CourseContentForm, EnrollmentImportForm
+from . import exports, uploads
 
 def is_teacher(user):
     return user.is_authenticated and user.user_type == 'teacher'
@@ -19,8 +29,9 @@ def is_teacher(user):
 @login_required
 @user_passes_test(is_teacher, login_url='login')
 def teacher_dashboard(request):
-    courses = Course.objects.filter(teacher=request.user).order_by('-created_at')
-    return render(request, 'teacher/dashboard.html', {'courses': courses})
+    courses = Course.objects.filter(teacher=request.user).select_related('category')
+    page = keyset_paginate(request, courses, '-created_at', settings.TEACHER_DASHBOARD_PAGE_SIZE)
+    return render(request, 'teacher/dashboard.html', {'courses': page})
 
 @login_required
 @user_passes_test(is_teacher, login_url='login')
@@ -33,36 +44,24 @@ def course_create(request):
             course.teacher = request.user
             course.save()
             messages.success(request, f'Course "{course.title}" created successfully!')
+            author_name = request.user.get_full_name() or request.user.username
             students_to_notify = User.objects.filter(
                 user_type='student',
                 enrolled_courses__course__teacher=request.user
-            ).distinct() 
-            for student in students_to_notify:
-                subject = f'New Course Published by {request.user.get_full_name() or request.user.username}!'
-                context = {
-                    'student_name': student.username,
-                    'author_name': request.user.get_full_name() or request.user.username,
-                    'course_title': course.title,
-                    'course_description': course.description,
-                    'course_pk': course.pk,
-                    'protocol': request.scheme,
-                    'domain': request.get_host(),
-                }
-                html_message = render_to_string('emails/new_course_by_author_notification.html', context)
-                plain_message = strip_tags(html_message)
-                from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@edustream.com')
-                try:
-                    send_mail(
-                        subject,
-                        plain_message,
-                        from_email,
-                        [student.email],
-                        html_message=html_message,
-                        fail_silently=False,
-                    )
-                    print(f"Sent new course notification to {student.email} for {course.title}")
-                except Exception as e:
-                    print(f"Failed to send new course email to {student.email}: {e}")
+            ).distinct().values_list('username', 'email')
+            base_context = {
+                'author_name': author_name,
+                'course_title': course.title,
+                'course_description': course.description,
+                'course_pk': course.pk,
+                'protocol': request.scheme,
+                'domain': request.get_host(),
+            }
+            queue_emails(
+                f'New Course Published by {author_name}!',
+                'emails/new_course_by_author_notification.html',
+                ((email, {**base_context, 'student_name': username}) for username, email in students_to_notify),
+            )
 
             return redirect('teacher_dashboard')
         else:
@@ -97,68 +96,224 @@ def course_delete(request, pk):
         messages.success(request, f'Course "{course.title}" deleted successfully!')
         return redirect('teacher_dashboard')
     return render(request, 'teacher/course_confirm_delete.html', {'course': course})
+def _notify_new_content(request, course):
+    enrolled_students = Enrollment.objects.filter(course=course).values_list('student__username', 'student__email')
+    base_context = {
+        'course_title': course.title,
+        # Only the course's own teacher gets here, so request.user saves a query.
+        'teacher_name': request.user.get_full_name() or request.user.username,
+        'course_pk': course.pk,
+        'protocol': request.scheme,
+        'domain': request.get_host(),
+    }
+    queue_emails(
+        f'New Content Added to Your Course: {course.title}',
+        'emails/new_topic_notification.html',
+        ((email, {**base_context, 'student_name': username}) for username, email in enrolled_students),
+    )
 @login_required
 @user_passes_test(is_teacher, login_url='login')
 def course_content_manage(request, course_pk):
+    """Lists the course outline for reordering and adds one lesson per POST; lessons are edited one at a time."""
     course = get_object_or_404(Course, pk=course_pk, teacher=request.user)
-    CourseContentFormSet = inlineformset_factory(
-        Course,
-        CourseContent,
-        form=CourseContentForm,
-        extra=1,
-        can_delete=True,
-        fields=('title', 'content_type', 'text_content', 'video_url', 'file', 'order')
-    )
     if request.method == 'POST':
-        formset = CourseContentFormSet(request.POST, request.FILES, instance=course)
-        if formset.is_valid():
-            new_content_added_flag = False
-            for form in formset.forms:
-                if form.has_changed() and not form.instance.pk and not form.cleaned_data.get('DELETE'):
-                    new_content_added_flag = True
-                    break
-            formset.save()
-            messages.success(request, 'Course content updated successfully!')
-            if new_content_added_flag:
-                enrolled_students = Enrollment.objects.filter(course=course).select_related('student')
-                for enrollment in enrolled_students:
-                    student_email = enrollment.student.email
-                    context = {
-                        'student_name': enrollment.student.username,
-                        'course_title': course.title,
-                        'teacher_name': course.teacher.get_full_name() or course.teacher.username,
-                        'course_pk': course.pk,
-                        'protocol': request.scheme,
-                        'domain': request.get_host(),
-                    }
-                    html_message = render_to_string('emails/new_topic_notification.html', context)
-                    plain_message = strip_tags(html_message)
-                    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@edustream.com')
-                    try:
-                        send_mail(
-                            f'New Content Added to Your Course: {course.title}',
-                            plain_message,
-                            from_email,
-                            [student_email],
-                            html_message=html_message,
-                            fail_silently=False,
-                        )
-                        print(f"Sent new topic email to {student_email} for course {course.title}")
-                    except Exception as e:
-                        print(f"Failed to send new topic email to {student_email}: {e}")
-
+        form = CourseContentForm(request.POST, request.FILES, teacher=request.user)
+        if form.is_valid():
+            content = form.save(commit=False)
+            content.course = course
+            content.save()
+            messages.success(request, f'Lesson "{content.title}" added.')
+            _notify_new_content(request, course)
             return redirect('course_content_manage', course_pk=course.pk)
-        else:
-            messages.error(request, 'Please correct the errors in the content forms.')
+        messages.error(request, 'Please correct the errors in the new lesson.')
+    # The outline needs no forms: one narrow query, however long the course is.
+    contents = list(course.contents.only('id', 'course_id', 'title', 'content_type', 'order'))
+    if request.method != 'POST':
+        form = CourseContentForm(teacher=request.user, initial={'order': contents[-1].order + 1 if contents else 1})
+    return render(request, 'teacher/course_content_manage.html', {'course': course, 'contents': contents, 'form': form})
+def _owned_content(request, course_pk, pk):
+    return get_object_or_404(
+        CourseContent.objects.select_related('course'), pk=pk, course_id=course_pk, course__teacher=request.user,
+    )
+@login_required
+@user_passes_test(is_teacher, login_url='login')
+def course_content_edit(request, course_pk, pk):
+    """Edits a single lesson, so saving one change never loads or validates the rest of the course."""
+    content = _owned_content(request, course_pk, pk)
+    if request.method == 'POST':
+        form = CourseContentForm(request.POST, request.FILES, instance=content, teacher=request.user)
+        if form.is_valid():
+            form.save()
+            messages.success(request, f'Lesson "{content.title}" saved.')
+            return redirect('course_content_manage', course_pk=course_pk)
+        messages.error(request, 'Please correct the errors below.')
     else:
-        formset = CourseContentFormSet(instance=course)
-
-    return render(request, 'teacher/course_content_manage.html', {'course': course, 'formset': formset})
+        form = CourseContentForm(instance=content, teacher=request.user)
+    return render(request, 'teacher/course_content_edit.html', {'course': content.course, 'content': content, 'form': form})
+@login_required
+@user_passes_test(is_teacher, login_url='login')
+@require_POST
+def course_content_delete(request, course_pk, pk):
+    content = _owned_content(request, course_pk, pk)
+    content.delete()
+    messages.success(request, f'Lesson "{content.title}" deleted.')
+    return redirect('course_content_manage', course_pk=course_pk)
+@login_required
+@user_passes_test(is_teacher, login_url='login')
+@require_POST
+def course_content_reorder(request, course_pk):
+    """
+    Applies a drag-and-drop ordering sent as {"order": [content ids, first to last]}. The list
+    must name every lesson of the course exactly once; changed positions are written with one
+    bulk_update().
+    """
+    course = get_object_or_404(Course.objects.only('id'), pk=course_pk, teacher=request.user)
+    try:
+        ids = [int(pk) for pk in json.loads(request.body)['order']]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected a JSON body like {"order": [content ids]}.'}, status=400)
+    contents = {content.pk: content for content in CourseContent.objects.filter(course=course).only('id', 'order')}
+    if len(ids) != len(set(ids)) or set(ids) != set(contents):
+        # Usually a lesson was added or deleted in another tab since the page was loaded.
+        return JsonResponse({'error': 'The lesson list has changed. Reload the page and try again.'}, status=409)
+    changed = []
+    for position, pk in enumerate(ids, 1):
+        if contents[pk].order != position:
+            contents[pk].order = position
+            changed.append(contents[pk])
+    if changed:
+        with db_writes.serialized():
+            CourseContent.objects.bulk_update(changed, ['order'])
+            # bulk_update() sends no signals, so do the CourseContent handlers' work here.
+            touch_courses([course.pk])
+            course_cache.bump([course.pk])
+    return JsonResponse({'updated': len(changed)})
 
 @login_required
 @user_passes_test(is_teacher, login_url='login')
 def course_students_view(request, pk):
     """Displays a list of students who have purchased a specific course."""
     course = get_object_or_404(Course, pk=pk, teacher=request.user)
-    enrolled_students = Enrollment.objects.filter(course=course).select_related('student').order_by('student__username')
-    return render(request, 'teacher/course_students_view.html', {'course': course, 'enrolled_students': enrolled_students})
\ No newline at end of file
+    enrolled_students = Enrollment.objects.filter(course=course).select_related('student')
+    page = keyset_paginate(request, enrolled_students, 'student__username', settings.ROSTER_PAGE_SIZE)
+    return render(request, 'teacher/course_students_view.html', {'course': course, 'enrolled_students': page})
+
+@login_required
+@user_passes_test(is_teacher, login_url='login')
+def course_roster_export(request, pk):
+    """Streams the full roster of a course as CSV (default) or JSONL (?format=jsonl)."""
+    course = get_object_or_404(Course, pk=pk, teacher=request.user)
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in exports.CONTENT_TYPES:
+        return HttpResponseBadRequest("Unsupported export format.")
+    return exports.stream_roster(course, export_format)
+
+@login_required
+@user_passes_test(is_teacher, login_url='login')
+def course_enrollment_import(request, pk):
+    """Enrolls students listed in an uploaded CSV, streaming progress and per-row errors as plain text."""
+    course = get_object_or_404(Course, pk=pk, teacher=request.user)
+    form = EnrollmentImportForm(request.POST or None, request.FILES or None)
+    if request.method == 'POST' and form.is_valid():
+        text = io.TextIOWrapper(form.cleaned_data['csv_file'].file, encoding='utf-8-sig', newline='')
+        try:
+            rows = enrollment_import.read_csv(text)
+            first = next(rows, None)
+        except UnicodeDecodeError:
+            # A subclass of ValueError, so it must be caught first.
+            form.add_error('csv_file', "The file is not UTF-8 encoded CSV.")
+        except ValueError as e:
+            form.add_error('csv_file', str(e))
+        else:
+            rows = itertools.chain([first], rows) if first else iter(())
+            events = enrollment_import.import_rows(rows, course=course)
+            return StreamingHttpResponse(
+                (enrollment_import.format_event(event) + '\n' for event in events), content_type='text/plain; charset=utf-8',
+            )
+    return render(request, 'teacher/course_enrollment_import.html', {'course': course, 'form': form})
+
+ANALYTICS_WINDOWS = (7, 30, 90, 365)
+@login_required
+@user_passes_test(is_teacher, login_url='login')
+def teacher_analytics(request):
+    """Enrollment and revenue trends, read only from the daily rollup tables."""
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        days = 30
+    if days not in ANALYTICS_WINDOWS:
+        days = 30
+    today = timezone.localdate()
+    since = today - datetime.timedelta(days=days - 1)
+    rows = {
+        row.date: row for row in TeacherDailyStats.objects.filter(teacher=request.user, date__gte=since)
+    }
+    daily = []
+    for offset in range(days):
+        date = since + datetime.timedelta(days=offset)
+        row = rows.get(date)
+        daily.append({'date': date, 'enrollments': row.enrollments if row else 0, 'revenue': row.revenue if row else 0})
+    per_course = (
+        CourseDailyStats.objects.filter(teacher=request.user, date__gte=since)
+        .values('course_id', 'course__title')
+        .annotate(enrollments=Sum('enrollments'), revenue=Sum('revenue'))
+        .order_by('-revenue', '-enrollments')
+    )
+    context = {
+        'days': days,
+        'windows': ANALYTICS_WINDOWS,
+        'daily': daily,
+        'peak_enrollments': max([day['enrollments'] for day in daily] + [1]),
+        'total_enrollments': sum(day['enrollments'] for day in daily),
+        'total_revenue': sum(day['revenue'] for day in daily),
+        'per_course': per_course,
+        'last_refreshed': analytics.last_refreshed(),
+    }
+    return render(request, 'teacher/analytics.html', context)
+
+def _upload_state(upload):
+    return {
+        'upload_id': str(upload.pk),
+        'offset': upload.offset,
+        'total_size': upload.total_size,
+        'complete': upload.status == 'complete',
+        'chunk_size': settings.CHUNKED_UPLOAD_CHUNK_SIZE,
+    }
+
+@login_required
+@user_passes_test(is_teacher, login_url='login')
+@require_POST
+def upload_start(request):
+    """Opens a resumable upload session; the file body is then sent to upload_chunk."""
+    filename = os.path.basename(request.POST.get('filename', '').strip())
+    try:
+        total_size = int(request.POST.get('size', ''))
+    except ValueError:
+        total_size = -1
+    if not filename or total_size < 0:
+        return JsonResponse({'error': 'A filename and a non-negative size are required.'}, status=400)
+    if total_size > settings.CHUNKED_UPLOAD_MAX_SIZE:
+        return JsonResponse({'error': 'File is too large.'}, status=413)
+    upload = uploads.start_upload(request.user, filename, total_size)
+    return JsonResponse(_upload_state(upload), status=201)
+
+@login_required
+@user_passes_test(is_teacher, login_url='login')
+def upload_chunk(request, upload_id):
+    """GET reports how many bytes were received; POST appends the chunk at the Upload-Offset header."""
+    upload = get_object_or_404(ChunkedUpload, pk=upload_id, teacher=request.user)
+    if request.method == 'POST':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return JsonResponse({'error': 'Upload-Offset and Content-Length headers are required.'}, status=400)
+        if length > settings.CHUNKED_UPLOAD_CHUNK_SIZE:
+            return JsonResponse({'error': 'Chunk is too large.'}, status=413)
+        try:
+            uploads.append_chunk(upload, offset, request, length)
+        except uploads.UploadOffsetMismatch as e:
+            return JsonResponse({'error': str(e), 'offset': e.expected}, status=409)
+        except ValueError as e:
+            return JsonResponse({'error': str(e), 'offset': upload.offset}, status=400)
+    return JsonResponse(_upload_state(upload))
\ No newline at end of file